@@ -0,0 +1,138 @@
+"""
+Persistent retry queue for Telegram actions
+Bans/unbans that hit a FloodWaitError are parked here and replayed as soon as Telegram allows
+"""
+
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Restoring paying users goes ahead of removing unauthorized ones
+ACTION_PRIORITIES = {'unban': 0, 'ban': 1}
+
+
+class PendingActionQueue:
+    """Priority queue of (action, user, channel) rows ordered by priority, then retry_after"""
+    
+    def __init__(self, bot_name: str, max_attempts: int = 5):
+        self.bot_name = bot_name
+        self.max_attempts = max_attempts
+    
+    def enqueue(self, action_type: str, user_id: int, channel_db_id: int, reason: str,
+                wait_seconds: float, error: str = None) -> bool:
+        """Park an action until the server-given wait has passed; False if it was given up on
+        
+        A pending action for the same user and channel is replaced, so a later
+        unban supersedes a queued ban and vice versa.
+        """
+        try:
+            from app import app, db
+            from models import PendingTelegramAction
+            
+            with app.app_context():
+                row = PendingTelegramAction.query.filter_by(
+                    bot_name=self.bot_name,
+                    user_id=user_id,
+                    channel_id=channel_db_id
+                ).first()
+                if row and row.action_type != action_type:
+                    db.session.delete(row)
+                    db.session.flush()
+                    row = None
+                if not row:
+                    row = PendingTelegramAction(
+                        bot_name=self.bot_name,
+                        action_type=action_type,
+                        user_id=user_id,
+                        channel_id=channel_db_id,
+                        attempts=0
+                    )
+                    db.session.add(row)
+                
+                row.attempts = (row.attempts or 0) + 1
+                if row.attempts > self.max_attempts:
+                    db.session.delete(row)
+                    db.session.commit()
+                    logger.warning(f"Giving up on {action_type} of user {user_id} in channel {channel_db_id} after {self.max_attempts} attempts")
+                    return False
+                
+                row.reason = reason
+                row.priority = ACTION_PRIORITIES.get(action_type, 1)
+                row.retry_after = datetime.utcnow() + timedelta(seconds=wait_seconds)
+                row.last_error = error
+                db.session.commit()
+                return True
+            
+        except Exception as e:
+            logger.error(f"Failed to queue {action_type} of user {user_id} in channel {channel_db_id}: {e}")
+            return False
+    
+    def due(self, limit: int = 50) -> List[Dict]:
+        """Actions whose retry-after time has passed, highest priority first"""
+        try:
+            from app import app
+            from models import PendingTelegramAction
+            
+            with app.app_context():
+                rows = PendingTelegramAction.query.filter(
+                    PendingTelegramAction.bot_name == self.bot_name,
+                    PendingTelegramAction.retry_after <= datetime.utcnow()
+                ).order_by(
+                    PendingTelegramAction.priority,
+                    PendingTelegramAction.retry_after
+                ).limit(limit).all()
+                
+                return [{
+                    'id': row.id,
+                    'action_type': row.action_type,
+                    'user_id': row.user_id,
+                    'channel_db_id': row.channel_id,
+                    'reason': row.reason,
+                    'attempts': row.attempts
+                } for row in rows]
+            
+        except Exception as e:
+            logger.error(f"Failed to load pending actions: {e}")
+            return []
+    
+    def next_retry_at(self) -> Optional[datetime]:
+        """Earliest retry-after time still pending"""
+        try:
+            from app import app, db
+            from models import PendingTelegramAction
+            
+            with app.app_context():
+                return db.session.query(db.func.min(PendingTelegramAction.retry_after)).filter(
+                    PendingTelegramAction.bot_name == self.bot_name
+                ).scalar()
+            
+        except Exception as e:
+            logger.error(f"Failed to read pending action schedule: {e}")
+            return None
+    
+    def complete(self, action_id: int):
+        """Drop an action that ran (or no longer applies)"""
+        try:
+            from app import app, db
+            from models import PendingTelegramAction
+            
+            with app.app_context():
+                PendingTelegramAction.query.filter_by(id=action_id).delete()
+                db.session.commit()
+            
+        except Exception as e:
+            logger.error(f"Failed to complete pending action {action_id}: {e}")
+    
+    def count(self) -> int:
+        try:
+            from app import app
+            from models import PendingTelegramAction
+            
+            with app.app_context():
+                return PendingTelegramAction.query.filter_by(bot_name=self.bot_name).count()
+            
+        except Exception as e:
+            logger.error(f"Failed to count pending actions: {e}")
+            return 0
@@ -0,0 +1,144 @@
+"""
+Handlers for admin operations that run as background jobs
+Each handler receives a JobContext plus the job's params and returns a JSON-serializable result
+"""
+
+import logging
+from datetime import datetime
+from typing import Dict
+
+from background_jobs import enqueue_job, job_handler
+
+logger = logging.getLogger(__name__)
+
+
+def build_backup(progress=None) -> Dict:
+    """Export users (without sensitive data), plans and channels"""
+    from models import User, Plan, Channel
+
+    backup_data = {
+        'timestamp': datetime.utcnow().isoformat(),
+        'users': [],
+        'plans': [],
+        'channels': [],
+        'subscriptions': [],
+        'promo_codes': [],
+        'transactions': []
+    }
+
+    # Export users (without sensitive data)
+    for user in User.query.yield_per(1000):
+        backup_data['users'].append({
+            'id': user.id,
+            'telegram_username': user.telegram_username,
+            'created_at': user.created_at.isoformat(),
+            'is_active': user.is_active,
+            'is_banned': user.is_banned
+        })
+    if progress:
+        progress(1, 3, f"{len(backup_data['users'])} users exported")
+
+    # Export plans
+    for plan in Plan.query.all():
+        backup_data['plans'].append({
+            'id': plan.id,
+            'name': plan.name,
+            'description': plan.description,
+            'plan_type': plan.plan_type,
+            'price': float(plan.price),
+            'duration_days': plan.duration_days,
+            'is_active': plan.is_active,
+            'created_at': plan.created_at.isoformat()
+        })
+    if progress:
+        progress(2, 3, f"{len(backup_data['plans'])} plans exported")
+
+    # Export channels
+    for channel in Channel.query.all():
+        backup_data['channels'].append({
+            'id': channel.id,
+            'name': channel.name,
+            'description': channel.description,
+            'telegram_link': channel.telegram_link,
+            'solo_price': float(channel.solo_price) if channel.solo_price else None,
+            'solo_duration_days': channel.solo_duration_days,
+            'is_active': channel.is_active,
+            'created_at': channel.created_at.isoformat()
+        })
+    if progress:
+        progress(3, 3, f"{len(backup_data['channels'])} channels exported")
+
+    return backup_data
+
+
+@job_handler('backup')
+def run_backup(context):
+    return build_backup(context.progress)
+
+
+def require_enforcement_bot():
+    import bot_gateway
+
+    if not bot_gateway.is_available():
+        raise RuntimeError('Enforcement bot not available')
+    return bot_gateway.get_bot()
+
+
+@job_handler('channel_access_check')
+def run_channel_access_check(context):
+    """Re-check every configured channel on the bot loop and refresh the access cache"""
+    import bot_gateway
+    from models import Channel
+
+    bot = require_enforcement_bot()
+    channel_ids = list(dict.fromkeys(
+        channel_id for (channel_id,) in Channel.query.with_entities(Channel.telegram_channel_id).filter(
+            Channel.telegram_channel_id.isnot(None)
+        ).all()
+    ))
+    context.progress(0, len(channel_ids))
+
+    results = context.wait(bot_gateway.submit(bot.check_channels_access, channel_ids, context.progress))
+    return {
+        'total_channels': len(results),
+        'accessible': sum(1 for result in results.values() if result.get('has_access')),
+        'results': results
+    }
+
+
+@job_handler('manual_enforcement')
+def run_manual_enforcement(context, action_type: str, user_id: int, reason: str):
+    """Ban/unban one Telegram user in every managed channel"""
+    import bot_gateway
+
+    bot = require_enforcement_bot()
+    result = context.wait(bot_gateway.submit(bot.manual_action, action_type, user_id, reason, context.progress))
+    if result.get('error'):
+        raise RuntimeError(result['error'])
+    return result
+
+
+@job_handler('broadcast')
+def run_broadcast(context, message: str):
+    """Per-recipient outcomes are stored in BroadcastDelivery under this job's id"""
+    from broadcast import deliver_broadcast
+
+    return deliver_broadcast(message, job_id=context.job_id, progress=context.progress)
+
+
+def submit_manual_job(action_type: str, user_id: int, reason: str = "Admin action", created_by: str = None) -> Dict:
+    """Queue a manual ban/unban sweep; returns {'job_id': ...} or {'error': ...}"""
+    import bot_gateway
+
+    if not bot_gateway.is_available():
+        return {'error': 'Enforcement bot not available'}
+    try:
+        job_id = enqueue_job('manual_enforcement', {
+            'action_type': action_type,
+            'user_id': user_id,
+            'reason': reason
+        }, created_by)
+        return {'job_id': job_id}
+    except Exception as e:
+        logger.error(f"Failed to queue manual {action_type} job: {e}")
+        return {'error': str(e)}
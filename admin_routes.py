@@ -453,6 +453,9 @@ def update_settings():
         payment_settings.paypal_client_id = request.form.get('paypal_client_id', '').strip()
         payment_settings.paypal_client_secret = request.form.get('paypal_client_secret', '').strip()
         payment_settings.paypal_sandbox = request.form.get('paypal_sandbox') == 'on'
+        
+        from paypal_tokens import token_cache
+        token_cache.clear()
     
     elif setting_type == 'nowpayments':
         payment_settings = PaymentSettings.query.first()
@@ -480,6 +483,9 @@ def update_settings():
             payment_settings.paypal_client_secret = paypal_client_secret
         if request.form.get('paypal_sandbox') is not None:
             payment_settings.paypal_sandbox = request.form.get('paypal_sandbox') == 'on'
+        if paypal_client_id or paypal_client_secret:
+            from paypal_tokens import token_cache
+            token_cache.clear()
         if nowpayments_api_key:
             payment_settings.nowpayments_api_key = nowpayments_api_key
     
@@ -708,72 +714,59 @@ def admin_analytics():
 @app.route('/admin/backup')
 @admin_required
 def admin_backup():
-    """Database backup functionality"""
-    import json
-    from datetime import datetime
-    
+    """Database backup functionality - built by a background job"""
     try:
-        # Create backup data
-        backup_data = {
-            'timestamp': datetime.utcnow().isoformat(),
-            'users': [],
-            'plans': [],
-            'channels': [],
-            'subscriptions': [],
-            'promo_codes': [],
-            'transactions': []
-        }
-        
-        # Export users (without sensitive data)
-        for user in User.query.all():
-            backup_data['users'].append({
-                'id': user.id,
-                'telegram_username': user.telegram_username,
-                'created_at': user.created_at.isoformat(),
-                'is_active': user.is_active,
-                'is_banned': user.is_banned
-            })
-        
-        # Export plans
-        for plan in Plan.query.all():
-            backup_data['plans'].append({
-                'id': plan.id,
-                'name': plan.name,
-                'description': plan.description,
-                'plan_type': plan.plan_type,
-                'price': float(plan.price),
-                'duration_days': plan.duration_days,
-                'is_active': plan.is_active,
-                'created_at': plan.created_at.isoformat()
-            })
-        
-        # Export channels
-        for channel in Channel.query.all():
-            backup_data['channels'].append({
-                'id': channel.id,
-                'name': channel.name,
-                'description': channel.description,
-                'telegram_link': channel.telegram_link,
-                'solo_price': float(channel.solo_price) if channel.solo_price else None,
-                'solo_duration_days': channel.solo_duration_days,
-                'is_active': channel.is_active,
-                'created_at': channel.created_at.isoformat()
-            })
-        
-        filename = f"telesignals_backup_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.json"
-        
-        response = app.response_class(
-            response=json.dumps(backup_data, indent=2),
-            status=200,
-            mimetype='application/json'
-        )
-        response.headers['Content-Disposition'] = f'attachment; filename={filename}'
-        
-        return response
+        from background_jobs import enqueue_job
+        job_id = enqueue_job('backup', created_by=session['admin_username'])
+        flash(f'Backup started (job {job_id}). Download it from {url_for("admin_job_download", job_id=job_id)} once it completes.', 'success')
         
     except Exception as e:
         flash(f'Backup failed: {str(e)}', 'error')
+    
+    return redirect(url_for('admin_dashboard'))
+
+@app.route('/admin/jobs')
+@admin_required
+def admin_job_list():
+    """Most recent background jobs"""
+    jobs = BackgroundJob.query.order_by(BackgroundJob.created_at.desc()).limit(50).all()
+    return jsonify({'jobs': [job.to_dict(include_result=False) for job in jobs]})
+
+@app.route('/admin/jobs/<int:job_id>')
+@admin_required
+def admin_job_status(job_id):
+    """Progress and result of a background job"""
+    from background_jobs import get_job
+    
+    job = get_job(job_id, include_result=request.args.get('result', '1') != '0')
+    if not job:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    return jsonify({'success': True, 'job': job})
+
+@app.route('/admin/http-metrics')
+@admin_required
+def admin_http_metrics():
+    """Outbound HTTP request counts and latency per upstream"""
+    from http_client import get_metrics
+    return jsonify({'upstreams': get_metrics()})
+
+@app.route('/admin/jobs/<int:job_id>/download')
+@admin_required
+def admin_job_download(job_id):
+    """Download a completed job's result as a JSON file (e.g. a backup)"""
+    job = BackgroundJob.query.get_or_404(job_id)
+    if job.status != 'completed':
+        flash(f'Job {job_id} is {job.status}', 'warning')
         return redirect(url_for('admin_dashboard'))
+    
+    filename = f"telesignals_{job.job_type}_{job.finished_at.strftime('%Y%m%d_%H%M%S')}.json"
+    response = app.response_class(
+        response=json.dumps(json.loads(job.result), indent=2),
+        status=200,
+        mimetype='application/json'
+    )
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    return response
 
 @app.route('/admin/manual-subscription', methods=['GET', 'POST'])
 @admin_required
@@ -825,6 +818,10 @@ def admin_manual_subscription():
             db.session.add(subscription)
             db.session.commit()
             
+            # Let the running enforcement bots see the grant without a full reload
+            from entitlement_bus import publish, SubscriptionActivated
+            publish(SubscriptionActivated(subscription.id, user.id, user.telegram_chat_id, subscription.end_date, subscription.updated_at))
+            
             logging.info(f"Admin {session['admin_username']} manually assigned subscription: User {user.telegram_username} -> Plan {plan.name}")
             flash(f'Successfully assigned {plan.name} to {user.telegram_username} for {duration_days} days', 'success')
             
@@ -877,24 +874,16 @@ def admin_user_ban_control():
                 user.is_banned = True
                 db.session.commit()
                 
-                # Try to execute Telegram bans
-                try:
-                    from enforcement_bot import admin_ban_user
-                    loop = asyncio.new_event_loop()
-                    asyncio.set_event_loop(loop)
-                    result = loop.run_until_complete(admin_ban_user(user_id, reason))
-                    loop.close()
-                    
-                    if 'error' in result:
-                        flash(f'Database updated but Telegram ban failed: {result["error"]}', 'warning')
-                    else:
-                        successful = result.get('successful_bans', 0)
-                        total = result.get('total_channels', 0)
-                        flash(f'Banned user from {successful}/{total} channels', 'success')
-                        
-                except Exception as e:
-                    logging.error(f"Telegram ban failed: {e}")
-                    flash(f'User banned in database. Telegram ban failed: {str(e)}', 'warning')
+                from entitlement_bus import publish, UserBanChanged
+                publish(UserBanChanged(user.id, user.telegram_chat_id, True, reason))
+                
+                # Execute Telegram bans as a background job
+                from admin_jobs import submit_manual_job
+                job = submit_manual_job('ban', user_id, reason, session['admin_username'])
+                if 'error' in job:
+                    flash(f'User banned in database. Telegram ban failed: {job["error"]}', 'warning')
+                else:
+                    flash(f'User banned in database. Telegram ban started (job {job["job_id"]})', 'success')
                 
                 # Log action
                 log_entry = BotLog(
@@ -912,24 +901,16 @@ def admin_user_ban_control():
                 user.is_banned = False
                 db.session.commit()
                 
-                # Try to execute Telegram unbans
-                try:
-                    from enforcement_bot import admin_unban_user
-                    loop = asyncio.new_event_loop()
-                    asyncio.set_event_loop(loop)
-                    result = loop.run_until_complete(admin_unban_user(user_id, reason))
-                    loop.close()
-                    
-                    if 'error' in result:
-                        flash(f'Database updated but Telegram unban failed: {result["error"]}', 'warning')
-                    else:
-                        successful = result.get('successful_unbans', 0)
-                        total = result.get('total_channels', 0)
-                        flash(f'Unbanned user from {successful}/{total} channels', 'success')
-                        
-                except Exception as e:
-                    logging.error(f"Telegram unban failed: {e}")
-                    flash(f'User unbanned in database. Telegram unban failed: {str(e)}', 'warning')
+                from entitlement_bus import publish, UserBanChanged
+                publish(UserBanChanged(user.id, user.telegram_chat_id, False, reason))
+                
+                # Execute Telegram unbans as a background job
+                from admin_jobs import submit_manual_job
+                job = submit_manual_job('unban', user_id, reason, session['admin_username'])
+                if 'error' in job:
+                    flash(f'User unbanned in database. Telegram unban failed: {job["error"]}', 'warning')
+                else:
+                    flash(f'User unbanned in database. Telegram unban started (job {job["job_id"]})', 'success')
                 
                 # Log action
                 log_entry = BotLog(
@@ -975,14 +956,10 @@ def admin_bot_logs():
 @admin_required
 def admin_enforcement_status():
     """Check enforcement bot status"""
-    import asyncio
-    
     try:
-        from enforcement_bot import get_enforcement_bot
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        bot = loop.run_until_complete(get_enforcement_bot())
-        loop.close()
+        # Only reads attributes, so no trip through the bot loop is needed
+        import bot_gateway
+        bot = bot_gateway.get_bot()
         
         if bot:
             status = {
@@ -1207,6 +1184,35 @@ def admin_channel_access():
         flash(f'Error checking channel access: {str(e)}', 'error')
         return redirect(url_for('admin_channels'))
 
+@app.route('/admin/channel-access/refresh', methods=['POST'])
+@admin_required
+def admin_channel_access_refresh():
+    """Re-check every channel's access in a background job"""
+    try:
+        from background_jobs import enqueue_job
+        job_id = enqueue_job('channel_access_check', created_by=session['admin_username'])
+        return jsonify({'success': True, 'job_id': job_id})
+        
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+@app.route('/admin/broadcast', methods=['POST'])
+@admin_required
+def admin_broadcast():
+    """Send a message to every active user in a background job"""
+    try:
+        data = request.get_json(silent=True) or request.form
+        message = (data.get('message') or '').strip()
+        if not message:
+            return jsonify({'success': False, 'error': 'Message is required'})
+        
+        from background_jobs import enqueue_job
+        job_id = enqueue_job('broadcast', {'message': message}, session['admin_username'])
+        return jsonify({'success': True, 'job_id': job_id})
+        
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
 @app.route('/admin/check-channel-access/<int:channel_id>')
 @admin_required
 def check_single_channel_access(channel_id):
@@ -1260,26 +1266,13 @@ def check_single_channel_access_post(channel_id):
 def debug_channels():
     """Debug accessible channels"""
     try:
-        from enforcement_bot import get_enforcement_bot
-        import asyncio
-        import concurrent.futures
+        import bot_gateway
         
-        def run_debug():
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            try:
-                bot = asyncio.run_coroutine_threadsafe(get_enforcement_bot(), loop).result(timeout=10)
-                if bot and bot.client:
-                    channels = asyncio.run_coroutine_threadsafe(bot.list_accessible_channels(), loop).result(timeout=30)
-                    return channels
-                else:
-                    return []
-            finally:
-                loop.close()
-        
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            future = executor.submit(run_debug)
-            accessible_channels = future.result(timeout=60)
+        if bot_gateway.is_available():
+            bot = bot_gateway.get_bot()
+            accessible_channels = bot_gateway.call(bot.list_accessible_channels, timeout=60)
+        else:
+            accessible_channels = []
         
         return render_template('admin/debug_channels.html', 
                              accessible_channels=accessible_channels)
@@ -1376,7 +1369,7 @@ def admin_manual_enforcement():
             flash('User not found', 'error')
             return redirect(url_for('admin_users'))
         
-        from enforcement_bot import admin_ban_user, admin_unban_user
+        from admin_jobs import submit_manual_job
         
         if action == 'ban':
             # Convert user ID to telegram chat ID for banning
@@ -1384,23 +1377,15 @@ def admin_manual_enforcement():
                 telegram_user_id = int(user.telegram_chat_id)
                 
                 # Run ban operation asynchronously
-                import asyncio
-                try:
-                    result = asyncio.run(admin_ban_user(telegram_user_id, reason))
+                job = submit_manual_job('ban', telegram_user_id, reason, session['admin_username'])
+                if 'error' in job:
+                    flash(f'Ban failed: {job["error"]}', 'error')
+                else:
+                    flash(f'Ban started in the background (job {job["job_id"]})', 'success')
                     
-                    if result.get('error'):
-                        flash(f'Ban failed: {result["error"]}', 'error')
-                    else:
-                        successful_bans = result.get('successful_bans', 0)
-                        total_channels = result.get('total_channels', 0)
-                        flash(f'User banned from {successful_bans}/{total_channels} channels', 'success')
-                        
-                        # Update user status
-                        user.is_banned = True
-                        db.session.commit()
-                        
-                except Exception as e:
-                    flash(f'Ban operation failed: {str(e)}', 'error')
+                    # Update user status
+                    user.is_banned = True
+                    db.session.commit()
             else:
                 flash('User has no Telegram chat ID', 'error')
                 
@@ -1408,23 +1393,15 @@ def admin_manual_enforcement():
             if user.telegram_chat_id:
                 telegram_user_id = int(user.telegram_chat_id)
                 
-                import asyncio
-                try:
-                    result = asyncio.run(admin_unban_user(telegram_user_id, reason))
+                job = submit_manual_job('unban', telegram_user_id, reason, session['admin_username'])
+                if 'error' in job:
+                    flash(f'Unban failed: {job["error"]}', 'error')
+                else:
+                    flash(f'Unban started in the background (job {job["job_id"]})', 'success')
                     
-                    if result.get('error'):
-                        flash(f'Unban failed: {result["error"]}', 'error')
-                    else:
-                        successful_unbans = result.get('successful_unbans', 0)
-                        total_channels = result.get('total_channels', 0)
-                        flash(f'User unbanned from {successful_unbans}/{total_channels} channels', 'success')
-                        
-                        # Update user status
-                        user.is_banned = False
-                        db.session.commit()
-                        
-                except Exception as e:
-                    flash(f'Unban operation failed: {str(e)}', 'error')
+                    # Update user status
+                    user.is_banned = False
+                    db.session.commit()
             else:
                 flash('User has no Telegram chat ID', 'error')
         else:
@@ -1453,14 +1430,13 @@ def admin_enforcement_logs():
 def admin_test_enforcement():
     """Test enforcement bot functionality"""
     try:
-        from enforcement_bot import get_enforcement_bot
-        import asyncio
+        import bot_gateway
+        
+        if not bot_gateway.is_available():
+            return jsonify({'success': False, 'error': 'Bot not available'})
+        bot = bot_gateway.get_bot()
         
         async def test_bot():
-            bot = await get_enforcement_bot()
-            if not bot or not bot.client:
-                return {'success': False, 'error': 'Bot not available'}
-            
             # Test basic connectivity
             try:
                 me = await bot.client.get_me()
@@ -1475,7 +1451,7 @@ def admin_test_enforcement():
             except Exception as e:
                 return {'success': False, 'error': str(e)}
         
-        result = asyncio.run(test_bot())
+        result = bot_gateway.call(test_bot)
         return jsonify(result)
         
     except Exception as e:
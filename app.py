@@ -68,6 +68,18 @@ except Exception as e:
 # Background services will be started after full initialization
 def start_background_services():
     """Start background services after app initialization"""
+    # Pick up admin jobs queued before a restart
+    from background_jobs import resume_jobs
+    resume_jobs()
+
+    # Apply NOWPayments callbacks received before a restart
+    from webhook_queue import resume_events
+    resume_events()
+
+    # Send notifications staged by payments, including any left unsent by a restart
+    from notification_outbox import start_dispatcher
+    start_dispatcher()
+
     # Start bot service
     def start_bot_background():
         """Start bot service in background"""
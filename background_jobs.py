@@ -0,0 +1,249 @@
+"""
+Background jobs for long-running admin operations
+Routes enqueue a BackgroundJob row and return at once; a small thread pool runs the
+registered handler in an app context and stores its progress and JSON result on the row
+"""
+
+import concurrent.futures
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# job_type -> handler(context, **params); handlers live in admin_jobs.py
+JOB_HANDLERS: Dict[str, Callable] = {}
+
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('ADMIN_JOB_WORKERS', 2)),
+    thread_name_prefix='admin-job'
+)
+
+# Running jobs get their updated_at touched this often, however rarely they report progress;
+# a 'running' job whose heartbeat is older than JOB_STALE_AFTER lost its worker
+HEARTBEAT_INTERVAL = 30
+JOB_STALE_AFTER = timedelta(seconds=HEARTBEAT_INTERVAL * 4)
+
+_running: Set[int] = set()  # IDs of jobs running in this process
+_running_lock = threading.Lock()
+_heartbeat: Optional[threading.Thread] = None
+
+
+def job_handler(job_type: str):
+    """Register a function as the handler for `job_type`"""
+    def register(func):
+        JOB_HANDLERS[job_type] = func
+        return func
+    return register
+
+
+class JobContext:
+    """Handed to a handler so it can report progress while it runs"""
+
+    def __init__(self, job_id: int, save_interval: float = 1.0):
+        self.job_id = job_id
+        self.save_interval = save_interval
+        self.current = 0
+        self.total: Optional[int] = None
+        self.message: Optional[str] = None
+        self._saved_at = 0.0
+        self._thread_id = threading.get_ident()
+
+    def progress(self, current: int, total: Optional[int] = None, message: Optional[str] = None):
+        """Record progress; safe to call from any thread (e.g. the bot loop)
+
+        The row is only written from the job's own thread, at most once per save_interval.
+        """
+        self.current = current
+        if total is not None:
+            self.total = total
+        if message is not None:
+            self.message = message
+
+        if threading.get_ident() == self._thread_id and time.monotonic() - self._saved_at >= self.save_interval:
+            self.save_progress()
+
+    def save_progress(self):
+        from app import db
+        from models import BackgroundJob
+
+        try:
+            BackgroundJob.query.filter_by(id=self.job_id).update({
+                'progress_current': self.current,
+                'progress_total': self.total,
+                'progress_message': self.message[:256] if self.message else None,
+                'updated_at': datetime.utcnow()
+            })
+            db.session.commit()
+            self._saved_at = time.monotonic()
+        except Exception as e:
+            db.session.rollback()
+            logger.warning(f"Failed to save progress for job {self.job_id}: {e}")
+
+    def wait(self, future: concurrent.futures.Future, poll_interval: float = 1.0):
+        """Block on work running elsewhere (e.g. the bot loop), saving progress meanwhile"""
+        while True:
+            try:
+                return future.result(timeout=poll_interval)
+            except concurrent.futures.TimeoutError:
+                self.save_progress()
+
+
+def enqueue_job(job_type: str, params: Dict = None, created_by: str = None) -> int:
+    """Persist a job and hand it to the worker pool; returns the job ID"""
+    from app import db
+    from models import BackgroundJob
+
+    import admin_jobs  # Registers the handlers
+    if job_type not in JOB_HANDLERS:
+        raise ValueError(f'Unknown job type: {job_type}')
+
+    job = BackgroundJob(
+        job_type=job_type,
+        params=json.dumps(params or {}),
+        created_by=created_by
+    )
+    db.session.add(job)
+    db.session.commit()
+
+    _executor.submit(run_job, job.id)
+    logger.info(f"Queued {job_type} job {job.id}")
+    return job.id
+
+
+def run_job(job_id: int):
+    """Claim a queued job, run its handler and store the outcome"""
+    try:
+        from app import app, db
+        from models import BackgroundJob
+        import admin_jobs  # Registers the handlers
+
+        with app.app_context():
+            # Atomic claim, so a job resumed by several processes only runs once
+            claimed = BackgroundJob.query.filter_by(id=job_id, status='queued').update({
+                'status': 'running',
+                'started_at': datetime.utcnow(),
+                'updated_at': datetime.utcnow()
+            })
+            db.session.commit()
+            if not claimed:
+                return
+
+            job = BackgroundJob.query.get(job_id)
+            handler = JOB_HANDLERS.get(job.job_type)
+            params = json.loads(job.params or '{}')
+            context = JobContext(job_id)
+            with _running_lock:
+                _running.add(job_id)
+
+            try:
+                if handler is None:
+                    raise ValueError(f'No handler registered for {job.job_type}')
+                result = handler(context, **params)
+
+                job = BackgroundJob.query.get(job_id)
+                job.status = 'completed'
+                job.result = json.dumps(result, default=str)
+                logger.info(f"Job {job_id} ({job.job_type}) completed")
+
+            except Exception as e:
+                db.session.rollback()
+                job = BackgroundJob.query.get(job_id)
+                job.status = 'failed'
+                job.error_message = str(e)
+                logger.error(f"Job {job_id} ({job.job_type}) failed: {e}")
+
+            finally:
+                with _running_lock:
+                    _running.discard(job_id)
+
+            job.progress_current = context.current
+            job.progress_total = context.total
+            job.progress_message = context.message[:256] if context.message else None
+            job.finished_at = datetime.utcnow()
+            db.session.commit()
+
+    except Exception as e:
+        logger.error(f"Job runner failed for job {job_id}: {e}")
+
+
+def reap_stale_jobs() -> int:
+    """Fail 'running' jobs whose worker stopped sending heartbeats; needs an app context"""
+    from app import db
+    from models import BackgroundJob
+
+    reaped = BackgroundJob.query.filter(
+        BackgroundJob.status == 'running',
+        BackgroundJob.updated_at < datetime.utcnow() - JOB_STALE_AFTER
+    ).update({
+        'status': 'failed',
+        'error_message': 'Worker stopped (process restarted or crashed)',
+        'finished_at': datetime.utcnow()
+    }, synchronize_session=False)
+    db.session.commit()
+    if reaped:
+        logger.warning(f"Marked {reaped} interrupted jobs failed")
+    return reaped
+
+
+def run_heartbeat():
+    """Touch this process's running jobs and reap those of dead processes, forever"""
+    from app import app, db
+    from models import BackgroundJob
+
+    while True:
+        time.sleep(HEARTBEAT_INTERVAL)
+        try:
+            with app.app_context():
+                with _running_lock:
+                    running_ids = list(_running)
+                if running_ids:
+                    BackgroundJob.query.filter(
+                        BackgroundJob.id.in_(running_ids),
+                        BackgroundJob.status == 'running'
+                    ).update({'updated_at': datetime.utcnow()}, synchronize_session=False)
+                    db.session.commit()
+                reap_stale_jobs()
+        except Exception as e:
+            logger.error(f"Job heartbeat failed: {e}")
+
+
+def resume_jobs():
+    """On startup: fail jobs whose worker died, requeue jobs that never started, start the heartbeat"""
+    global _heartbeat
+    try:
+        from app import app, db
+        from models import BackgroundJob
+
+        with app.app_context():
+            interrupted = reap_stale_jobs()
+
+            queued_ids = [job_id for (job_id,) in db.session.query(BackgroundJob.id).filter(
+                BackgroundJob.status == 'queued'
+            ).order_by(BackgroundJob.created_at).all()]
+
+        for job_id in queued_ids:
+            _executor.submit(run_job, job_id)
+
+        if interrupted or queued_ids:
+            logger.info(f"Resumed {len(queued_ids)} queued jobs, marked {interrupted} interrupted jobs failed")
+
+    except Exception as e:
+        logger.error(f"Failed to resume background jobs: {e}")
+
+    # Jobs interrupted shortly before the restart are only stale once their last heartbeat ages out
+    if _heartbeat is None or not _heartbeat.is_alive():
+        _heartbeat = threading.Thread(target=run_heartbeat, name='admin-job-heartbeat', daemon=True)
+        _heartbeat.start()
+
+
+def get_job(job_id: int, include_result: bool = True) -> Optional[Dict]:
+    from models import BackgroundJob
+
+    job = BackgroundJob.query.get(job_id)
+    return job.to_dict(include_result) if job else None
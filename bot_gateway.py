@@ -0,0 +1,66 @@
+"""
+Command gateway for admin-triggered Telegram operations
+Web request threads submit coroutines to the running enforcement bot's event loop,
+so they reuse its connected client instead of spinning up a loop per request
+"""
+
+import asyncio
+import concurrent.futures
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = 30
+
+
+def get_bot():
+    """The global enforcement bot, or None if it has not been started"""
+    import enforcement_bot
+    return enforcement_bot.enforcement_bot
+
+
+def bot_loop():
+    """The bot's event loop if it is running and its client is connected, else None"""
+    bot = get_bot()
+    if not bot or not bot.client:
+        return None
+    loop = getattr(bot, 'loop', None)
+    if loop is None or loop.is_closed() or not loop.is_running():
+        return None
+    return loop
+
+
+def is_available() -> bool:
+    return bot_loop() is not None
+
+
+def submit(coroutine_function, *args, **kwargs) -> concurrent.futures.Future:
+    """Schedule `coroutine_function(*args, **kwargs)` on the bot loop and return its future"""
+    loop = bot_loop()
+    if loop is None:
+        raise RuntimeError('Enforcement bot not available')
+
+    try:
+        current_loop = asyncio.get_running_loop()
+    except RuntimeError:
+        current_loop = None
+    if current_loop is loop:
+        # Blocking on our own loop would deadlock; bot code should just await
+        raise RuntimeError('Gateway called from the enforcement bot loop')
+
+    return asyncio.run_coroutine_threadsafe(coroutine_function(*args, **kwargs), loop)
+
+
+def call(coroutine_function, *args, timeout: float = DEFAULT_TIMEOUT, **kwargs):
+    """Run a coroutine on the bot loop and wait up to `timeout` seconds for its result
+
+    On timeout the operation keeps running on the bot loop (a half-finished ban
+    sweep is worse than a slow page); concurrent.futures.TimeoutError is raised.
+    """
+    future = submit(coroutine_function, *args, **kwargs)
+    try:
+        return future.result(timeout=timeout)
+    except concurrent.futures.TimeoutError:
+        logger.warning(f"Bot command {getattr(coroutine_function, '__name__', coroutine_function)} "
+                       f"still running after {timeout}s")
+        raise
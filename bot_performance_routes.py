@@ -31,6 +31,7 @@ def admin_bot_performance():
         
         # Get users who have been banned by the bot
         banned_user_ids = db.session.query(BotAction.user_id).filter(
+            BotAction.user_id.isnot(None),
             BotAction.action_type == 'ban',
             BotAction.success == True
         ).distinct().all()
@@ -113,7 +114,18 @@ def admin_bot_performance_actions():
             })
         
         return jsonify({'actions': actions_data})
-        
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/admin/bot-performance/rates')
+@admin_required
+def admin_bot_performance_rates():
+    """API endpoint for the enforcement bot's adaptive rate controller"""
+    try:
+        from enforcement_bot_v2 import get_enforcement_rate_stats
+        return jsonify({'rates': get_enforcement_rate_stats()})
+
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -0,0 +1,189 @@
+"""
+Broadcast pipeline for Telegram Bot API messages
+Recipients are streamed in keyset-paginated batches, sent by a worker pool behind a
+token bucket sized to the Bot API's ~30 msg/s limit, and recorded in BroadcastDelivery
+"""
+
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import requests
+from urllib3.exceptions import NewConnectionError
+
+import http_client
+from rate_limiter import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+BROADCAST_RATE = float(os.environ.get('BROADCAST_RATE', 25))  # Messages per second, below the 30/s limit
+BROADCAST_WORKERS = int(os.environ.get('BROADCAST_WORKERS', 8))
+BATCH_SIZE = 500
+
+
+def iter_recipient_batches(batch_size: int = BATCH_SIZE) -> Iterator[List[Tuple[int, str]]]:
+    """(User.id, telegram_chat_id) of active, unbanned users, ordered by id without OFFSET scans"""
+    from app import db
+    from models import User
+
+    last_id = 0
+    while True:
+        rows = db.session.query(User.id, User.telegram_chat_id).filter(
+            User.id > last_id,
+            User.is_active == True,
+            User.is_banned == False,
+            User.telegram_chat_id.isnot(None),
+            User.telegram_chat_id != ''
+        ).order_by(User.id).limit(batch_size).all()
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1][0]
+
+
+def never_sent(error: requests.RequestException) -> bool:
+    """True if the request cannot have reached Telegram: connect timeout, refused or unresolvable host"""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    return isinstance(error, requests.exceptions.ConnectionError) and isinstance(reason, NewConnectionError)
+
+
+def count_recipients() -> int:
+    from models import User
+
+    return User.query.filter(
+        User.is_active == True,
+        User.is_banned == False,
+        User.telegram_chat_id.isnot(None),
+        User.telegram_chat_id != ''
+    ).count()
+
+
+class BotApiSender:
+    """sendMessage with a shared rate budget and 429 retry_after handling; safe across threads"""
+
+    def __init__(self, token: str, rate: float = BROADCAST_RATE, max_attempts: int = 5):
+        self.url = f"https://api.telegram.org/bot{token}/sendMessage"
+        self.bucket = TokenBucket(rate, rate)
+        self.max_attempts = max_attempts
+        self.paused_until = 0.0  # time.monotonic(); a 429 pauses every worker, not just the one that hit it
+        self._pause_lock = threading.Lock()
+
+    def pause(self, seconds: float):
+        with self._pause_lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def wait_for_slot(self):
+        delay = self.paused_until - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        self.bucket.acquire_blocking()
+
+    def send(self, chat_id: str, message: str, parse_mode: str = 'HTML') -> Tuple[str, int, Optional[str]]:
+        """Returns (status, attempts, error)"""
+        error = None
+        for attempt in range(1, self.max_attempts + 1):
+            self.wait_for_slot()
+            try:
+                # Retries are handled here, where 429 retry_after is understood
+                response = http_client.post('telegram', self.url, data={
+                    'chat_id': chat_id,
+                    'text': message,
+                    'parse_mode': parse_mode,
+                    'disable_web_page_preview': True
+                }, timeout=10, retries=0)
+            except requests.RequestException as e:
+                error = type(e).__name__  # str(e) would include the URL and with it the bot token
+                if not never_sent(e):
+                    # Read timeout or dropped connection: Telegram may have delivered it already
+                    return 'failed', attempt, error
+                time.sleep(min(30, 2 ** attempt) * random.uniform(0.5, 1.0))
+                continue
+
+            if response.status_code == 200:
+                return 'sent', attempt, None
+
+            try:
+                payload = response.json()
+            except ValueError:
+                payload = {}
+            error = payload.get('description') or response.text[:256]
+
+            if response.status_code == 429:
+                retry_after = (payload.get('parameters') or {}).get('retry_after', 1)
+                logger.warning(f"Broadcast rate limited by Telegram, pausing {retry_after}s")
+                self.pause(retry_after)
+            elif response.status_code == 403:
+                return 'blocked', attempt, error  # User blocked the bot or deleted the account
+            elif response.status_code < 500:
+                return 'failed', attempt, error  # Bad chat id or message; retrying will not help
+            else:
+                time.sleep(min(30, 2 ** attempt) * random.uniform(0.5, 1.0))
+
+        return 'failed', self.max_attempts, error
+
+
+def deliver_broadcast(message: str, job_id: int = None, progress=None, parse_mode: str = 'HTML') -> Dict:
+    """Send `message` to every recipient; must run inside an app context
+
+    With a job_id, recipients already marked sent or blocked for that job are skipped,
+    so a resumed or re-run job does not message anyone twice.
+    """
+    from app import db
+    from models import BroadcastDelivery
+    from telegram_bot import get_bot_token
+
+    token = get_bot_token()
+    if not token:
+        raise RuntimeError('No Telegram bot token configured')
+
+    sender = BotApiSender(token)
+    total = count_recipients()
+    stats = {'total': total, 'sent': 0, 'blocked': 0, 'failed': 0, 'skipped': 0}
+    done = 0
+
+    with ThreadPoolExecutor(max_workers=BROADCAST_WORKERS, thread_name_prefix='broadcast') as executor:
+        for batch in iter_recipient_batches():
+            existing = {}
+            if job_id is not None:
+                existing = {
+                    delivery.user_id: delivery for delivery in BroadcastDelivery.query.filter(
+                        BroadcastDelivery.job_id == job_id,
+                        BroadcastDelivery.user_id.in_([user_id for user_id, _ in batch])
+                    ).all()
+                }
+
+            pending = []
+            for user_id, chat_id in batch:
+                delivery = existing.get(user_id)
+                if delivery and delivery.status in ('sent', 'blocked'):
+                    stats['skipped'] += 1
+                    continue
+                pending.append((user_id, chat_id, executor.submit(sender.send, chat_id, message, parse_mode)))
+
+            # Workers only talk to Telegram; delivery rows are written here, once per batch
+            for user_id, chat_id, future in pending:
+                status, attempts, error = future.result()
+                stats[status] += 1
+
+                delivery = existing.get(user_id)
+                if delivery is None:
+                    delivery = BroadcastDelivery(job_id=job_id, user_id=user_id, chat_id=chat_id, attempts=0)
+                    db.session.add(delivery)
+                delivery.status = status
+                delivery.attempts = (delivery.attempts or 0) + attempts
+                delivery.error_message = error
+
+            db.session.commit()
+            done += len(batch)
+            if progress:
+                progress(done, total, f"{stats['sent']} sent, {stats['blocked']} blocked, {stats['failed']} failed")
+
+    logger.info(f"Broadcast finished: {stats['sent']}/{total} sent, {stats['blocked']} blocked, "
+                f"{stats['failed']} failed, {stats['skipped']} already delivered")
+    return stats
@@ -0,0 +1,21 @@
+"""
+Bounded thread pool for the enforcement bots' database access
+Blocking SQLAlchemy calls run here so the Telethon event loop is never stalled by a query
+"""
+
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# Shared by every bot in the process; also caps the connections the bots hold
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('BOT_DB_POOL_SIZE', 4)),
+    thread_name_prefix='bot-db'
+)
+
+
+async def run_db(func, *args, **kwargs):
+    """Run a blocking database function in the pool and await its result"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
@@ -15,6 +15,13 @@ from sqlalchemy.orm import sessionmaker
 from sqlalchemy import create_engine
 import threading
 
+from entity_cache import BotCapabilityCache, ChannelAccessCache, ChannelEntityCache
+from db_executor import run_db
+from enforcement_state import ChannelSnapshot, load_channel_snapshots, persist_channel_snapshot
+from rate_limiter import TelegramRateLimiter
+from entitlement_bus import subscribe, unsubscribe
+from whitelist import IncrementalWhitelist
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -71,18 +78,33 @@ class EnforcementBot:
         # Safety configuration
         self.dry_run = os.environ.get('BOT_MODE', 'live') == 'dry-run'
         self.max_actions_per_minute = 20
-        self.action_delay = 3  # seconds between actions
         self.scan_interval = 300  # 5 minutes
         
-        # Rate limiting
-        self.last_action_time = 0
-        self.actions_this_minute = 0
-        self.minute_start = time.time()
+        # Rate limiting: one token bucket for the account plus one per channel,
+        # shared by the concurrent channel workers
+        self.rate_limiter = TelegramRateLimiter(
+            global_rate=self.max_actions_per_minute / 60,
+            global_burst=3,
+            per_chat_rate=self.max_actions_per_minute / 60,
+            per_chat_burst=3
+        )
+        self.max_concurrent_channels = 8
         
         # Tracking
         self.managed_channels: Dict[str, Dict] = {}
-        self.whitelisted_users: Set[int] = set()
+        self.whitelist = IncrementalWhitelist()
+        self.bus_token = None
+        self.whitelisted_users: Set[int] = self.whitelist.members
+        self.bot_name = 'enforcement_bot'
+        self.channel_snapshots: Dict[int, ChannelSnapshot] = {}
+        # Channel db_id -> Telegram user ID -> reason, rebuilt once per cycle
+        self.authorized_by_channel: Dict[int, Dict[int, str]] = {}
+        self.to_ban_by_channel: Dict[int, Dict[int, str]] = {}
+        self.entity_cache = ChannelEntityCache(self.bot_name, scan_dialogs=True)
+        self.capabilities = BotCapabilityCache()
+        self.access_cache = ChannelAccessCache()
         self.client: Optional[TelegramClient] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None  # Admin commands are submitted here (bot_gateway)
         self.running = False
         
         # Database connection
@@ -99,6 +121,7 @@ class EnforcementBot:
     
     async def initialize(self):
         """Initialize Telegram client and load configuration"""
+        self.loop = asyncio.get_running_loop()
         try:
             # Check if credentials are available
             if not self.api_id or not self.api_hash:
@@ -152,6 +175,8 @@ class EnforcementBot:
                 # Load initial configuration
                 await self.sync_channels()
                 await self.load_whitelisted_users()
+                self.bus_token = subscribe(self.whitelist.handle_event)
+                self.channel_snapshots = await run_db(load_channel_snapshots, self.bot_name)
                 
                 return True
                 
@@ -168,11 +193,10 @@ class EnforcementBot:
             logger.warning(f"Failed to initialize client: {e}")
             return False
     
-    async def sync_channels(self):
-        """Auto-sync channels from database"""
+    def query_managed_channels(self) -> Dict[str, Dict]:
+        """Channels with telegram_channel_id configured (blocking - call through run_db)"""
+        session = self.Session()
         try:
-            session = self.Session()
-            
             # Import here to avoid circular imports
             from models import Channel
             
@@ -193,6 +217,14 @@ class EnforcementBot:
                         'name': channel.name,
                         'db_id': channel.id
                     }
+            return new_channels
+        finally:
+            session.close()
+    
+    async def sync_channels(self):
+        """Auto-sync channels from database"""
+        try:
+            new_channels = await run_db(self.query_managed_channels)
             
             old_count = len(self.managed_channels)
             self.managed_channels = new_channels
@@ -204,90 +236,33 @@ class EnforcementBot:
             else:
                 logger.warning("No channels configured with telegram_channel_id - enforcement bot will be idle")
             
-            session.close()
-            
         except Exception as e:
             logger.error(f"Failed to sync channels: {e}")
     
     async def load_whitelisted_users(self):
-        """Load whitelisted users from database"""
-        try:
-            from app import app, db
-            from models import User, Admin, Subscription
-            from sqlalchemy import and_
-            
-            with app.app_context():
-                whitelisted_ids = set()
-                
-                # Add admin users to whitelist
-                try:
-                    admins = Admin.query.filter(Admin.is_active == True).all()
-                    for admin in admins:
-                        if hasattr(admin, 'telegram_chat_id') and admin.telegram_chat_id and admin.telegram_chat_id.isdigit():
-                            whitelisted_ids.add(int(admin.telegram_chat_id))
-                            logger.debug(f"Added admin {admin.username} to whitelist")
-                except Exception as e:
-                    logger.warning(f"Could not load admin users: {e}")
-                
-                # Add users with active subscriptions to whitelist 
-                try:
-                    active_subscriptions = Subscription.query.filter(
-                        and_(
-                            Subscription.end_date > datetime.utcnow(),
-                            Subscription.is_paid == True
-                        )
-                    ).all()
-                    
-                    for subscription in active_subscriptions:
-                        user = subscription.user
-                        if user.telegram_chat_id and user.telegram_chat_id.isdigit():
-                            whitelisted_ids.add(int(user.telegram_chat_id))
-                            logger.debug(f"Added user {user.username} with active subscription to whitelist")
-                            
-                except Exception as e:
-                    logger.warning(f"Could not load users with active subscriptions: {e}")
-                
-                self.whitelisted_users = whitelisted_ids
-                logger.info(f"Loaded {len(self.whitelisted_users)} whitelisted users (admins + active subscribers)")
-            
-        except Exception as e:
-            logger.error(f"Failed to load whitelisted users: {e}")
-            self.whitelisted_users = set()
+        """Bring the whitelist (admins + active subscribers) up to date; full reload only on drift"""
+        if not await run_db(self.whitelist.refresh):
+            logger.warning("Whitelist refresh failed - keeping the previous set")
+        logger.info(f"Whitelist holds {len(self.whitelisted_users)} users (admins + active subscribers)")
     
-    async def rate_limit_check(self):
-        """Check and enforce rate limiting"""
-        current_time = time.time()
-        
-        # Reset counter every minute
-        if current_time - self.minute_start >= 60:
-            self.actions_this_minute = 0
-            self.minute_start = current_time
-        
-        # Check if we've hit the limit
-        if self.actions_this_minute >= self.max_actions_per_minute:
-            wait_time = 60 - (current_time - self.minute_start)
-            logger.warning(f"Rate limit reached, waiting {wait_time:.1f} seconds")
-            await asyncio.sleep(wait_time)
-            self.actions_this_minute = 0
-            self.minute_start = time.time()
-        
-        # Enforce delay between actions
-        time_since_last = current_time - self.last_action_time
-        if time_since_last < self.action_delay:
-            await asyncio.sleep(self.action_delay - time_since_last)
-        
-        self.last_action_time = time.time()
-        self.actions_this_minute += 1
+    async def rate_limit_check(self, chat_id=None):
+        """Wait for the shared global and per-channel token buckets"""
+        await self.rate_limiter.acquire(chat_id)
     
-    async def safe_ban_user(self, channel_entity, user_id: int, reason: str = "Subscription expired") -> bool:
-        """Safely ban user with error handling"""
+    async def safe_ban_user(self, channel_entity, user_id: int, reason: str = "Subscription expired",
+                            unbannable: Optional[Set[int]] = None) -> bool:
+        """Safely ban user with error handling
+
+        Users that cannot be banned until something changes (not a member, an admin,
+        unknown to the bot) are added to `unbannable` when it is given.
+        """
         try:
-            await self.rate_limit_check()
-            
             if user_id in self.whitelisted_users:
                 logger.info(f"Skipping ban for whitelisted user {user_id}")
                 return False
             
+            await self.rate_limit_check(channel_entity.id)
+            
             if self.dry_run:
                 logger.info(f"DRY-RUN: Would ban user {user_id} from channel {channel_entity.id} - {reason}")
                 return True
@@ -314,6 +289,15 @@ class EnforcementBot:
             
         except errors.UserNotParticipantError:
             logger.info(f"User {user_id} not in channel {channel_entity.id}")
+            if unbannable is not None:
+                unbannable.add(user_id)
+            return False
+            
+        except (errors.UserAdminInvalidError, errors.UserIdInvalidError, ValueError) as e:
+            # Admins, and users the bot never saw (ValueError: entity not found), cannot be banned
+            logger.info(f"Cannot ban user {user_id} in channel {channel_entity.id}: {e}")
+            if unbannable is not None:
+                unbannable.add(user_id)
             return False
             
         except Exception as e:
@@ -323,7 +307,7 @@ class EnforcementBot:
     async def safe_unban_user(self, channel_entity, user_id: int, reason: str = "Subscription renewed") -> bool:
         """Safely unban user with error handling"""
         try:
-            await self.rate_limit_check()
+            await self.rate_limit_check(channel_entity.id)
             
             if self.dry_run:
                 logger.info(f"DRY-RUN: Would unban user {user_id} from channel {channel_entity.id} - {reason}")
@@ -355,6 +339,9 @@ class EnforcementBot:
     
     async def log_action(self, action_type: str, user_id: int, channel_id: int, reason: str):
         """Log bot actions to database"""
+        await run_db(self.write_action_log, action_type, user_id, channel_id, reason)
+    
+    def write_action_log(self, action_type: str, user_id: int, channel_id: int, reason: str):
         try:
             session = self.Session()
             
@@ -524,7 +511,7 @@ class EnforcementBot:
         try:
             # Get channel entity
             try:
-                channel_entity = await self.client.get_entity(channel_id)
+                channel_entity = await self.entity_cache.get_entity(self.client, channel_id)
             except Exception as e:
                 logger.error(f"Failed to get channel entity for {channel_id}: {e}")
                 return
@@ -562,15 +549,20 @@ class EnforcementBot:
         except Exception as e:
             logger.error(f"Failed to enforce channel {channel_id}: {e}")
     
-    async def enforce_unauthorized_users(self, channel_entity, channel_id: int, authorized_user_ids: set) -> tuple[int, int]:
-        """Ban all unauthorized users currently in the channel"""
+    async def enforce_unauthorized_users(self, channel_entity, channel_id: int, authorized_user_ids: set,
+                                         snapshot: ChannelSnapshot, banned: set) -> tuple[int, int, Optional[set]]:
+        """Ban unauthorized users among new joiners and members who lost access since the last cycle
+        
+        Returns (bans, errors, participants); participants is None if the scan did not complete.
+        """
         bans = 0
         errors = 0
+        participants = set()
+        revoked_user_ids = snapshot.newly_revoked(authorized_user_ids | self.whitelisted_users)
         
         try:
             # Get bot's own user ID to avoid self-ban
-            me = await self.client.get_me()
-            bot_user_id = me.id
+            bot_user_id = await self.capabilities.get_bot_id(self.client)
             
             # Iterate through all channel participants
             async for participant in self.client.iter_participants(channel_entity):
@@ -585,6 +577,11 @@ class EnforcementBot:
                         continue
                 
                 user_id = participant.id
+                participants.add(user_id)
+                
+                # Members already checked last cycle only need a look if their access changed
+                if user_id in snapshot.participants and user_id not in revoked_user_ids:
+                    continue
                 
                 # Skip bot itself
                 if user_id == bot_user_id:
@@ -598,8 +595,9 @@ class EnforcementBot:
                 if user_id in authorized_user_ids:
                     continue
                 
-                # User is unauthorized - ban them
-                await self.rate_limit_check()
+                # User is unauthorized - ban them (failures are dropped from the
+                # participant snapshot so the next cycle retries them)
+                participants.discard(user_id)
                 success = await self.safe_ban_user(
                     channel_entity, 
                     user_id, 
@@ -607,14 +605,155 @@ class EnforcementBot:
                 )
                 if success:
                     bans += 1
+                    banned.add(user_id)
                 else:
                     errors += 1
                     
         except Exception as e:
             logger.error(f"Error enforcing unauthorized users in channel {channel_id}: {e}")
             errors += 1
+            participants = None
             
-        return bans, errors
+        return bans, errors, participants
+
+    async def enforce_managed_channel(self, channel_id: str, channel_info: Dict) -> Dict:
+        """Enforce subscription rules for one managed channel"""
+        channel_name = channel_info['name']
+        stats = {
+            'bans': 0,
+            'unbans': 0,
+            'unauthorized_bans': 0,
+            'errors': 0
+        }
+        
+        try:
+            logger.info(f"Processing channel: {channel_name} ({channel_id})")
+            
+            # Validate channel ID format
+            if not channel_id.startswith('@') and not channel_id.startswith('-100'):
+                logger.warning(f"Invalid channel ID format: {channel_id}. Expected format: @username or -100xxxxxxxxx")
+                stats['errors'] += 1
+                return stats
+            
+            # Additional validation for numeric IDs
+            if channel_id.startswith('-100'):
+                try:
+                    # Ensure it's a valid numeric ID after -100
+                    int(channel_id[4:])  # Check if the part after -100 is numeric
+                    if len(channel_id) < 14:  # Channel IDs are typically longer
+                        logger.warning(f"Channel ID {channel_id} appears too short, may be invalid")
+                except ValueError:
+                    logger.warning(f"Invalid numeric channel ID format: {channel_id}")
+                    stats['errors'] += 1
+                    return stats
+            
+            # Resolve from the entity cache; falls back to InputPeer and a one-off dialog scan
+            try:
+                channel_entity = await self.entity_cache.get_entity(self.client, channel_id)
+                logger.debug(f"Successfully found channel: {channel_entity.title}")
+                
+            except errors.UsernameNotOccupiedError:
+                logger.error(f"Channel username {channel_id} does not exist or is invalid")
+                stats['errors'] += 1
+                return stats
+            except errors.ChannelPrivateError:
+                logger.error(f"Channel {channel_id} is private or bot is not a member")
+                await self.entity_cache.invalidate(channel_id)
+                stats['errors'] += 1
+                return stats
+            except ValueError as ve:
+                logger.warning(f"Channel {channel_id} entity not found. Bot may not be added to channel or channel may be private")
+                logger.info(f"Skipping channel {channel_name} - ensure bot is added as admin")
+                stats['errors'] += 1
+                return stats
+            except Exception as entity_error:
+                logger.error(f"Cannot access channel {channel_id}: {entity_error}")
+                logger.warning(f"Bot may need to be added to channel {channel_id} as admin")
+                stats['errors'] += 1
+                return stats
+            
+            # Skip channels where bans would fail before paging their members
+            if not await self.capabilities.has_ban_rights(self.client, channel_id, channel_entity):
+                logger.warning(f"Bot lacks ban rights in {channel_name} - skipping")
+                stats['errors'] += 1
+                return stats
+            
+            # Users who should have access to / be banned from this channel, from the cycle-wide load
+            db_id = channel_info['db_id']
+            authorized_users = self.authorized_by_channel.get(db_id, {})
+            authorized_user_ids = set(authorized_users)
+            banned_users = self.to_ban_by_channel.get(db_id, {})
+            
+            # Diff against the snapshot applied last cycle
+            snapshot = self.channel_snapshots.get(db_id) or ChannelSnapshot()
+            allowed_user_ids = authorized_user_ids | self.whitelisted_users
+            banned = set(snapshot.banned)
+            # Users who could not be banned stay skipped until they regain access or join
+            skipped = (snapshot.skipped & set(banned_users)) - allowed_user_ids
+            failed_unbans = set()
+            subscription_bans = 0
+            channel_unbans = 0
+            
+            # Process bans for users newly on the ban list
+            for user_id, reason in banned_users.items():
+                if user_id in banned or user_id in skipped or user_id in self.whitelisted_users:
+                    continue
+                success = await self.safe_ban_user(channel_entity, user_id, reason, skipped)
+                if success:
+                    subscription_bans += 1
+                    banned.add(user_id)
+                elif user_id not in skipped:
+                    stats['errors'] += 1
+            
+            # Process unbans only for newly granted users; a channel without a
+            # snapshot gets one full pass so bans from before tracking are lifted
+            for user_id, reason in authorized_users.items():
+                if snapshot.exists and user_id in snapshot.allowed:
+                    continue
+                success = await self.safe_unban_user(channel_entity, user_id, reason)
+                if success:
+                    channel_unbans += 1
+                    banned.discard(user_id)
+                else:
+                    failed_unbans.add(user_id)
+                    stats['errors'] += 1
+            
+            stats['bans'] += subscription_bans
+            stats['unbans'] += channel_unbans
+            
+            # Ban unauthorized users among new joiners and members who lost access
+            unauthorized_bans, unauthorized_errors, participants = await self.enforce_unauthorized_users(
+                channel_entity, 
+                channel_info['db_id'], 
+                authorized_user_ids,
+                snapshot,
+                banned
+            )
+            stats['unauthorized_bans'] += unauthorized_bans
+            stats['errors'] += unauthorized_errors
+            
+            new_snapshot = ChannelSnapshot(
+                participants=participants if participants is not None else snapshot.participants,
+                allowed=allowed_user_ids - failed_unbans,
+                banned=banned,
+                exists=snapshot.exists,
+                # New joiners went through the participant pass, so their ban is retried there
+                skipped=skipped - ((participants or set()) - snapshot.participants)
+            )
+            self.channel_snapshots[db_id] = new_snapshot
+            if (not snapshot.exists or new_snapshot.participants != snapshot.participants
+                    or new_snapshot.allowed != snapshot.allowed or new_snapshot.banned != snapshot.banned
+                    or new_snapshot.skipped != snapshot.skipped):
+                await persist_channel_snapshot(self.bot_name, db_id, new_snapshot)
+            
+            # Log channel processing completion
+            logger.info(f"Channel {channel_name} processed: {subscription_bans} subscription bans, {channel_unbans} unbans, {unauthorized_bans} unauthorized bans")
+            
+        except Exception as e:
+            logger.error(f"Failed to process channel {channel_name}: {e}")
+            stats['errors'] += 1
+        
+        return stats
 
     async def enforcement_cycle(self):
         """Enhanced enforcement cycle with comprehensive subscription management"""
@@ -635,153 +774,38 @@ class EnforcementBot:
                 logger.info("No channels configured for enforcement")
                 return
             
+            # Without entitlements every member would look unauthorized
+            if not await self.load_channel_entitlements():
+                logger.warning("Channel entitlements unavailable - skipping enforcement cycle")
+                return
+            
             # Statistics tracking
             total_bans = 0
             total_unbans = 0
             total_unauthorized_bans = 0
             total_errors = 0
             
-            # Process each channel individually for better control
-            for channel_id, channel_info in self.managed_channels.items():
-                channel_name = channel_info['name']
-                
-                try:
-                    logger.info(f"Processing channel: {channel_name} ({channel_id})")
-                    
-                    # Validate channel ID format
-                    if not channel_id.startswith('@') and not channel_id.startswith('-100'):
-                        logger.warning(f"Invalid channel ID format: {channel_id}. Expected format: @username or -100xxxxxxxxx")
-                        total_errors += 1
-                        continue
-                    
-                    # Additional validation for numeric IDs
-                    if channel_id.startswith('-100'):
-                        try:
-                            # Ensure it's a valid numeric ID after -100
-                            int(channel_id[4:])  # Check if the part after -100 is numeric
-                            if len(channel_id) < 14:  # Channel IDs are typically longer
-                                logger.warning(f"Channel ID {channel_id} appears too short, may be invalid")
-                        except ValueError:
-                            logger.warning(f"Invalid numeric channel ID format: {channel_id}")
-                            total_errors += 1
-                            continue
-                    
-                    # Try to get channel entity with better error handling and alternative methods
+            # Process channels concurrently with a small worker pool
+            pending = asyncio.Queue()
+            for channel_id, channel_info in list(self.managed_channels.items()):
+                pending.put_nowait((channel_id, channel_info))
+            
+            async def channel_worker():
+                nonlocal total_bans, total_unbans, total_unauthorized_bans, total_errors
+                while True:
                     try:
-                        # First try to get entity directly
-                        try:
-                            channel_entity = await self.client.get_entity(channel_id)
-                            logger.debug(f"Successfully found channel: {channel_entity.title}")
-                        except ValueError as ve:
-                            if "Cannot find any entity" in str(ve):
-                                logger.info(f"Direct entity lookup failed for {channel_id}, trying alternative methods...")
-                                
-                                # Try to get entity using input peer
-                                try:
-                                    from telethon.tl.types import InputPeerChannel
-                                    # Extract channel ID and access hash (we'll use 0 for access hash and let Telegram resolve it)
-                                    if channel_id.startswith('-100'):
-                                        numeric_id = int(channel_id[4:])  # Remove -100 prefix
-                                        input_peer = InputPeerChannel(numeric_id, 0)
-                                        channel_entity = await self.client.get_entity(input_peer)
-                                        logger.info(f"Successfully resolved channel using InputPeer: {channel_entity.title}")
-                                    else:
-                                        raise ValueError("Invalid channel ID format")
-                                except Exception as input_peer_error:
-                                    logger.warning(f"InputPeer method failed: {input_peer_error}")
-                                    
-                                    # Try getting dialogs to find the channel
-                                    try:
-                                        logger.info(f"Searching for channel {channel_id} in dialogs...")
-                                        async for dialog in self.client.iter_dialogs():
-                                            if hasattr(dialog.entity, 'id'):
-                                                # Convert entity ID to channel format for comparison
-                                                if hasattr(dialog.entity, 'megagroup') or hasattr(dialog.entity, 'broadcast'):
-                                                    entity_channel_id = f"-100{dialog.entity.id}"
-                                                    if entity_channel_id == channel_id:
-                                                        channel_entity = dialog.entity
-                                                        logger.info(f"Found channel in dialogs: {channel_entity.title}")
-                                                        break
-                                        else:
-                                            raise ValueError(f"Channel {channel_id} not found in dialogs")
-                                    except Exception as dialog_error:
-                                        logger.error(f"Dialog search failed: {dialog_error}")
-                                        raise ve  # Re-raise original error
-                            else:
-                                raise ve
-                                
-                    except errors.UsernameNotOccupiedError:
-                        logger.error(f"Channel username {channel_id} does not exist or is invalid")
-                        total_errors += 1
-                        continue
-                    except errors.ChannelPrivateError:
-                        logger.error(f"Channel {channel_id} is private or bot is not a member")
-                        total_errors += 1
-                        continue
-                    except ValueError as ve:
-                        logger.warning(f"Channel {channel_id} entity not found. Bot may not be added to channel or channel may be private")
-                        logger.info(f"Skipping channel {channel_name} - ensure bot is added as admin")
-                        total_errors += 1
-                        continue
-                    except Exception as entity_error:
-                        logger.error(f"Cannot access channel {channel_id}: {entity_error}")
-                        logger.warning(f"Bot may need to be added to channel {channel_id} as admin")
-                        total_errors += 1
-                        continue
-                    
-                    # Get users who should have access to this specific channel
-                    authorized_users = await self.get_authorized_users_for_channel(channel_info['db_id'])
-                    
-                    # Convert authorized users to a set of IDs for fast O(1) lookup
-                    authorized_user_ids = set()
-                    if authorized_users:
-                        authorized_user_ids = {user_data['telegram_user_id'] for user_data in authorized_users}
-                    
-                    # Get users who should be banned from this specific channel
-                    banned_users = await self.get_banned_users_for_channel(channel_info['db_id'])
-                    
-                    # Process bans for this channel
-                    for user_data in banned_users:
-                        if await self.rate_limit_check():
-                            success = await self.safe_ban_user(
-                                channel_entity,
-                                user_data['telegram_user_id'],
-                                user_data['reason']
-                            )
-                            if success:
-                                total_bans += 1
-                            else:
-                                total_errors += 1
-                    
-                    # Process unbans for this channel  
-                    for user_data in authorized_users:
-                        if await self.rate_limit_check():
-                            success = await self.safe_unban_user(
-                                channel_entity,
-                                user_data['telegram_user_id'],
-                                user_data['reason']
-                            )
-                            if success:
-                                total_unbans += 1
-                            else:
-                                total_errors += 1
+                        channel_id, channel_info = pending.get_nowait()
+                    except asyncio.QueueEmpty:
+                        return
                     
-                    # NEW: Enforce unauthorized users - ban ALL users currently in channel who shouldn't be there
-                    unauthorized_bans, unauthorized_errors = await self.enforce_unauthorized_users(
-                        channel_entity, 
-                        channel_info['db_id'], 
-                        authorized_user_ids
-                    )
-                    total_unauthorized_bans += unauthorized_bans
-                    total_errors += unauthorized_errors
-                    
-                    # Log channel processing completion
-                    logger.info(f"Channel {channel_name} processed: {len(banned_users)} subscription bans, {len(authorized_users)} unbans, {unauthorized_bans} unauthorized bans")
-                    
-                except Exception as e:
-                    logger.error(f"Failed to process channel {channel_name}: {e}")
-                    total_errors += 1
-                    continue
+                    stats = await self.enforce_managed_channel(channel_id, channel_info)
+                    total_bans += stats['bans']
+                    total_unbans += stats['unbans']
+                    total_unauthorized_bans += stats['unauthorized_bans']
+                    total_errors += stats['errors']
+            
+            worker_count = min(self.max_concurrent_channels, pending.qsize())
+            await asyncio.gather(*(channel_worker() for _ in range(worker_count)))
             
             # Log cycle completion
             logger.info(f"Enforcement cycle completed: {total_bans} subscription bans, {total_unbans} unbans, {total_unauthorized_bans} unauthorized bans, {total_errors} errors")
@@ -792,33 +816,6 @@ class EnforcementBot:
         except Exception as e:
             logger.error(f"Enforcement cycle failed: {e}")
 
-    async def get_managed_channels(self):
-        """Get all channels that should be managed by the enforcement bot"""
-        try:
-            from app import app, db
-            from models import Channel
-            
-            with app.app_context():
-                # Get all active channels with telegram_channel_id configured
-                channels = Channel.query.filter(
-                    Channel.is_active == True,
-                    Channel.telegram_channel_id.isnot(None)
-                ).all()
-                
-                result = []
-                for channel in channels:
-                    result.append({
-                        'id': channel.id,
-                        'name': channel.name,
-                        'telegram_channel_id': channel.telegram_channel_id
-                    })
-                
-                return result
-            
-        except Exception as e:
-            logger.error(f"Failed to get managed channels: {e}")
-            return []
-
     async def list_accessible_channels(self):
         """List all channels/groups the bot can access for debugging"""
         try:
@@ -855,153 +852,149 @@ class EnforcementBot:
             logger.error(f"Failed to list accessible channels: {e}")
             return []
 
-    async def get_authorized_users_for_channel(self, channel_id: int):
-        """Get users who should have access to a specific channel"""
-        try:
-            from app import app, db
-            from models import User, Subscription, Plan, PlanChannel, Channel
-            from sqlalchemy import and_
+    def query_channel_entitlements(self):
+        """Active grants, expired grants and banned chat IDs (blocking - call through run_db)"""
+        from app import app, db
+        from models import User, Subscription, Plan, PlanChannel
+        from sqlalchemy import and_, or_
+        
+        with app.app_context():
+            now = datetime.utcnow()
+            not_banned = or_(User.is_banned == False, User.is_banned.is_(None))
+            
+            def plan_channel_rows(*conditions):
+                return db.session.query(
+                    PlanChannel.channel_id, User.telegram_chat_id, Plan.name
+                ).join(
+                    Subscription, Subscription.plan_id == PlanChannel.plan_id
+                ).join(
+                    User, User.id == Subscription.user_id
+                ).join(
+                    Plan, Plan.id == Subscription.plan_id
+                ).filter(
+                    not_banned,
+                    User.telegram_chat_id.isnot(None),
+                    *conditions
+                ).distinct().all()
+            
+            # Active paid subscriptions grant their plan's channels
+            active_rows = plan_channel_rows(
+                and_(Subscription.end_date > now, Subscription.is_paid == True)
+            )
             
-            with app.app_context():
-                # Get users with active subscriptions that include this channel
-                authorized_users = []
-                
-                # Get all active subscriptions
-                active_subscriptions = Subscription.query.filter(
-                    and_(
-                        Subscription.end_date > datetime.utcnow(),
-                        Subscription.is_paid == True
-                    )
+            # Expired or unpaid subscriptions revoke them unless another one still grants them
+            expired_rows = plan_channel_rows(
+                or_(Subscription.end_date < now, Subscription.is_paid == False)
+            )
+            
+            banned_chat_ids = [
+                chat_id for (chat_id,) in db.session.query(User.telegram_chat_id).filter(
+                    User.is_banned == True,
+                    User.telegram_chat_id.isnot(None)
                 ).all()
-                
-                for subscription in active_subscriptions:
-                    user = subscription.user
-                    plan = subscription.plan
-                    
-                    # Skip banned users
-                    if user.is_banned:
-                        continue
-                    
-                    # Check if user has telegram_chat_id
-                    if not user.telegram_chat_id or not user.telegram_chat_id.isdigit():
-                        continue
-                    
-                    telegram_user_id = int(user.telegram_chat_id)
-                    
-                    # Check if this plan includes the channel
-                    plan_has_channel = PlanChannel.query.filter(
-                        and_(
-                            PlanChannel.plan_id == plan.id,
-                            PlanChannel.channel_id == channel_id
-                        )
-                    ).first()
-                    
-                    if plan_has_channel:
-                        authorized_users.append({
-                            'user_id': user.id,
-                            'telegram_user_id': telegram_user_id,
-                            'username': user.telegram_username,
-                            'plan_name': plan.name,
-                            'reason': f'Active subscription: {plan.name}'
-                        })
-                
-                return authorized_users
+            ]
+            return active_rows, expired_rows, banned_chat_ids
+
+    async def check_channel_access(self, channel_id: str) -> Dict:
+        """Resolve a channel and report the bot's admin rights in it; the result is cached"""
+        try:
+            channel_entity = await self.entity_cache.get_entity(self.client, channel_id)
+            
+            # Get bot's permissions in the channel
+            permissions = await self.client.get_permissions(channel_entity, 'me')
+            
+            result = {
+                'success': True,
+                'has_access': permissions.is_admin if permissions else False,
+                'can_ban': permissions.ban_users if permissions else False,
+                'can_invite': permissions.invite_users if permissions else False,
+                'channel_title': getattr(channel_entity, 'title', 'Unknown'),
+                'channel_type': type(channel_entity).__name__,
+                'entity_id': getattr(channel_entity, 'id', 'Unknown')
+            }
             
+        except errors.ChannelPrivateError:
+            await self.entity_cache.invalidate(channel_id)
+            result = {
+                'success': False,
+                'error': 'Channel is private or bot is not a member'
+            }
+        except errors.UsernameNotOccupiedError:
+            result = {
+                'success': False,
+                'error': 'Channel username does not exist'
+            }
         except Exception as e:
-            logger.error(f"Failed to get authorized users for channel {channel_id}: {e}")
-            return []
+            result = {
+                'success': False,
+                'error': f'Failed to check channel access: {str(e)}'
+            }
+        
+        self.access_cache.put(channel_id, result)
+        return result
 
-    async def get_banned_users_for_channel(self, channel_id: int):
-        """Get users who should be banned from a specific channel"""
+    async def check_channels_access(self, channel_ids: List[str], progress=None) -> Dict[str, Dict]:
+        """Check many channels concurrently, at most max_concurrent_channels at a time"""
+        semaphore = asyncio.Semaphore(self.max_concurrent_channels)
+        done = 0
+        
+        async def check(channel_id):
+            nonlocal done
+            async with semaphore:
+                result = await self.check_channel_access(channel_id)
+            done += 1
+            if progress:
+                progress(done, len(channel_ids))
+            return channel_id, result
+        
+        return dict(await asyncio.gather(*(check(channel_id) for channel_id in channel_ids)))
+
+    async def refresh_channels_access(self, channel_ids: List[str]):
+        """Background refresh of stale access results; skips channels already being refreshed"""
+        claimed = self.access_cache.claim(channel_ids)
         try:
-            from app import app, db
-            from models import User, Subscription, Plan, PlanChannel, Channel
-            from sqlalchemy import and_, or_
-            
-            with app.app_context():
-                banned_users = []
-                
-                # Get users who are explicitly banned
-                banned_user_records = User.query.filter(User.is_banned == True).all()
-                
-                for user in banned_user_records:
-                    if user.telegram_chat_id and user.telegram_chat_id.isdigit():
-                        banned_users.append({
-                            'user_id': user.id,
-                            'telegram_user_id': int(user.telegram_chat_id),
-                            'username': user.telegram_username,
-                            'reason': 'User is banned'
-                        })
-                
-                # Get users with expired subscriptions for this channel
-                expired_subscriptions = Subscription.query.filter(
-                    or_(
-                        Subscription.end_date < datetime.utcnow(),
-                        Subscription.is_paid == False
-                    )
-                ).all()
-                
-                for subscription in expired_subscriptions:
-                    user = subscription.user
-                    plan = subscription.plan
-                    
-                    # Skip if user is already in banned list
-                    if user.is_banned:
-                        continue
-                    
-                    if not user.telegram_chat_id or not user.telegram_chat_id.isdigit():
-                        continue
-                    
-                    telegram_user_id = int(user.telegram_chat_id)
-                    
-                    # Check if this expired plan included the channel
-                    plan_had_channel = PlanChannel.query.filter(
-                        and_(
-                            PlanChannel.plan_id == plan.id,
-                            PlanChannel.channel_id == channel_id
-                        )
-                    ).first()
-                    
-                    if plan_had_channel:
-                        # Check if user has any other active subscription for this channel
-                        has_active_access = False
-                        active_subscriptions = Subscription.query.filter(
-                            and_(
-                                Subscription.user_id == user.id,
-                                Subscription.end_date > datetime.utcnow(),
-                                Subscription.is_paid == True
-                            )
-                        ).all()
-                        
-                        for active_sub in active_subscriptions:
-                            active_plan_has_channel = PlanChannel.query.filter(
-                                and_(
-                                    PlanChannel.plan_id == active_sub.plan_id,
-                                    PlanChannel.channel_id == channel_id
-                                )
-                            ).first()
-                            
-                            if active_plan_has_channel:
-                                has_active_access = True
-                                break
-                        
-                        # If no active access, user should be banned
-                        if not has_active_access:
-                            banned_users.append({
-                                'user_id': user.id,
-                                'telegram_user_id': telegram_user_id,
-                                'username': user.telegram_username,
-                                'reason': f'Subscription expired: {plan.name}'
-                            })
-                
-                return banned_users
+            if claimed:
+                await self.check_channels_access(claimed)
+                logger.info(f"Refreshed access checks for {len(claimed)} channels")
+        finally:
+            self.access_cache.release(claimed)
+
+    async def load_channel_entitlements(self) -> bool:
+        """Build every channel's authorized and to-ban users from three set-based queries"""
+        try:
+            active_rows, expired_rows, banned_chat_ids = await run_db(self.query_channel_entitlements)
+            
+            authorized: Dict[int, Dict[int, str]] = {}
+            for channel_db_id, chat_id, plan_name in active_rows:
+                if chat_id.isdigit():
+                    authorized.setdefault(channel_db_id, {}).setdefault(int(chat_id), f'Active subscription: {plan_name}')
+            
+            to_ban: Dict[int, Dict[int, str]] = {}
+            for channel_db_id, chat_id, plan_name in expired_rows:
+                if chat_id.isdigit() and int(chat_id) not in authorized.get(channel_db_id, {}):
+                    to_ban.setdefault(channel_db_id, {}).setdefault(int(chat_id), f'Subscription expired: {plan_name}')
+            
+            # Explicitly banned users are removed from every managed channel
+            banned_user_ids = {int(chat_id) for chat_id in banned_chat_ids if chat_id.isdigit()}
+            for channel_info in self.managed_channels.values():
+                channel_to_ban = to_ban.setdefault(channel_info['db_id'], {})
+                for user_id in banned_user_ids:
+                    channel_to_ban[user_id] = 'User is banned'
+            
+            self.authorized_by_channel = authorized
+            self.to_ban_by_channel = to_ban
+            logger.info(f"Loaded entitlements for {len(authorized)} channels, {len(banned_user_ids)} banned users")
+            return True
             
         except Exception as e:
-            logger.error(f"Failed to get banned users for channel {channel_id}: {e}")
-            return []
+            logger.error(f"Failed to load channel entitlements: {e}")
+            return False
 
     async def log_enforcement_stats(self, bans: int, unbans: int, errors: int):
         """Log enforcement cycle statistics"""
+        await run_db(self.write_enforcement_stats, bans, unbans, errors)
+    
+    def write_enforcement_stats(self, bans: int, unbans: int, errors: int):
         try:
             from app import app, db
             from models import BotLog
@@ -1049,20 +1042,28 @@ class EnforcementBot:
     async def stop(self):
         """Stop the bot gracefully"""
         self.running = False
+        if self.bus_token:
+            unsubscribe(self.bus_token)
+            self.bus_token = None
         if self.client:
             await self.client.disconnect()
         logger.info("Enforcement bot stopped")
     
-    async def manual_ban_user(self, user_id: int, reason: str = "Manual ban") -> Dict:
-        """Manually ban user from all channels"""
+    async def manual_action(self, action_type: str, user_id: int, reason: str, progress=None) -> Dict:
+        """Ban or unban a user in every managed channel, several channels at a time
+        
+        Every Telegram call still goes through the shared rate limiter; `progress`, if given,
+        is called as progress(done, total, message) whenever a channel completes.
+        """
         results = []
+        successful_key = f'successful_{action_type}s'
         
         if not self.client:
-            logger.error("Telegram client not initialized for manual ban")
+            logger.error(f"Telegram client not initialized for manual {action_type}")
             return {
                 'user_id': user_id,
                 'error': 'Telegram client not available',
-                'successful_bans': 0,
+                successful_key: 0,
                 'results': []
             }
         
@@ -1073,113 +1074,70 @@ class EnforcementBot:
                 return {
                     'user_id': user_id,
                     'error': 'No channels configured',
-                    'successful_bans': 0,
+                    successful_key: 0,
                     'results': []
                 }
         except Exception as e:
-            logger.error(f"Failed to sync channels for manual ban: {e}")
+            logger.error(f"Failed to sync channels for manual {action_type}: {e}")
             return {
                 'user_id': user_id,
                 'error': f'Failed to load channels: {str(e)}',
-                'successful_bans': 0,
+                successful_key: 0,
                 'results': []
             }
         
-        for channel_id, channel_info in self.managed_channels.items():
-            try:
-                channel_entity = await self.client.get_entity(channel_id)
-                success = await self.safe_ban_user(channel_entity, user_id, reason)
-                results.append({
-                    'channel': getattr(channel_entity, 'title', channel_info.get('name', 'Unknown')),
-                    'channel_id': channel_id,
-                    'success': success
-                })
-                
-                # Log the manual action
-                await self.log_action('manual_ban', user_id, channel_info.get('id', 0), reason)
+        channels = list(self.managed_channels.items())
+        
+        safe_action = self.safe_ban_user if action_type == 'ban' else self.safe_unban_user
+        semaphore = asyncio.Semaphore(self.max_concurrent_channels)
+        
+        async def apply(channel_id, channel_info):
+            async with semaphore:
+                try:
+                    channel_entity = await self.entity_cache.get_entity(self.client, channel_id)
+                    success = await safe_action(channel_entity, user_id, reason)
+                    result = {
+                        'channel': getattr(channel_entity, 'title', channel_info.get('name', 'Unknown')),
+                        'channel_id': channel_id,
+                        'success': success
+                    }
+                    
+                    # Log the manual action
+                    await self.log_action(f'manual_{action_type}', user_id, channel_info.get('db_id', 0), reason)
+                    
+                except Exception as e:
+                    logger.error(f"Failed to {action_type} user {user_id} in channel {channel_id}: {e}")
+                    result = {
+                        'channel': channel_info.get('name', channel_id),
+                        'channel_id': channel_id,
+                        'success': False,
+                        'error': str(e)
+                    }
                 
-            except Exception as e:
-                logger.error(f"Failed to ban user {user_id} from channel {channel_id}: {e}")
-                results.append({
-                    'channel': channel_info.get('name', channel_id),
-                    'channel_id': channel_id,
-                    'success': False,
-                    'error': str(e)
-                })
+                results.append(result)
+                if progress:
+                    successful = sum(1 for r in results if r['success'])
+                    progress(len(results), len(channels), f'{successful} successful')
+        
+        await asyncio.gather(*(apply(channel_id, channel_info) for channel_id, channel_info in channels))
         
-        successful_bans = sum(1 for r in results if r['success'])
-        logger.info(f"Manual ban user {user_id}: {successful_bans}/{len(results)} channels")
+        successful = sum(1 for r in results if r['success'])
+        logger.info(f"Manual {action_type} user {user_id}: {successful}/{len(results)} channels")
         
         return {
             'user_id': user_id,
             'total_channels': len(results),
-            'successful_bans': successful_bans,
+            successful_key: successful,
             'results': results
         }
     
+    async def manual_ban_user(self, user_id: int, reason: str = "Manual ban") -> Dict:
+        """Manually ban user from all channels"""
+        return await self.manual_action('ban', user_id, reason)
+    
     async def manual_unban_user(self, user_id: int, reason: str = "Manual unban") -> Dict:
         """Manually unban user from all channels"""
-        results = []
-        
-        if not self.client:
-            logger.error("Telegram client not initialized for manual unban")
-            return {
-                'user_id': user_id,
-                'error': 'Telegram client not available',
-                'successful_unbans': 0,
-                'results': []
-            }
-        
-        # Get current managed channels
-        try:
-            await self.sync_channels()
-            if not self.managed_channels:
-                return {
-                    'user_id': user_id,
-                    'error': 'No channels configured',
-                    'successful_unbans': 0,
-                    'results': []
-                }
-        except Exception as e:
-            logger.error(f"Failed to sync channels for manual unban: {e}")
-            return {
-                'user_id': user_id,
-                'error': f'Failed to load channels: {str(e)}',
-                'successful_unbans': 0,
-                'results': []
-            }
-        
-        for channel_id, channel_info in self.managed_channels.items():
-            try:
-                channel_entity = await self.client.get_entity(channel_id)
-                success = await self.safe_unban_user(channel_entity, user_id, reason)
-                results.append({
-                    'channel': getattr(channel_entity, 'title', channel_info.get('name', 'Unknown')),
-                    'channel_id': channel_id,
-                    'success': success
-                })
-                
-                # Log the manual action
-                await self.log_action('manual_unban', user_id, channel_info.get('id', 0), reason)
-                
-            except Exception as e:
-                logger.error(f"Failed to unban user {user_id} from channel {channel_id}: {e}")
-                results.append({
-                    'channel': channel_info.get('name', channel_id),
-                    'channel_id': channel_id,
-                    'success': False,
-                    'error': str(e)
-                })
-        
-        successful_unbans = sum(1 for r in results if r['success'])
-        logger.info(f"Manual unban user {user_id}: {successful_unbans}/{len(results)} channels")
-        
-        return {
-            'user_id': user_id,
-            'total_channels': len(results),
-            'successful_unbans': successful_unbans,
-            'results': results
-        }
+        return await self.manual_action('unban', user_id, reason)
 
 # Global bot instance
 enforcement_bot = None
@@ -1535,7 +1493,7 @@ def get_session_status() -> Dict:
         return {'success': False, 'error': str(e)}
 
 def check_bot_channel_access(channel_id: str) -> Dict:
-    """Check if bot has admin access to a specific channel"""
+    """Check if bot has admin access to a specific channel (always a fresh check)"""
     try:
         global enforcement_bot
         
@@ -1545,90 +1503,18 @@ def check_bot_channel_access(channel_id: str) -> Dict:
                 'error': 'Enforcement bot not initialized. Configure Telegram API credentials first.'
             }
         
-        # Check if bot has a client initialized
-        if not hasattr(enforcement_bot.client, '_loop') or enforcement_bot.client._loop is None:
+        import bot_gateway
+        if not bot_gateway.is_available():
             return {
                 'success': False,
                 'error': 'Enforcement bot client not properly initialized'
             }
         
-        # Use the bot's existing event loop
-        bot_loop = enforcement_bot.client._loop
-        
-        # Handle event loop properly for Flask/threading environment
-        async def check_access():
-            try:
-                # Get channel entity with improved resolution
-                channel_entity = None
-                
-                try:
-                    channel_entity = await enforcement_bot.client.get_entity(channel_id)
-                except ValueError as ve:
-                    if "Cannot find any entity" in str(ve):
-                        logger.info(f"Direct lookup failed for {channel_id}, searching in dialogs...")
-                        
-                        # Search in dialogs
-                        async for dialog in enforcement_bot.client.iter_dialogs():
-                            if hasattr(dialog.entity, 'id'):
-                                if hasattr(dialog.entity, 'megagroup') or hasattr(dialog.entity, 'broadcast'):
-                                    entity_channel_id = f"-100{dialog.entity.id}"
-                                    if entity_channel_id == channel_id:
-                                        channel_entity = dialog.entity
-                                        logger.info(f"Found channel in dialogs: {channel_entity.title}")
-                                        break
-                        
-                        if not channel_entity:
-                            raise ValueError(f"Channel {channel_id} not found in accessible channels")
-                    else:
-                        raise ve
-                
-                if not channel_entity:
-                    return {
-                        'success': False,
-                        'error': 'Channel entity could not be resolved'
-                    }
-                
-                # Get bot's permissions in the channel
-                permissions = await enforcement_bot.client.get_permissions(channel_entity, 'me')
-                
-                # Check if bot has admin rights
-                has_admin = permissions.is_admin if permissions else False
-                can_ban = permissions.ban_users if permissions else False
-                can_invite = permissions.invite_users if permissions else False
-                
-                return {
-                    'success': True,
-                    'has_access': has_admin,
-                    'can_ban': can_ban,
-                    'can_invite': can_invite,
-                    'channel_title': getattr(channel_entity, 'title', 'Unknown'),
-                    'channel_type': type(channel_entity).__name__,
-                    'entity_id': getattr(channel_entity, 'id', 'Unknown')
-                }
-                
-            except errors.ChannelPrivateError:
-                return {
-                    'success': False,
-                    'error': 'Channel is private or bot is not a member'
-                }
-            except errors.UsernameNotOccupiedError:
-                return {
-                    'success': False,
-                    'error': 'Channel username does not exist'
-                }
-            except Exception as e:
-                return {
-                    'success': False,
-                    'error': f'Failed to check channel access: {str(e)}'
-                }
-        
-        # Use asyncio.run_coroutine_threadsafe to submit the coroutine to the bot's event loop
+        # Run on the bot's own event loop through the command gateway
         import concurrent.futures
         
-        future = asyncio.run_coroutine_threadsafe(check_access(), bot_loop)
         try:
-            result = future.result(timeout=30)
-            return result
+            return bot_gateway.call(enforcement_bot.check_channel_access, channel_id, timeout=30)
         except concurrent.futures.TimeoutError:
             return {
                 'success': False,
@@ -1643,16 +1529,46 @@ def check_bot_channel_access(channel_id: str) -> Dict:
         }
 
 def bulk_check_channels() -> Dict:
-    """Check bot access for all channels in database"""
+    """Check bot access for all channels in database
+    
+    Served from the bot's access cache; channels never checked are checked concurrently
+    before returning, stale ones are refreshed on the bot loop in the background.
+    """
     try:
         from models import Channel
-        from app import db
+        import bot_gateway
+        import concurrent.futures
         
         channels = Channel.query.filter(Channel.telegram_channel_id.isnot(None)).all()
-        results = []
         
+        if not bot_gateway.is_available():
+            return {
+                'success': False,
+                'error': 'Enforcement bot not initialized. Configure Telegram API credentials first.'
+            }
+        bot = bot_gateway.get_bot()
+        
+        channel_ids = list(dict.fromkeys(channel.telegram_channel_id for channel in channels))
+        missing = [channel_id for channel_id in channel_ids if bot.access_cache.get(channel_id) is None]
+        stale = [channel_id for channel_id in channel_ids
+                 if channel_id not in missing and bot.access_cache.is_stale(channel_id)]
+        
+        if missing:
+            try:
+                bot_gateway.call(bot.check_channels_access, missing, timeout=60)
+            except concurrent.futures.TimeoutError:
+                logger.warning(f"Access check for {len(missing)} channels still running")
+        if stale:
+            bot_gateway.submit(bot.refresh_channels_access, stale)
+        
+        results = []
         for channel in channels:
-            access_result = check_bot_channel_access(channel.telegram_channel_id)
+            cached = bot.access_cache.get(channel.telegram_channel_id)
+            if cached:
+                access_result, checked_at = cached
+                access_result = dict(access_result, checked_at=datetime.utcfromtimestamp(checked_at).isoformat())
+            else:
+                access_result = {'success': False, 'error': 'Channel access check timed out'}
             results.append({
                 'channel_id': channel.id,
                 'channel_name': channel.name,
@@ -1663,6 +1579,7 @@ def bulk_check_channels() -> Dict:
         return {
             'success': True,
             'total_channels': len(channels),
+            'refreshing': len(stale),
             'results': results
         }
         
@@ -8,16 +8,27 @@ import time
 import asyncio
 import logging
 import threading
-import random
 from datetime import datetime, timedelta
 from typing import List, Dict, Set, Optional
 
-from telethon import TelegramClient, errors
+from telethon import TelegramClient, errors, events, utils
 from telethon.tl.functions.channels import EditBannedRequest, GetParticipantsRequest
-from telethon.tl.types import ChatBannedRights, ChannelParticipantsSearch, ChannelParticipantsAdmins
-from sqlalchemy import create_engine
+from telethon.tl.types import (
+    ChatBannedRights, ChannelParticipantAdmin, ChannelParticipantCreator, ChannelParticipantsKicked
+)
+from sqlalchemy import create_engine, or_
 from sqlalchemy.orm import sessionmaker
 
+from db_executor import run_db
+from enforcement_state import ChannelSnapshot, load_channel_snapshots, persist_channel_snapshot
+from entitlement_bus import SubscriptionActivated, SubscriptionEnded, UserBanChanged, subscribe, unsubscribe
+from expiry_scheduler import ExpiryScheduler
+from log_sink import WriteBehindLogSink
+from action_queue import PendingActionQueue
+from entity_cache import BotCapabilityCache, ChannelEntityCache
+from rate_limiter import AIMDRateController
+from whitelist import IncrementalWhitelist
+
 logger = logging.getLogger(__name__)
 
 class EnforcementBotV2:
@@ -34,19 +45,35 @@ class EnforcementBotV2:
         self.client = None
         self.running = False
         self.managed_channels = {}
-        self.whitelisted_users = set()
         
-        # Enhanced rate limiting for scalability
-        self.base_delay = 1.0  # Base delay between actions
-        self.max_delay = 3.0   # Max delay for regular actions
-        self.flood_delay_min = 10  # Min delay after flood error
-        self.flood_delay_max = 30  # Max delay after flood error
+        # Admins + active subscribers, kept current from subscription change events
+        self.whitelist = IncrementalWhitelist()
+        self.whitelisted_users = self.whitelist.members
+        
+        # Channel db_id -> Telegram IDs with an active subscription covering it
+        self.access_matrix: Dict[int, frozenset] = {}
+        
+        # Channel db_id -> snapshot applied at the end of the last cycle
+        self.bot_name = 'enforcement_bot_v2'
+        self.channel_snapshots: Dict[int, ChannelSnapshot] = {}
+        
+        # Adaptive rate limiting shared by all channel workers: rates per
+        # Telegram method and per channel creep up while calls succeed and
+        # halve on every FloodWaitError
+        self.rate_controller = AIMDRateController(
+            initial_rate=1.0,               # 60 calls/minute across all channels
+            max_rate=2.0,
+            min_rate=5 / 60,
+            per_chat_initial_rate=20 / 60,  # 20 calls/minute per channel
+            per_chat_max_rate=40 / 60,
+            increase_step=2 / 60,
+            decrease_factor=0.5,
+            burst=3
+        )
         
-        # Performance tracking
-        self.actions_this_minute = 0
-        self.max_actions_per_minute = 20  # Conservative limit
-        self.minute_start = time.time()
-        self.last_action_time = 0
+        # Channels enforced in parallel; participant fetches overlap across them
+        self.max_concurrent_channels = 8
+        self.participants_page_size = 200  # Users per GetParticipants request
         
         # Database setup
         self.Session = None
@@ -58,6 +85,37 @@ class EnforcementBotV2:
         # Enforcement interval (seconds)
         self.scan_interval = 300  # 5 minutes
         
+        # Real-time mode: joins are enforced from ChatAction updates and, while the
+        # expiry scheduler revokes expired subscriptions, the full sweep only runs as
+        # a low-frequency reconciliation pass
+        self.realtime_enabled = True
+        self.reconcile_interval = 3600  # 1 hour
+        
+        # Marked Telegram peer ID (-100...) -> managed channel_id, filled as channels resolve
+        self.entity_channels: Dict[int, str] = {}
+        self.entity_cache = ChannelEntityCache(self.bot_name)
+        self.capabilities = BotCapabilityCache()
+        self.bot_id = None
+        
+        # Fires revocations at each subscription's end_date
+        self.expiry_scheduler = ExpiryScheduler(self.expire_subscription)
+        self.expiry_task = None
+        
+        # BotLog/BotAction rows are bulk-inserted off the event loop
+        self.log_sink = WriteBehindLogSink(flush_rows=100, flush_interval_ms=1000,
+                                           preprocessors={'BotAction': self.resolve_action_users})
+        self.log_task = None
+        
+        # Entitlement bus subscription; handlers hop onto this loop
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.bus_token = None
+        
+        # FloodWait-failed bans/unbans, replayed once their retry-after time passes
+        self.action_queue = PendingActionQueue(self.bot_name)
+        self.retry_task = None
+        self.retry_wakeup: Optional[asyncio.Event] = None
+        self.retry_poll_interval = 300  # Upper bound on sleeps between queue checks
+        
     def setup_database(self):
         """Setup database connection"""
         try:
@@ -79,12 +137,23 @@ class EnforcementBotV2:
             self.client = TelegramClient('enforcement_bot_v2', int(self.api_id), self.api_hash)
             await self.client.start(bot_token=self.bot_token)
             
-            me = await self.client.get_me()
+            me = await self.capabilities.get_me(self.client)
+            self.bot_id = me.id
             logger.info(f"Enforcement bot initialized as: {me.first_name} (@{me.username})")
             
+            if self.realtime_enabled:
+                self.client.add_event_handler(self.on_chat_action, events.ChatAction())
+                logger.info("Real-time join enforcement enabled")
+            
             # Load configuration
             await self.sync_channels()
             await self.load_whitelisted_users()
+            self.channel_snapshots = await run_db(load_channel_snapshots, self.bot_name)
+            await self.seed_expiry_scheduler()
+            
+            # React to payments, grants, cancellations and admin bans as they happen
+            self.loop = asyncio.get_running_loop()
+            self.bus_token = subscribe(self.on_entitlement_event)
             
             return True
             
@@ -92,113 +161,124 @@ class EnforcementBotV2:
             logger.error(f"Bot initialization failed: {e}")
             return False
     
+    def query_managed_channels(self) -> Dict[str, Dict]:
+        """Active channels with a Telegram ID (blocking - call through run_db)"""
+        from app import app
+        from models import Channel
+        
+        with app.app_context():
+            channels = Channel.query.filter(
+                Channel.is_active == True,
+                Channel.telegram_channel_id.isnot(None)
+            ).all()
+            
+            managed_channels = {}
+            for channel in channels:
+                channel_id = channel.telegram_channel_id.strip()
+                if channel_id:
+                    managed_channels[channel_id] = {
+                        'name': channel.name,
+                        'db_id': channel.id
+                    }
+            return managed_channels
+    
     async def sync_channels(self):
         """Load managed channels from database"""
         try:
-            from app import app, db
-            from models import Channel
-            
-            with app.app_context():
-                channels = Channel.query.filter(
-                    Channel.is_active == True,
-                    Channel.telegram_channel_id.isnot(None)
-                ).all()
-                
-                old_count = len(self.managed_channels)
-                self.managed_channels = {}
-                
-                for channel in channels:
-                    channel_id = channel.telegram_channel_id.strip()
-                    if channel_id:
-                        self.managed_channels[channel_id] = {
-                            'name': channel.name,
-                            'db_id': channel.id
-                        }
-                
-                logger.info(f"Synced {len(self.managed_channels)} channels (was {old_count})")
+            old_count = len(self.managed_channels)
+            self.managed_channels = await run_db(self.query_managed_channels)
+            logger.info(f"Synced {len(self.managed_channels)} channels (was {old_count})")
                 
         except Exception as e:
             logger.error(f"Channel sync failed: {e}")
     
     async def load_whitelisted_users(self):
-        """Load users who should never be banned"""
+        """Bring the whitelist up to date; a full reload only happens on detected drift"""
+        if not await run_db(self.whitelist.refresh):
+            logger.warning("⚠ Whitelist refresh failed - keeping the previous set")
+    
+    def query_access_grants(self) -> List[tuple]:
+        """(channel db_id, telegram_chat_id) for every active paid grant (blocking - call through run_db)"""
+        from app import app, db
+        from models import User, Subscription, PlanChannel
+        
+        with app.app_context():
+            return db.session.query(
+                PlanChannel.channel_id,
+                User.telegram_chat_id
+            ).join(
+                Subscription, Subscription.plan_id == PlanChannel.plan_id
+            ).join(
+                User, User.id == Subscription.user_id
+            ).filter(
+                Subscription.end_date > datetime.utcnow(),
+                Subscription.is_paid == True,
+                User.telegram_chat_id.isnot(None),
+                or_(User.is_banned == False, User.is_banned.is_(None))
+            ).distinct().all()
+    
+    async def load_access_matrix(self) -> bool:
+        """Build the channel -> authorized users matrix with a single joined query"""
         try:
-            from app import app, db
-            from models import User, Admin, Subscription
-            from sqlalchemy import and_
+            rows = await run_db(self.query_access_grants)
             
-            with app.app_context():
-                whitelisted_ids = set()
-                
-                # Add admin users
-                try:
-                    admins = Admin.query.filter(Admin.is_active == True).all()
-                    for admin in admins:
-                        if hasattr(admin, 'telegram_chat_id') and admin.telegram_chat_id and admin.telegram_chat_id.isdigit():
-                            whitelisted_ids.add(int(admin.telegram_chat_id))
-                except Exception as e:
-                    logger.warning(f"Could not load admin users: {e}")
-                
-                # Add users with active subscriptions
-                try:
-                    active_subscriptions = Subscription.query.filter(
-                        and_(
-                            Subscription.end_date > datetime.utcnow(),
-                            Subscription.is_paid == True
-                        )
-                    ).all()
-                    
-                    for subscription in active_subscriptions:
-                        user = subscription.user
-                        if user.telegram_chat_id and user.telegram_chat_id.isdigit():
-                            whitelisted_ids.add(int(user.telegram_chat_id))
-                            
-                except Exception as e:
-                    logger.warning(f"Could not load active subscribers: {e}")
-                
-                self.whitelisted_users = whitelisted_ids
-                logger.info(f"Loaded {len(self.whitelisted_users)} whitelisted users")
+            matrix = {}
+            for channel_db_id, telegram_chat_id in rows:
+                if telegram_chat_id.isdigit():
+                    matrix.setdefault(channel_db_id, set()).add(int(telegram_chat_id))
+            
+            self.access_matrix = {
+                channel_db_id: frozenset(user_ids)
+                for channel_db_id, user_ids in matrix.items()
+            }
+            logger.info(f"Built access matrix: {len(rows)} grants across {len(self.access_matrix)} channels")
+            return True
             
         except Exception as e:
-            logger.error(f"Failed to load whitelisted users: {e}")
-            self.whitelisted_users = set()
-    
-    async def smart_delay(self, is_flood_recovery=False):
-        """Implement intelligent rate limiting with randomization"""
-        current_time = time.time()
-        
-        # Reset counter every minute
-        if current_time - self.minute_start >= 60:
-            self.actions_this_minute = 0
-            self.minute_start = current_time
-        
-        # Check rate limit
-        if self.actions_this_minute >= self.max_actions_per_minute:
-            wait_time = 60 - (current_time - self.minute_start)
-            logger.warning(f"Rate limit reached, waiting {wait_time:.1f}s")
-            await asyncio.sleep(wait_time)
-            self.actions_this_minute = 0
-            self.minute_start = time.time()
-        
-        # Apply delay based on context
-        if is_flood_recovery:
-            # Longer randomized delay after flood errors
-            delay = random.uniform(self.flood_delay_min, self.flood_delay_max)
-            logger.info(f"Flood recovery delay: {delay:.1f}s")
-        else:
-            # Regular randomized delay
-            delay = random.uniform(self.base_delay, self.max_delay)
-        
-        # Ensure minimum time between actions
-        time_since_last = current_time - self.last_action_time
-        if time_since_last < delay:
-            await asyncio.sleep(delay - time_since_last)
+            logger.error(f"Failed to build access matrix: {e}")
+            return False
+    
+    async def smart_delay(self, chat_id=None, method: str = 'EditBannedRequest'):
+        """Wait for the adaptive rate controller before a Telegram call"""
+        await self.rate_controller.acquire(method, chat_id)
+    
+    def record_flood_wait(self, method: str, chat_id, seconds: int):
+        """Back off the method/channel rate and block it for the server-given wait"""
+        self.rate_controller.record_flood(method, chat_id, seconds)
+        state = self.rate_controller.state_for(method)
+        logger.warning(f"⚠ Flood wait {seconds}s on {method} - rate now {state.rate * 60:.1f}/min")
+    
+    def get_rate_stats(self) -> Dict:
+        """Current adaptive rates, back-offs and recovery times"""
+        return self.rate_controller.stats()
+    
+    def channel_db_id_for(self, channel_entity) -> Optional[int]:
+        """Database ID of a managed channel from its Telegram entity"""
+        channel_id = self.entity_channels.get(utils.get_peer_id(channel_entity))
+        channel_info = self.managed_channels.get(channel_id) if channel_id else None
+        return channel_info['db_id'] if channel_info else None
+    
+    async def queue_retry(self, action_type: str, channel_entity, user_id: int, reason: str,
+                    wait_seconds: int, error_msg: str) -> bool:
+        """Hand a flood-blocked action to the retry worker instead of dropping it"""
+        channel_db_id = self.channel_db_id_for(channel_entity)
+        if channel_db_id is None:
+            return False
         
-        self.last_action_time = time.time()
-        self.actions_this_minute += 1
+        queued = await run_db(self.action_queue.enqueue, action_type, user_id, channel_db_id, reason, wait_seconds, error_msg)
+        if queued:
+            logger.info(f"↻ Queued {action_type} of user {user_id} in {channel_entity.title} for retry in {wait_seconds}s")
+            if self.retry_wakeup:
+                self.retry_wakeup.set()
+        return queued
     
-    async def safe_ban_user(self, channel_entity, user_id: int, reason: str = "Unauthorized access") -> Dict:
-        """Safely ban user with comprehensive error handling"""
+    async def safe_ban_user(self, channel_entity, user_id: int, reason: str = "Unauthorized access",
+                            protect_subscribers: bool = True) -> Dict:
+        """Safely ban user with comprehensive error handling
+        
+        Admins are never banned. Subscribers (whitelisted through any plan) are only banned
+        with protect_subscribers=False, by callers that checked this channel's grants.
+        """
         result = {
             'success': False,
             'user_id': user_id,
@@ -208,13 +288,13 @@ class EnforcementBotV2:
         }
         
         try:
-            await self.smart_delay()
-            
             # Skip if user is whitelisted
-            if user_id in self.whitelisted_users:
+            if user_id in self.whitelist.admin_ids or (protect_subscribers and user_id in self.whitelisted_users):
                 result['error'] = 'User is whitelisted'
                 return result
             
+            await self.smart_delay(channel_entity.id)
+            
             if self.dry_run:
                 logger.info(f"DRY-RUN: Would ban user {user_id} from {channel_entity.title} - {reason}")
                 result['success'] = True
@@ -233,22 +313,23 @@ class EnforcementBotV2:
                 embed_links=True
             )
             
+            started = time.monotonic()
             await self.client(EditBannedRequest(
                 channel=channel_entity,
                 participant=user_id,
                 banned_rights=banned_rights
             ))
             
+            self.rate_controller.record_success('EditBannedRequest', channel_entity.id)
             logger.info(f"✓ Banned user {user_id} from {channel_entity.title} - {reason}")
             result['success'] = True
-            await self.log_action("ban", user_id, channel_entity.id, reason, True)
+            self.log_action("ban", user_id, channel_entity, reason, True, execution_ms=int((time.monotonic() - started) * 1000))
             
         except errors.FloodWaitError as e:
             error_msg = f"Flood wait: {e.seconds}s"
             result['error'] = error_msg
-            logger.warning(f"⚠ {error_msg} - backing off")
-            await asyncio.sleep(e.seconds)
-            await self.smart_delay(is_flood_recovery=True)
+            self.record_flood_wait('EditBannedRequest', channel_entity.id, e.seconds)
+            result['queued'] = await self.queue_retry('ban', channel_entity, user_id, reason, e.seconds, error_msg)
             
         except errors.UserAdminInvalidError:
             error_msg = "Cannot ban admin user"
@@ -264,12 +345,15 @@ class EnforcementBotV2:
             error_msg = "Bot lacks admin permissions"
             result['error'] = error_msg
             logger.error(f"✗ Bot lacks admin permissions in {channel_entity.title}")
+            channel_id = self.entity_channels.get(utils.get_peer_id(channel_entity))
+            if channel_id:
+                self.capabilities.invalidate(channel_id)
             
         except Exception as e:
             error_msg = f"Unexpected error: {str(e)}"
             result['error'] = error_msg
             logger.error(f"✗ Failed to ban user {user_id}: {e}")
-            await self.log_action("ban", user_id, channel_entity.id, reason, False, str(e))
+            self.log_action("ban", user_id, channel_entity, reason, False, str(e))
         
         return result
     
@@ -284,7 +368,7 @@ class EnforcementBotV2:
         }
         
         try:
-            await self.smart_delay()
+            await self.smart_delay(channel_entity.id)
             
             if self.dry_run:
                 logger.info(f"DRY-RUN: Would unban user {user_id} from {channel_entity.title} - {reason}")
@@ -304,60 +388,92 @@ class EnforcementBotV2:
                 embed_links=False
             )
             
+            started = time.monotonic()
             await self.client(EditBannedRequest(
                 channel=channel_entity,
                 participant=user_id,
                 banned_rights=unbanned_rights
             ))
             
+            self.rate_controller.record_success('EditBannedRequest', channel_entity.id)
             logger.info(f"✓ Unbanned user {user_id} from {channel_entity.title} - {reason}")
             result['success'] = True
-            await self.log_action("unban", user_id, channel_entity.id, reason, True)
+            self.log_action("unban", user_id, channel_entity, reason, True, execution_ms=int((time.monotonic() - started) * 1000))
             
         except errors.FloodWaitError as e:
             error_msg = f"Flood wait: {e.seconds}s"
             result['error'] = error_msg
-            logger.warning(f"⚠ {error_msg} - backing off")
-            await asyncio.sleep(e.seconds)
-            await self.smart_delay(is_flood_recovery=True)
+            self.record_flood_wait('EditBannedRequest', channel_entity.id, e.seconds)
+            result['queued'] = await self.queue_retry('unban', channel_entity, user_id, reason, e.seconds, error_msg)
             
         except Exception as e:
             error_msg = f"Unban error: {str(e)}"
             result['error'] = error_msg
             logger.error(f"✗ Failed to unban user {user_id}: {e}")
-            await self.log_action("unban", user_id, channel_entity.id, reason, False, str(e))
+            self.log_action("unban", user_id, channel_entity, reason, False, str(e))
         
         return result
     
-    async def get_channel_participants(self, channel_entity) -> Set[int]:
-        """Get all channel participants efficiently"""
+    @staticmethod
+    def participant_role(user) -> str:
+        """Classify a participant as 'creator', 'admin', 'bot' or 'member' from the same page"""
+        participant = getattr(user, 'participant', None)
+        if isinstance(participant, ChannelParticipantCreator):
+            return 'creator'
+        if isinstance(participant, ChannelParticipantAdmin):
+            return 'admin'
+        if user.bot:
+            return 'bot'
+        return 'member'
+    
+    async def iter_classified_participants(self, channel_entity):
+        """Stream (user_id, role) for every member in a single GetParticipants pass
+        
+        Raises if the scan fails part-way so callers can tell it from a complete one.
+        """
         try:
-            participants = set()
+            await self.smart_delay(channel_entity.id, method='GetParticipants')
             
-            # Get participants in batches for efficiency
-            async for participant in self.client.iter_participants(channel_entity):
-                if not participant.bot:  # Skip bots
-                    participants.add(participant.id)
+            index = 0
+            async for user in self.client.iter_participants(channel_entity):
+                index += 1
+                # Pace every page request, not just the first
+                if index % self.participants_page_size == 0:
+                    await self.smart_delay(channel_entity.id, method='GetParticipants')
+                yield user.id, self.participant_role(user)
             
-            return participants
+            self.rate_controller.record_success('GetParticipants', channel_entity.id)
             
-        except Exception as e:
-            logger.error(f"Failed to get participants for {channel_entity.title}: {e}")
-            return set()
+        except errors.FloodWaitError as e:
+            self.record_flood_wait('GetParticipants', channel_entity.id, e.seconds)
+            raise
+            
+        except errors.ChannelPrivateError:
+            logger.error(f"✗ Channel {channel_entity.title} is private or the bot was removed")
+            channel_id = self.entity_channels.get(utils.get_peer_id(channel_entity))
+            if channel_id:
+                await self.entity_cache.invalidate(channel_id)
+            raise
     
-    async def get_channel_admins(self, channel_entity) -> Set[int]:
-        """Get channel admin user IDs"""
+    async def query_banned_members(self, channel_entity) -> Set[int]:
+        """Everyone currently banned from a channel, including bans from before tracking started"""
         try:
-            admins = set()
+            await self.smart_delay(channel_entity.id, method='GetParticipants')
             
-            async for admin in self.client.iter_participants(channel_entity, filter=ChannelParticipantsAdmins):
-                admins.add(admin.id)
+            banned = set()
+            index = 0
+            async for user in self.client.iter_participants(channel_entity, filter=ChannelParticipantsKicked):
+                index += 1
+                if index % self.participants_page_size == 0:
+                    await self.smart_delay(channel_entity.id, method='GetParticipants')
+                banned.add(user.id)
             
-            return admins
+            self.rate_controller.record_success('GetParticipants', channel_entity.id)
+            return banned
             
-        except Exception as e:
-            logger.error(f"Failed to get admins for {channel_entity.title}: {e}")
-            return set()
+        except errors.FloodWaitError as e:
+            self.record_flood_wait('GetParticipants', channel_entity.id, e.seconds)
+            raise
     
     async def enforce_channel_access(self, channel_id: str, channel_info: Dict) -> Dict:
         """Enforce access control for a single channel"""
@@ -367,58 +483,158 @@ class EnforcementBotV2:
             'bans': 0,
             'unbans': 0,
             'errors': 0,
+            'queued': 0,
             'skipped_admins': 0
         }
         
         try:
             # Get channel entity
             try:
-                channel_entity = await self.client.get_entity(channel_id)
+                channel_entity = await self.entity_cache.get_entity(self.client, channel_id)
             except Exception as e:
                 logger.error(f"✗ Cannot access channel {channel_id}: {e}")
                 stats['errors'] += 1
                 return stats
             
             logger.info(f"🔍 Processing channel: {channel_entity.title} ({channel_id})")
+            self.entity_channels[utils.get_peer_id(channel_entity)] = channel_id
             
-            # Get current participants and admins
-            all_participants = await self.get_channel_participants(channel_entity)
-            channel_admins = await self.get_channel_admins(channel_entity)
+            # Without ban rights every action would fail - don't page the channel at all
+            if not await self.capabilities.has_ban_rights(self.client, channel_id, channel_entity):
+                logger.warning(f"⚠ Bot lacks ban rights in {channel_entity.title} - skipping")
+                stats['errors'] += 1
+                return stats
             
             # Get bot's own ID to avoid self-ban
-            me = await self.client.get_me()
-            bot_id = me.id
+            bot_id = await self.capabilities.get_bot_id(self.client)
             
-            # Combine all protected users
-            protected_users = self.whitelisted_users | channel_admins | {bot_id}
+            # Admins are only known once the participant scan reaches them
+            db_id = channel_info['db_id']
+            allowed_users = self.whitelisted_users | {bot_id} | self.access_matrix.get(db_id, frozenset())
             
-            logger.info(f"📊 Channel stats: {len(all_participants)} participants, {len(channel_admins)} admins, {len(self.whitelisted_users)} whitelisted")
+            # Only act on what changed since the last applied snapshot
+            snapshot = self.channel_snapshots.get(db_id) or ChannelSnapshot()
+            # Real-time, expiry and retry handlers keep updating the live snapshot during the sweep
+            sweep_start = snapshot.copy()
+            revoked_users = snapshot.newly_revoked(allowed_users)
+            # Only grants for this channel lift a ban: expiry bans subscribers of other plans too
+            channel_access = self.whitelist.admin_ids | self.access_matrix.get(db_id, frozenset())
+            unban_candidates = channel_access & snapshot.banned
             
-            # Process each participant
-            for user_id in all_participants:
-                # Skip protected users
-                if user_id in protected_users:
-                    if user_id in channel_admins:
-                        stats['skipped_admins'] += 1
-                    continue
-                
-                # Check if user should have access
-                if await self.user_has_channel_access(user_id, channel_info['db_id']):
-                    # User should have access - unban if needed
-                    result = await self.safe_unban_user(channel_entity, user_id, "Active subscription")
-                    if result['success']:
-                        stats['unbans'] += 1
-                    elif result['error']:
-                        stats['errors'] += 1
+            banned = set(snapshot.banned)
+            if not snapshot.exists:
+                # First cycle: lift every existing ban on users who have access, like V1's full
+                # unban pass. Without the ban list the snapshot must not be created yet.
+                try:
+                    pre_tracking = await self.query_banned_members(channel_entity) & channel_access
+                except Exception as e:
+                    logger.error(f"✗ Cannot list banned members of {channel_entity.title}: {e}")
+                    stats['errors'] += 1
+                    return stats
+                unban_candidates |= pre_tracking
+                banned |= pre_tracking  # Failed unbans stay recorded and are retried next cycle
+            failed_bans = set()
+            failed_unbans = set()
+            
+            # Restore users whose access came back since we banned them
+            for user_id in unban_candidates:
+                result = await self.safe_unban_user(channel_entity, user_id, "Active subscription")
+                if result['success']:
+                    stats['unbans'] += 1
+                    banned.discard(user_id)
+                elif result.get('queued'):
+                    stats['queued'] += 1
                 else:
-                    # User should not have access - ban them
+                    stats['errors'] += 1
+                    failed_unbans.add(user_id)
+            
+            # Bans run in a consumer task so they overlap with fetching the next page
+            ban_queue = asyncio.Queue()
+            
+            async def ban_worker():
+                while True:
+                    user_id = await ban_queue.get()
+                    if user_id is None:
+                        return
+                    
                     result = await self.safe_ban_user(channel_entity, user_id, "No active subscription")
                     if result['success']:
                         stats['bans'] += 1
-                    elif result['error'] and 'whitelisted' not in result['error']:
-                        stats['errors'] += 1
+                        banned.add(user_id)
+                    elif result.get('queued'):
+                        stats['queued'] += 1
+                    else:
+                        failed_bans.add(user_id)
+                        if result['error'] and 'whitelisted' not in result['error']:
+                            stats['errors'] += 1
             
-            logger.info(f"✅ Channel {channel_entity.title}: {stats['bans']} bans, {stats['unbans']} unbans, {stats['skipped_admins']} admin skips, {stats['errors']} errors")
+            all_participants = set()
+            channel_admins = set()
+            ban_candidates = 0
+            scan_complete = False
+            worker = asyncio.create_task(ban_worker())
+            
+            try:
+                async for user_id, role in self.iter_classified_participants(channel_entity):
+                    if role == 'bot':
+                        continue
+                    all_participants.add(user_id)
+                    is_admin = role in ('admin', 'creator')
+                    if is_admin:
+                        channel_admins.add(user_id)
+                    
+                    # Ban new joiners and newly expired members without access
+                    if user_id in snapshot.participants and user_id not in revoked_users:
+                        continue
+                    if is_admin:
+                        stats['skipped_admins'] += 1
+                        continue
+                    if user_id in allowed_users:
+                        continue
+                    
+                    ban_candidates += 1
+                    ban_queue.put_nowait(user_id)
+                
+                scan_complete = True
+                
+            except Exception as e:
+                logger.error(f"Failed to get participants for {channel_entity.title}: {e}")
+                stats['errors'] += 1
+                
+            finally:
+                ban_queue.put_nowait(None)
+                await worker
+            
+            logger.info(f"📊 Channel stats: {len(all_participants)} participants, {len(channel_admins)} admins, "
+                       f"{len(self.whitelisted_users)} whitelisted, {ban_candidates} to ban, {len(unban_candidates)} to restore")
+            
+            # Failed actions stay out of the snapshot so the next cycle retries them;
+            # queued ones are left to the retry worker. After a partial scan only the
+            # bans/unbans are recorded and the rest is re-diffed next cycle.
+            if scan_complete:
+                new_snapshot = ChannelSnapshot(
+                    participants=all_participants - banned - failed_bans,
+                    allowed=(allowed_users | channel_admins) - failed_unbans,
+                    banned=banned,
+                    exists=snapshot.exists
+                )
+            else:
+                new_snapshot = ChannelSnapshot(
+                    participants=snapshot.participants - banned,
+                    allowed=snapshot.allowed,
+                    banned=banned,
+                    exists=snapshot.exists
+                )
+            # Keep what those handlers recorded while the sweep ran; no await until installed
+            live = self.channel_snapshots.get(db_id) or snapshot
+            new_snapshot.reapply(sweep_start, live)
+            self.channel_snapshots[db_id] = new_snapshot
+            if (not live.exists or new_snapshot.participants != live.participants
+                    or new_snapshot.allowed != live.allowed or new_snapshot.banned != live.banned):
+                await persist_channel_snapshot(self.bot_name, db_id, new_snapshot)
+            
+            logger.info(f"✅ Channel {channel_entity.title}: {stats['bans']} bans, {stats['unbans']} unbans, {stats['queued']} queued, "
+                       f"{stats['skipped_admins']} admin skips, {stats['errors']} errors")
             
         except Exception as e:
             logger.error(f"✗ Channel enforcement failed for {channel_id}: {e}")
@@ -426,45 +642,297 @@ class EnforcementBotV2:
         
         return stats
     
-    async def user_has_channel_access(self, user_id: int, channel_db_id: int) -> bool:
+    def user_has_channel_access(self, user_id: int, channel_db_id: int) -> bool:
         """Check if user should have access to specific channel"""
+        return user_id in self.access_matrix.get(channel_db_id, frozenset())
+    
+    def query_user_grants(self, user_id: int) -> Set[int]:
+        """Channel db_ids one Telegram user may access (blocking - call through run_db)"""
+        from app import app, db
+        from models import User, Subscription, PlanChannel
+        
+        with app.app_context():
+            rows = db.session.query(PlanChannel.channel_id).join(
+                Subscription, Subscription.plan_id == PlanChannel.plan_id
+            ).join(
+                User, User.id == Subscription.user_id
+            ).filter(
+                User.telegram_chat_id == str(user_id),
+                Subscription.end_date > datetime.utcnow(),
+                Subscription.is_paid == True,
+                or_(User.is_banned == False, User.is_banned.is_(None))
+            ).distinct().all()
+            return {channel_db_id for (channel_db_id,) in rows}
+    
+    async def refresh_user_access(self, user_id: int) -> Set[int]:
+        """Reload one user's channel grants into the access matrix; returns the granted channel db_ids"""
         try:
-            from app import app, db
-            from models import User, Subscription, Plan, PlanChannel
-            from sqlalchemy import and_
+            granted = await run_db(self.query_user_grants, user_id)
+            for channel_db_id in set(self.access_matrix) | granted:
+                user_ids = self.access_matrix.get(channel_db_id, frozenset())
+                if channel_db_id in granted:
+                    self.access_matrix[channel_db_id] = user_ids | {user_id}
+                elif user_id in user_ids:
+                    self.access_matrix[channel_db_id] = user_ids - {user_id}
+            return granted
             
-            with app.app_context():
-                # Find user by telegram ID
-                user = User.query.filter(User.telegram_chat_id == str(user_id)).first()
-                if not user:
-                    return False
+        except Exception as e:
+            logger.error(f"Failed to refresh access for user {user_id}: {e}")
+            return set()
+    
+    def on_entitlement_event(self, event):
+        """Entitlement bus handler; runs on the publishing (web) thread"""
+        self.whitelist.handle_event(event)
+        
+        if isinstance(event, SubscriptionActivated):
+            self.expiry_scheduler.schedule(event.subscription_id, event.end_date)
+        elif isinstance(event, SubscriptionEnded):
+            # Due immediately - the expiry handler revokes the plan's channels
+            self.expiry_scheduler.schedule(event.subscription_id, datetime.utcnow())
+        
+        if self.loop and event.telegram_user_id is not None and isinstance(event, (SubscriptionActivated, UserBanChanged)):
+            try:
+                asyncio.run_coroutine_threadsafe(self.apply_access_change(event.telegram_user_id), self.loop)
+            except RuntimeError:
+                pass  # Loop already closed
+    
+    async def apply_access_change(self, user_id: int):
+        """Re-read one user's grants and lift bans on channels they can access again"""
+        try:
+            granted = await self.refresh_user_access(user_id)
+            if not granted:
+                return
+            
+            for channel_id, channel_info in list(self.managed_channels.items()):
+                db_id = channel_info['db_id']
+                snapshot = self.channel_snapshots.get(db_id)
+                if db_id not in granted or not snapshot or user_id not in snapshot.banned:
+                    continue
                 
-                # Check for active subscriptions that include this channel
-                active_subscriptions = Subscription.query.filter(
-                    and_(
-                        Subscription.user_id == user.id,
-                        Subscription.end_date > datetime.utcnow(),
-                        Subscription.is_paid == True
-                    )
-                ).all()
+                channel_entity = await self.entity_cache.get_entity(self.client, channel_id)
+                self.entity_channels[utils.get_peer_id(channel_entity)] = channel_id
+                result = await self.safe_unban_user(channel_entity, user_id, "Access granted")
+                if result['success']:
+                    # A sweep may have installed a new snapshot while the unban was in flight
+                    snapshot = self.channel_snapshots.setdefault(db_id, snapshot)
+                    snapshot.banned.discard(user_id)
+                    snapshot.allowed.add(user_id)
+                    await persist_channel_snapshot(self.bot_name, db_id, snapshot)
+            
+        except Exception as e:
+            logger.error(f"✗ Failed to apply access change for user {user_id}: {e}")
+    
+    async def on_chat_action(self, event):
+        """Ban unauthorized users within seconds of joining a managed channel"""
+        try:
+            if not (event.user_joined or event.user_added):
+                return
+            
+            channel_id = self.entity_channels.get(event.chat_id)
+            if not channel_id or channel_id not in self.managed_channels:
+                return
+            
+            channel_info = self.managed_channels[channel_id]
+            db_id = channel_info['db_id']
+            channel_entity = None
+            
+            for user_id in event.user_ids or []:
+                if user_id == self.bot_id or user_id in self.whitelisted_users:
+                    continue
                 
-                for subscription in active_subscriptions:
-                    # Check if this subscription's plan includes the channel
-                    plan_has_channel = PlanChannel.query.filter(
-                        and_(
-                            PlanChannel.plan_id == subscription.plan_id,
-                            PlanChannel.channel_id == channel_db_id
-                        )
-                    ).first()
-                    
-                    if plan_has_channel:
-                        return True
+                # The cached matrix may predate a fresh purchase - confirm before banning
+                if not self.user_has_channel_access(user_id, db_id):
+                    await self.refresh_user_access(user_id)
+                if self.user_has_channel_access(user_id, db_id):
+                    continue
                 
-                return False
+                if channel_entity is None:
+                    channel_entity = await event.get_chat()
                 
+                logger.info(f"⚡ Unauthorized join by {user_id} in {channel_info['name']}")
+                result = await self.safe_ban_user(channel_entity, user_id, "Joined without active subscription")
+                if result['success']:
+                    snapshot = self.channel_snapshots.setdefault(db_id, ChannelSnapshot())
+                    snapshot.banned.add(user_id)
+                    await persist_channel_snapshot(self.bot_name, db_id, snapshot)
+            
         except Exception as e:
-            logger.error(f"Error checking access for user {user_id}: {e}")
-            return False
+            logger.error(f"✗ Real-time enforcement failed: {e}")
+    
+    def query_running_subscriptions(self) -> List[tuple]:
+        """(id, end_date) of every paid, still-running subscription (blocking - call through run_db)"""
+        from app import app, db
+        from models import Subscription
+        
+        with app.app_context():
+            return db.session.query(Subscription.id, Subscription.end_date).filter(
+                Subscription.end_date > datetime.utcnow(),
+                Subscription.is_paid == True
+            ).all()
+    
+    async def seed_expiry_scheduler(self):
+        """Arm the expiry scheduler with every paid, still-running subscription"""
+        try:
+            rows = await run_db(self.query_running_subscriptions)
+            self.expiry_scheduler.seed(rows)
+            
+        except Exception as e:
+            logger.error(f"Failed to seed expiry scheduler: {e}")
+    
+    def query_expired_subscription(self, subscription_id: int) -> Optional[Dict]:
+        """End date, Telegram user and channel grants of a subscription the scheduler fired for
+        (blocking - call through run_db); None if it is gone or unpaid
+        """
+        from app import app, db
+        from models import Subscription, PlanChannel
+        
+        with app.app_context():
+            subscription = Subscription.query.get(subscription_id)
+            if not subscription or not subscription.is_paid:
+                return None
+            
+            expiry = {
+                'end_date': subscription.end_date,
+                'user_id': None,
+                'plan_channel_ids': set(),
+                'still_granted': set()
+            }
+            user = subscription.user
+            if subscription.end_date > datetime.utcnow() or not user.telegram_chat_id or not user.telegram_chat_id.isdigit():
+                return expiry
+            expiry['user_id'] = int(user.telegram_chat_id)
+            
+            expiry['plan_channel_ids'] = {
+                channel_db_id for (channel_db_id,) in db.session.query(PlanChannel.channel_id).filter(
+                    PlanChannel.plan_id == subscription.plan_id
+                ).all()
+            }
+            
+            # Channels still covered by another active subscription stay open
+            expiry['still_granted'] = {
+                channel_db_id for (channel_db_id,) in db.session.query(PlanChannel.channel_id).join(
+                    Subscription, Subscription.plan_id == PlanChannel.plan_id
+                ).filter(
+                    Subscription.user_id == user.id,
+                    Subscription.end_date > datetime.utcnow(),
+                    Subscription.is_paid == True
+                ).distinct().all()
+            }
+            return expiry
+    
+    async def expire_subscription(self, subscription_id: int):
+        """Revoke access to the channels an expired subscription's plan covered"""
+        expiry = await run_db(self.query_expired_subscription, subscription_id)
+        if not expiry:
+            return
+        
+        # Extended since it was scheduled - re-arm instead of revoking
+        if expiry['end_date'] > datetime.utcnow():
+            self.expiry_scheduler.schedule(subscription_id, expiry['end_date'])
+            return
+        
+        self.whitelist.remove_subscription(subscription_id)
+        user_id = expiry['user_id']
+        if user_id is None:
+            return
+        
+        revoked = expiry['plan_channel_ids'] - expiry['still_granted']
+        for channel_db_id in revoked:
+            self.access_matrix[channel_db_id] = self.access_matrix.get(channel_db_id, frozenset()) - {user_id}
+        
+        # Other active subscriptions only keep the channels they grant themselves (still_granted)
+        if not revoked or user_id in self.whitelist.admin_ids:
+            return
+        
+        logger.info(f"⏰ Subscription {subscription_id} expired - revoking {len(revoked)} channels for user {user_id}")
+        
+        db_to_channel_id = {info['db_id']: channel_id for channel_id, info in self.managed_channels.items()}
+        for channel_db_id in revoked:
+            channel_id = db_to_channel_id.get(channel_db_id)
+            if not channel_id:
+                continue
+            try:
+                channel_entity = await self.entity_cache.get_entity(self.client, channel_id)
+            except Exception as e:
+                logger.error(f"✗ Cannot access channel {channel_id} for expiry ban: {e}")
+                continue
+            self.entity_channels[utils.get_peer_id(channel_entity)] = channel_id
+            
+            result = await self.safe_ban_user(channel_entity, user_id, "Subscription expired", protect_subscribers=False)
+            snapshot = self.channel_snapshots.setdefault(channel_db_id, ChannelSnapshot())
+            if result['success']:
+                snapshot.banned.add(user_id)
+                snapshot.participants.discard(user_id)
+            snapshot.allowed.discard(user_id)
+            await persist_channel_snapshot(self.bot_name, channel_db_id, snapshot)
+    
+    async def retry_worker(self):
+        """Replay queued actions as soon as their retry-after time passes"""
+        self.retry_wakeup = asyncio.Event()
+        
+        while True:
+            self.retry_wakeup.clear()
+            
+            for action in await run_db(self.action_queue.due):
+                try:
+                    await self.replay_action(action)
+                except Exception as e:
+                    logger.error(f"✗ Retry of {action['action_type']} for user {action['user_id']} failed: {e}")
+            
+            timeout = self.retry_poll_interval
+            next_retry = await run_db(self.action_queue.next_retry_at)
+            if next_retry:
+                timeout = min(max((next_retry - datetime.utcnow()).total_seconds(), 0), self.retry_poll_interval)
+            
+            try:
+                await asyncio.wait_for(self.retry_wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+    
+    async def replay_action(self, action: Dict):
+        """Run one queued ban/unban if it still matches the user's entitlement"""
+        action_type = action['action_type']
+        user_id = action['user_id']
+        channel_db_id = action['channel_db_id']
+        
+        db_to_channel_id = {info['db_id']: channel_id for channel_id, info in self.managed_channels.items()}
+        channel_id = db_to_channel_id.get(channel_db_id)
+        
+        # Entitlement may have changed while the action waited
+        # Queued bans come from expiry and joins; a subscriber of another plan is not allowed here
+        allowed = user_id in self.whitelist.admin_ids or self.user_has_channel_access(user_id, channel_db_id)
+        if not channel_id or (action_type == 'ban') == allowed:
+            await run_db(self.action_queue.complete, action['id'])
+            return
+        
+        try:
+            channel_entity = await self.entity_cache.get_entity(self.client, channel_id)
+        except Exception as e:
+            logger.error(f"✗ Cannot access channel {channel_id} for queued {action_type}: {e}")
+            return
+        self.entity_channels[utils.get_peer_id(channel_entity)] = channel_id
+        
+        if action_type == 'ban':
+            result = await self.safe_ban_user(channel_entity, user_id, action['reason'], protect_subscribers=False)
+        else:
+            result = await self.safe_unban_user(channel_entity, user_id, action['reason'])
+        
+        # Flooded again: safe_*_user already re-queued it with the new wait
+        if result.get('queued'):
+            return
+        await run_db(self.action_queue.complete, action['id'])
+        
+        snapshot = self.channel_snapshots.setdefault(channel_db_id, ChannelSnapshot())
+        if action_type == 'ban':
+            if result['success']:
+                snapshot.banned.add(user_id)
+            snapshot.participants.discard(user_id)  # On failure the next cycle sees them as new again
+        else:
+            if result['success']:
+                snapshot.banned.discard(user_id)
+            else:
+                snapshot.allowed.discard(user_id)
+        await persist_channel_snapshot(self.bot_name, channel_db_id, snapshot)
     
     async def enforcement_cycle(self):
         """Main enforcement cycle - process all managed channels"""
@@ -483,105 +951,166 @@ class EnforcementBotV2:
                 logger.info("ℹ No channels configured for enforcement")
                 return
             
+            # Without a fresh matrix every participant would look unauthorized
+            if not await self.load_access_matrix():
+                logger.warning("⚠ Access matrix unavailable - skipping enforcement cycle")
+                return
+            
             # Track overall statistics
             total_stats = {
                 'channels_processed': 0,
                 'total_bans': 0,
                 'total_unbans': 0,
                 'total_errors': 0,
+                'total_queued': 0,
                 'total_skipped_admins': 0
             }
             
-            # Process each channel
-            for channel_id, channel_info in self.managed_channels.items():
-                try:
-                    stats = await self.enforce_channel_access(channel_id, channel_info)
-                    
-                    total_stats['channels_processed'] += 1
-                    total_stats['total_bans'] += stats['bans']
-                    total_stats['total_unbans'] += stats['unbans']
-                    total_stats['total_errors'] += stats['errors']
-                    total_stats['total_skipped_admins'] += stats['skipped_admins']
+            # Process channels concurrently with a small worker pool
+            pending = asyncio.Queue()
+            for channel_id, channel_info in list(self.managed_channels.items()):
+                pending.put_nowait((channel_id, channel_info))
+            
+            async def channel_worker():
+                while True:
+                    try:
+                        channel_id, channel_info = pending.get_nowait()
+                    except asyncio.QueueEmpty:
+                        return
                     
-                except Exception as e:
-                    logger.error(f"✗ Failed to process channel {channel_id}: {e}")
-                    total_stats['total_errors'] += 1
+                    try:
+                        stats = await self.enforce_channel_access(channel_id, channel_info)
+                        
+                        total_stats['channels_processed'] += 1
+                        total_stats['total_bans'] += stats['bans']
+                        total_stats['total_unbans'] += stats['unbans']
+                        total_stats['total_errors'] += stats['errors']
+                        total_stats['total_queued'] += stats['queued']
+                        total_stats['total_skipped_admins'] += stats['skipped_admins']
+                        
+                    except Exception as e:
+                        logger.error(f"✗ Failed to process channel {channel_id}: {e}")
+                        total_stats['total_errors'] += 1
+            
+            cycle_start = time.monotonic()
+            worker_count = min(self.max_concurrent_channels, pending.qsize())
+            await asyncio.gather(*(channel_worker() for _ in range(worker_count)))
+            total_stats['duration_seconds'] = round(time.monotonic() - cycle_start, 1)
             
             # Log cycle completion
             logger.info(f"🏁 Enforcement cycle completed: {total_stats['channels_processed']} channels, "
                        f"{total_stats['total_bans']} bans, {total_stats['total_unbans']} unbans, "
-                       f"{total_stats['total_skipped_admins']} admin skips, {total_stats['total_errors']} errors")
+                       f"{total_stats['total_queued']} queued, {total_stats['total_skipped_admins']} admin skips, "
+                       f"{total_stats['total_errors']} errors "
+                       f"in {total_stats['duration_seconds']}s")
             
             # Log statistics to database
-            await self.log_enforcement_stats(total_stats)
+            self.log_enforcement_stats(total_stats)
             
         except Exception as e:
             logger.error(f"✗ Enforcement cycle failed: {e}")
     
-    async def log_action(self, action_type: str, user_id: int, channel_id: int, reason: str, success: bool, error_msg: str = None):
-        """Log enforcement actions to database"""
-        try:
-            from app import app, db
-            from models import BotLog
-            
-            with app.app_context():
-                log_entry = BotLog(
-                    action_type=action_type,
-                    user_id=user_id,
-                    channel_id=channel_id,
-                    reason=reason,
-                    success=success,
-                    error_message=error_msg,
-                    timestamp=datetime.utcnow(),
-                    dry_run=self.dry_run
-                )
-                db.session.add(log_entry)
-                db.session.commit()
-                
-        except Exception as e:
-            logger.error(f"Failed to log action: {e}")
+    def log_action(self, action_type: str, user_id: int, channel_entity, reason: str, success: bool,
+                   error_msg: str = None, execution_ms: int = None):
+        """Buffer BotLog/BotAction rows for the write-behind sink"""
+        channel_db_id = self.channel_db_id_for(channel_entity)
+        now = datetime.utcnow()
+        
+        self.log_sink.add('BotLog', {
+            'action_type': action_type,
+            'user_id': user_id,
+            'channel_id': channel_db_id,
+            'reason': reason,
+            'success': success,
+            'error_message': error_msg,
+            'timestamp': now,
+            'dry_run': self.dry_run
+        })
+        
+        if channel_db_id is not None:
+            self.log_sink.add('BotAction', {
+                'action_type': action_type,
+                'channel_id': channel_db_id,
+                'telegram_user_id': user_id,
+                'telegram_channel_id': self.entity_channels.get(utils.get_peer_id(channel_entity)),
+                'reason': reason,
+                'success': success,
+                'error_message': error_msg,
+                'execution_time_ms': execution_ms,
+                'created_at': now
+            })
     
-    async def log_enforcement_stats(self, stats: Dict):
+    @staticmethod
+    def resolve_action_users(mappings: List[Dict]):
+        """Set BotAction user_id to the User.id linked to each row's Telegram ID (runs in the sink's worker)"""
+        from models import User
+        
+        chat_ids = {str(values['telegram_user_id']) for values in mappings if values.get('telegram_user_id')}
+        users = dict(User.query.with_entities(User.telegram_chat_id, User.id).filter(
+            User.telegram_chat_id.in_(chat_ids)
+        ).all()) if chat_ids else {}
+        for values in mappings:
+            values['user_id'] = users.get(str(values.get('telegram_user_id')))
+    
+    def log_enforcement_stats(self, stats: Dict):
         """Log enforcement cycle statistics"""
-        try:
-            from app import app, db
-            from models import BotLog
-            
-            with app.app_context():
-                log_entry = BotLog(
-                    action_type='enforcement_cycle',
-                    reason=f"Processed {stats['channels_processed']} channels: {stats['total_bans']} bans, "
-                           f"{stats['total_unbans']} unbans, {stats['total_errors']} errors",
-                    success=stats['total_errors'] == 0,
-                    error_message=f"{stats['total_errors']} errors occurred" if stats['total_errors'] > 0 else None,
-                    timestamp=datetime.utcnow(),
-                    dry_run=self.dry_run
-                )
-                db.session.add(log_entry)
-                db.session.commit()
-                
-        except Exception as e:
-            logger.error(f"Failed to log stats: {e}")
+        self.log_sink.add('BotLog', {
+            'action_type': 'enforcement_cycle',
+            'reason': f"Processed {stats['channels_processed']} channels: {stats['total_bans']} bans, "
+                      f"{stats['total_unbans']} unbans, {stats['total_errors']} errors",
+            'success': stats['total_errors'] == 0,
+            'error_message': f"{stats['total_errors']} errors occurred" if stats['total_errors'] > 0 else None,
+            'timestamp': datetime.utcnow(),
+            'dry_run': self.dry_run
+        })
+    
+    def uses_reconcile_interval(self) -> bool:
+        """Joins and expiries are both handled as they happen, so the sweep can run rarely
+        
+        Without the expiry scheduler an expired subscriber would keep access until the next
+        sweep, so a dead scheduler task falls back to scan_interval.
+        """
+        expiry_running = self.expiry_task is not None and not self.expiry_task.done()
+        return self.realtime_enabled and expiry_running
     
     async def run(self):
         """Main bot loop"""
         self.running = True
         logger.info("🤖 Enforcement bot V2 started")
         
-        while self.running:
-            try:
-                await self.enforcement_cycle()
-                
-                logger.info(f"⏱ Waiting {self.scan_interval}s until next cycle")
-                await asyncio.sleep(self.scan_interval)
-                
-            except Exception as e:
-                logger.error(f"✗ Error in main loop: {e}")
-                await asyncio.sleep(60)  # Wait before retrying
+        self.expiry_task = asyncio.create_task(self.expiry_scheduler.run())
+        self.retry_task = asyncio.create_task(self.retry_worker())
+        self.log_task = asyncio.create_task(self.log_sink.run())
+        
+        try:
+            while self.running:
+                try:
+                    await self.enforcement_cycle()
+                    
+                    interval = self.reconcile_interval if self.uses_reconcile_interval() else self.scan_interval
+                    logger.info(f"⏱ Waiting {interval}s until next cycle")
+                    await asyncio.sleep(interval)
+                    
+                except Exception as e:
+                    logger.error(f"✗ Error in main loop: {e}")
+                    await asyncio.sleep(60)  # Wait before retrying
+        finally:
+            # Don't lose buffered log rows on shutdown
+            await self.log_sink.flush()
     
     async def stop(self):
         """Stop the bot gracefully"""
         self.running = False
+        if self.expiry_task:
+            self.expiry_task.cancel()
+        if self.retry_task:
+            self.retry_task.cancel()
+        if self.log_task:
+            self.log_task.cancel()
+        await self.log_sink.flush()
+        if self.bus_token:
+            unsubscribe(self.bus_token)
+            self.bus_token = None
         if self.client:
             await self.client.disconnect()
         logger.info("🛑 Enforcement bot stopped")
@@ -622,6 +1151,12 @@ async def get_enforcement_bot_v2():
     """Get the global enforcement bot V2 instance"""
     return _enforcement_bot_v2
 
+def get_enforcement_rate_stats() -> Dict:
+    """Adaptive rate controller state of the running bot (empty if not running)"""
+    if _enforcement_bot_v2 is None:
+        return {}
+    return _enforcement_bot_v2.get_rate_stats()
+
 if __name__ == "__main__":
     # Direct run for testing
     asyncio.run(start_enforcement_bot_v2())
\ No newline at end of file
@@ -0,0 +1,112 @@
+"""
+Per-channel enforcement snapshots
+Lets the enforcement bots act only on what changed since their last cycle
+"""
+
+import json
+import logging
+from typing import Dict, Iterable, Set
+
+logger = logging.getLogger(__name__)
+
+
+class ChannelSnapshot:
+    """Participants, allowed users and bot-issued bans recorded at the end of a cycle"""
+    
+    def __init__(self, participants: Iterable[int] = (), allowed: Iterable[int] = (),
+                 banned: Iterable[int] = (), exists: bool = False, skipped: Iterable[int] = ()):
+        self.participants: Set[int] = set(participants)
+        self.allowed: Set[int] = set(allowed)
+        self.banned: Set[int] = set(banned)
+        self.skipped: Set[int] = set(skipped)  # Ban-list users who are not members or cannot be banned
+        self.exists = exists
+    
+    def copy(self) -> 'ChannelSnapshot':
+        return ChannelSnapshot(self.participants, self.allowed, self.banned, self.exists, self.skipped)
+    
+    def reapply(self, before: 'ChannelSnapshot', after: 'ChannelSnapshot'):
+        """Replay onto this snapshot the changes other tasks made between `before` and `after`"""
+        for name in ('participants', 'allowed', 'banned', 'skipped'):
+            ids, old_ids, new_ids = getattr(self, name), getattr(before, name), getattr(after, name)
+            ids |= new_ids - old_ids
+            ids -= old_ids - new_ids
+        self.exists = self.exists or after.exists
+    
+    def newly_revoked(self, allowed: Set[int]) -> Set[int]:
+        """Users allowed last cycle who lost access since"""
+        return self.allowed - allowed
+    
+    def newly_granted(self, allowed: Set[int]) -> Set[int]:
+        """Users allowed now who were not allowed last cycle"""
+        return allowed - self.allowed
+    
+    def to_row_values(self) -> Dict[str, str]:
+        return {
+            'participant_ids': json.dumps(sorted(self.participants)),
+            'allowed_ids': json.dumps(sorted(self.allowed)),
+            'banned_ids': json.dumps(sorted(self.banned)),
+            'skipped_ids': json.dumps(sorted(self.skipped))
+        }
+
+
+def load_channel_snapshots(bot_name: str) -> Dict[int, ChannelSnapshot]:
+    """Load every stored snapshot for a bot, keyed by channel db_id"""
+    try:
+        from app import app
+        from models import ChannelEnforcementState
+        
+        with app.app_context():
+            rows = ChannelEnforcementState.query.filter_by(bot_name=bot_name).all()
+            snapshots = {}
+            for row in rows:
+                snapshots[row.channel_id] = ChannelSnapshot(
+                    participants=json.loads(row.participant_ids or '[]'),
+                    allowed=json.loads(row.allowed_ids or '[]'),
+                    banned=json.loads(row.banned_ids or '[]'),
+                    exists=True,
+                    skipped=json.loads(row.skipped_ids or '[]')
+                )
+            
+            logger.info(f"Loaded {len(snapshots)} channel snapshots for {bot_name}")
+            return snapshots
+        
+    except Exception as e:
+        logger.error(f"Failed to load channel snapshots for {bot_name}: {e}")
+        return {}
+
+
+def write_channel_snapshot(bot_name: str, channel_db_id: int, values: Dict[str, str]) -> bool:
+    """Upsert serialized snapshot values (blocking)"""
+    try:
+        from app import app, db
+        from models import ChannelEnforcementState
+        
+        with app.app_context():
+            row = ChannelEnforcementState.query.filter_by(
+                bot_name=bot_name,
+                channel_id=channel_db_id
+            ).first()
+            if not row:
+                row = ChannelEnforcementState(bot_name=bot_name, channel_id=channel_db_id)
+                db.session.add(row)
+            
+            for key, value in values.items():
+                setattr(row, key, value)
+            
+            db.session.commit()
+            return True
+        
+    except Exception as e:
+        logger.error(f"Failed to save snapshot for channel {channel_db_id}: {e}")
+        return False
+
+
+async def persist_channel_snapshot(bot_name: str, channel_db_id: int, snapshot: ChannelSnapshot):
+    """Persist a channel snapshot so the next cycle (or restart) can diff against it
+
+    Serialized on the loop, written in the DB pool.
+    """
+    from db_executor import run_db
+    
+    if await run_db(write_channel_snapshot, bot_name, channel_db_id, snapshot.to_row_values()):
+        snapshot.exists = True
@@ -0,0 +1,108 @@
+"""
+Entitlement change bus
+Web routes publish typed subscription/ban events and the enforcement bots running in
+the same process react to them immediately instead of waiting for their next poll
+"""
+
+import logging
+import threading
+from datetime import datetime
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class EntitlementEvent:
+    """Base class for changes to what a user may access"""
+
+    def __init__(self, user_id: int, telegram_chat_id: Optional[str]):
+        self.user_id = user_id  # User.id
+        self.telegram_chat_id = telegram_chat_id
+        self.created_at = datetime.utcnow()
+
+    @property
+    def telegram_user_id(self) -> Optional[int]:
+        chat_id = str(self.telegram_chat_id or '')
+        return int(chat_id) if chat_id.isdigit() else None
+
+    def __repr__(self):
+        return f'<{type(self).__name__} user:{self.user_id}>'
+
+
+class SubscriptionActivated(EntitlementEvent):
+    """A subscription was paid for, granted by an admin or extended"""
+
+    def __init__(self, subscription_id: int, user_id: int, telegram_chat_id: Optional[str],
+                 end_date: datetime, updated_at: Optional[datetime] = None):
+        super().__init__(user_id, telegram_chat_id)
+        self.subscription_id = subscription_id
+        self.end_date = end_date
+        self.updated_at = updated_at
+
+
+class SubscriptionEnded(EntitlementEvent):
+    """A subscription was cancelled before its end date"""
+
+    def __init__(self, subscription_id: int, user_id: int, telegram_chat_id: Optional[str],
+                 updated_at: Optional[datetime] = None):
+        super().__init__(user_id, telegram_chat_id)
+        self.subscription_id = subscription_id
+        self.updated_at = updated_at
+
+
+class UserBanChanged(EntitlementEvent):
+    """An admin banned or unbanned a user"""
+
+    def __init__(self, user_id: int, telegram_chat_id: Optional[str], is_banned: bool, reason: str = None):
+        super().__init__(user_id, telegram_chat_id)
+        self.is_banned = is_banned
+        self.reason = reason
+
+
+class EntitlementBus:
+    """Synchronous fan-out to subscribed handlers
+
+    Handlers run on the publishing (web request) thread, so they must be quick
+    and thread-safe; bots hand anything slow over to their own event loop.
+    """
+
+    def __init__(self):
+        self._handlers: Dict[int, Callable[[EntitlementEvent], None]] = {}
+        self._next_token = 0
+        self._lock = threading.Lock()
+
+    def subscribe(self, handler: Callable[[EntitlementEvent], None]) -> int:
+        with self._lock:
+            self._next_token += 1
+            self._handlers[self._next_token] = handler
+            return self._next_token
+
+    def unsubscribe(self, token: int):
+        with self._lock:
+            self._handlers.pop(token, None)
+
+    def publish(self, event: EntitlementEvent):
+        with self._lock:
+            handlers = list(self._handlers.values())
+
+        for handler in handlers:
+            try:
+                handler(event)
+            except Exception as e:
+                logger.error(f"Entitlement handler failed for {event!r}: {e}")
+
+
+# Process-wide bus shared by the web routes and the enforcement bots
+bus = EntitlementBus()
+
+
+def publish(event: EntitlementEvent):
+    bus.publish(event)
+
+
+def subscribe(handler: Callable[[EntitlementEvent], None]) -> int:
+    return bus.subscribe(handler)
+
+
+def unsubscribe(token: int):
+    bus.unsubscribe(token)
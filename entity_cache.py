@@ -0,0 +1,226 @@
+"""
+Channel entity and bot capability caches for the enforcement bots
+Resolved peers are kept in memory for the bot's lifetime and their id/access_hash
+persisted per session, so get_entity round-trips and dialog scans are not repeated
+"""
+
+import logging
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+from telethon import errors
+from telethon.tl.types import InputPeerChannel
+
+from db_executor import run_db
+
+logger = logging.getLogger(__name__)
+
+
+class ChannelEntityCache:
+    """Maps configured telegram_channel_id values to resolved channel entities"""
+    
+    def __init__(self, bot_name: str, scan_dialogs: bool = False):
+        self.bot_name = bot_name
+        self.scan_dialogs = scan_dialogs  # Bot accounts cannot list dialogs
+        self.entities: Dict[str, object] = {}
+        self.peers: Optional[Dict[str, Tuple[int, int]]] = None  # channel_id -> (entity_id, access_hash)
+        self.dialogs_scanned = False
+    
+    async def get_entity(self, client, channel_id: str):
+        """Resolve a channel, hitting Telegram only when nothing usable is cached"""
+        entity = self.entities.get(channel_id)
+        if entity is not None:
+            return entity
+        
+        peer = (await self.load_peers()).get(channel_id)
+        if peer:
+            try:
+                entity = await client.get_entity(InputPeerChannel(*peer))
+                self.entities[channel_id] = entity
+                return entity
+            except errors.ChannelPrivateError:
+                await self.invalidate(channel_id)
+                raise
+            except Exception as e:
+                logger.warning(f"Cached peer for {channel_id} no longer resolves, looking it up again: {e}")
+        
+        entity = await self.resolve(client, channel_id)
+        await self.store(channel_id, entity)
+        return entity
+    
+    async def resolve(self, client, channel_id: str):
+        """Direct lookup, then InputPeer with a zero hash, then a one-off dialog scan"""
+        try:
+            return await client.get_entity(channel_id)
+        except ValueError as ve:
+            if not self.scan_dialogs or "Cannot find any entity" not in str(ve) or not channel_id.startswith('-100'):
+                raise
+            
+            logger.info(f"Direct entity lookup failed for {channel_id}, trying alternative methods...")
+            try:
+                entity = await client.get_entity(InputPeerChannel(int(channel_id[4:]), 0))
+                logger.info(f"Successfully resolved channel using InputPeer: {entity.title}")
+                return entity
+            except Exception as input_peer_error:
+                logger.warning(f"InputPeer method failed: {input_peer_error}")
+            
+            if not self.dialogs_scanned:
+                await self.scan_all_dialogs(client)
+            entity = self.entities.get(channel_id)
+            if entity is None:
+                raise ve
+            return entity
+    
+    async def scan_all_dialogs(self, client):
+        """Cache every channel the session can see; runs at most once per bot lifetime"""
+        self.dialogs_scanned = True
+        logger.info("Scanning dialogs to resolve channels...")
+        found = 0
+        async for dialog in client.iter_dialogs():
+            entity = dialog.entity
+            if hasattr(entity, 'megagroup') or hasattr(entity, 'broadcast'):
+                await self.store(f"-100{entity.id}", entity)
+                found += 1
+        logger.info(f"Cached {found} channels from dialogs")
+    
+    async def load_peers(self) -> Dict[str, Tuple[int, int]]:
+        if self.peers is None:
+            self.peers = await run_db(self.read_peers)
+        return self.peers
+    
+    def read_peers(self) -> Dict[str, Tuple[int, int]]:
+        peers = {}
+        try:
+            from app import app
+            from models import TelegramEntityCache
+            
+            with app.app_context():
+                for row in TelegramEntityCache.query.filter_by(bot_name=self.bot_name).all():
+                    peers[row.telegram_channel_id] = (row.entity_id, row.access_hash)
+            logger.info(f"Loaded {len(peers)} cached channel peers for {self.bot_name}")
+            
+        except Exception as e:
+            logger.error(f"Failed to load entity cache for {self.bot_name}: {e}")
+        return peers
+    
+    async def store(self, channel_id: str, entity):
+        """Remember a resolved entity and persist its peer if it changed"""
+        self.entities[channel_id] = entity
+        access_hash = getattr(entity, 'access_hash', None)
+        if access_hash is None:
+            return  # Min entities carry no usable hash
+        
+        peer = (entity.id, access_hash)
+        if (await self.load_peers()).get(channel_id) == peer:
+            return
+        self.peers[channel_id] = peer
+        await run_db(self.write_peer, channel_id, entity.id, access_hash, getattr(entity, 'title', None))
+    
+    def write_peer(self, channel_id: str, entity_id: int, access_hash: int, title: Optional[str]):
+        try:
+            from app import app, db
+            from models import TelegramEntityCache
+            
+            with app.app_context():
+                row = TelegramEntityCache.query.filter_by(
+                    bot_name=self.bot_name,
+                    telegram_channel_id=channel_id
+                ).first()
+                if not row:
+                    row = TelegramEntityCache(bot_name=self.bot_name, telegram_channel_id=channel_id)
+                    db.session.add(row)
+                row.entity_id = entity_id
+                row.access_hash = access_hash
+                row.title = title
+                db.session.commit()
+            
+        except Exception as e:
+            logger.error(f"Failed to persist entity for {channel_id}: {e}")
+    
+    async def invalidate(self, channel_id: str):
+        """Forget a channel after Telegram reports it private/inaccessible"""
+        self.entities.pop(channel_id, None)
+        if self.peers is not None:
+            self.peers.pop(channel_id, None)
+        await run_db(self.delete_peer, channel_id)
+    
+    def delete_peer(self, channel_id: str):
+        try:
+            from app import app, db
+            from models import TelegramEntityCache
+            
+            with app.app_context():
+                TelegramEntityCache.query.filter_by(
+                    bot_name=self.bot_name,
+                    telegram_channel_id=channel_id
+                ).delete()
+                db.session.commit()
+            logger.info(f"Invalidated cached entity for {channel_id}")
+            
+        except Exception as e:
+            logger.error(f"Failed to invalidate entity for {channel_id}: {e}")
+
+
+class BotCapabilityCache:
+    """The bot's own identity plus its ban rights per channel, refreshed lazily"""
+    
+    def __init__(self, rights_ttl: float = 3600):
+        self.rights_ttl = rights_ttl
+        self.me = None
+        self.can_ban: Dict[str, Tuple[bool, float]] = {}  # channel_id -> (ban_users, checked_at)
+    
+    async def get_me(self, client):
+        if self.me is None:
+            self.me = await client.get_me()
+        return self.me
+    
+    async def get_bot_id(self, client) -> int:
+        return (await self.get_me(client)).id
+    
+    async def has_ban_rights(self, client, channel_id: str, channel_entity) -> bool:
+        """Whether the bot may ban in this channel; unknown (lookup failed) counts as yes"""
+        cached = self.can_ban.get(channel_id)
+        if cached and time.monotonic() - cached[1] < self.rights_ttl:
+            return cached[0]
+        
+        try:
+            permissions = await client.get_permissions(channel_entity, 'me')
+            can_ban = bool(permissions and permissions.is_admin and permissions.ban_users)
+        except Exception as e:
+            logger.warning(f"Could not check admin rights in {channel_id}: {e}")
+            return True
+        
+        self.can_ban[channel_id] = (can_ban, time.monotonic())
+        return can_ban
+    
+    def invalidate(self, channel_id: str):
+        """Re-check rights next time, e.g. after ChatAdminRequiredError"""
+        self.can_ban.pop(channel_id, None)
+
+
+class ChannelAccessCache:
+    """Last access-check result per channel for the admin channel-access page"""
+    
+    def __init__(self, ttl: float = 600):
+        self.ttl = ttl
+        self.results: Dict[str, Tuple[Dict, float]] = {}  # channel_id -> (result, checked_at wall time)
+        self.refreshing: Set[str] = set()
+    
+    def get(self, channel_id: str) -> Optional[Tuple[Dict, float]]:
+        return self.results.get(channel_id)
+    
+    def put(self, channel_id: str, result: Dict):
+        self.results[channel_id] = (result, time.time())
+    
+    def is_stale(self, channel_id: str) -> bool:
+        cached = self.results.get(channel_id)
+        return cached is None or time.time() - cached[1] >= self.ttl
+    
+    def claim(self, channel_ids) -> List[str]:
+        """Channels not already being refreshed; the caller must release() them"""
+        claimed = [channel_id for channel_id in channel_ids if channel_id not in self.refreshing]
+        self.refreshing.update(claimed)
+        return claimed
+    
+    def release(self, channel_ids):
+        self.refreshing.difference_update(channel_ids)
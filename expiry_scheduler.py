@@ -0,0 +1,105 @@
+"""
+Subscription expiry scheduler
+Wakes the enforcement bot exactly at the next Subscription.end_date instead of waiting for a sweep
+"""
+
+import asyncio
+import heapq
+import logging
+import threading
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class ExpiryScheduler:
+    """Min-heap of (end_date, subscription_id) drained by a single asyncio task"""
+
+    def __init__(self, on_expire: Callable[[int], Awaitable[None]], max_sleep: float = 3600):
+        self.on_expire = on_expire
+        self.max_sleep = max_sleep  # Re-check periodically so clock adjustments cannot strand entries
+
+        self._heap: List[Tuple[datetime, int]] = []
+        self._end_dates: Dict[int, datetime] = {}  # subscription_id -> end_date currently armed
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def seed(self, entries):
+        """Load (subscription_id, end_date) pairs, replacing anything already scheduled"""
+        with self._lock:
+            self._end_dates = {subscription_id: end_date for subscription_id, end_date in entries}
+            self._heap = [(end_date, subscription_id) for subscription_id, end_date in self._end_dates.items()]
+            heapq.heapify(self._heap)
+        logger.info(f"Expiry scheduler seeded with {len(self._heap)} subscriptions")
+        self._notify()
+
+    def schedule(self, subscription_id: int, end_date: datetime):
+        """Arm (or re-arm) a subscription; safe to call from any thread"""
+        with self._lock:
+            self._end_dates[subscription_id] = end_date
+            heapq.heappush(self._heap, (end_date, subscription_id))
+        self._notify()
+
+    def cancel(self, subscription_id: int):
+        """Forget a subscription; its heap entry is dropped lazily"""
+        with self._lock:
+            self._end_dates.pop(subscription_id, None)
+
+    def next_expiry(self) -> Optional[datetime]:
+        with self._lock:
+            self._discard_stale()
+            return self._heap[0][0] if self._heap else None
+
+    def __len__(self):
+        return len(self._end_dates)
+
+    def _discard_stale(self):
+        # Entries superseded by a later schedule() or cancel() stay in the heap until they surface
+        while self._heap and self._end_dates.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+
+    def _pop_due(self, now: datetime) -> List[int]:
+        due = []
+        with self._lock:
+            self._discard_stale()
+            while self._heap and self._heap[0][0] <= now:
+                end_date, subscription_id = heapq.heappop(self._heap)
+                if self._end_dates.get(subscription_id) == end_date:
+                    del self._end_dates[subscription_id]
+                    due.append(subscription_id)
+                self._discard_stale()
+        return due
+
+    def _notify(self):
+        if self._loop and self._wakeup:
+            try:
+                self._loop.call_soon_threadsafe(self._wakeup.set)
+            except RuntimeError:
+                pass  # Loop already closed
+
+    async def run(self):
+        """Sleep until the next end_date, fire on_expire for everything due, repeat"""
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+
+        while True:
+            self._wakeup.clear()
+
+            for subscription_id in self._pop_due(datetime.utcnow()):
+                try:
+                    await self.on_expire(subscription_id)
+                except Exception as e:
+                    logger.error(f"Expiry handler failed for subscription {subscription_id}: {e}")
+
+            next_expiry = self.next_expiry()
+            timeout = self.max_sleep
+            if next_expiry:
+                timeout = min(max((next_expiry - datetime.utcnow()).total_seconds(), 0), self.max_sleep)
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
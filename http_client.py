@@ -0,0 +1,134 @@
+"""
+Shared outbound HTTP client for PayPal, NOWPayments and the Telegram Bot API
+One pooled keep-alive session per upstream, default connect/read timeouts,
+jittered retries and per-upstream metrics
+"""
+
+import logging
+import random
+import threading
+import time
+from typing import Dict
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = (3.05, 15)  # (connect, read) seconds
+RETRY_STATUSES = {502, 503, 504}
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'}
+
+_sessions: Dict[str, requests.Session] = {}
+_sessions_lock = threading.Lock()
+
+
+class UpstreamMetrics:
+    """Request counters and latency for one upstream"""
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0  # Raised exceptions (connect/read failures) after all retries
+        self.retries = 0
+        self.statuses: Dict[str, int] = {}  # '2xx', '4xx', ...
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, elapsed_ms: float, status_code: int = None, retries: int = 0):
+        with self._lock:
+            self.requests += 1
+            self.retries += retries
+            self.total_ms += elapsed_ms
+            self.max_ms = max(self.max_ms, elapsed_ms)
+            if status_code is None:
+                self.errors += 1
+            else:
+                bucket = f'{status_code // 100}xx'
+                self.statuses[bucket] = self.statuses.get(bucket, 0) + 1
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'errors': self.errors,
+                'retries': self.retries,
+                'statuses': dict(self.statuses),
+                'avg_ms': round(self.total_ms / self.requests, 1) if self.requests else 0,
+                'max_ms': round(self.max_ms, 1)
+            }
+
+
+_metrics: Dict[str, UpstreamMetrics] = {}
+
+
+def session_for(upstream: str) -> requests.Session:
+    """The pooled keep-alive session for an upstream ('paypal', 'nowpayments', 'telegram')"""
+    session = _sessions.get(upstream)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(upstream)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=20)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _sessions[upstream] = session
+                _metrics[upstream] = UpstreamMetrics()
+    return session
+
+
+def _backoff(attempt: int) -> float:
+    return min(8.0, 0.5 * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+
+def request(upstream: str, method: str, url: str, retries: int = 2, **kwargs) -> requests.Response:
+    """Send a request on the upstream's pooled session
+
+    Idempotent methods are retried on connection errors, timeouts and 502/503/504;
+    other methods only when the connection could not be opened, so a payment is
+    never submitted twice. Exceptions from the last attempt propagate as usual.
+    """
+    session = session_for(upstream)
+    metrics = _metrics[upstream]
+    kwargs.setdefault('timeout', DEFAULT_TIMEOUT)
+    idempotent = method.upper() in IDEMPOTENT_METHODS
+
+    started = time.monotonic()
+    attempt = 0
+    while True:
+        error = None
+        try:
+            response = session.request(method, url, **kwargs)
+        except requests.exceptions.ConnectTimeout as e:
+            error, retryable = e, True
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            error, retryable = e, idempotent
+        else:
+            retryable = idempotent and response.status_code in RETRY_STATUSES
+
+        if not retryable or attempt >= retries:
+            elapsed_ms = (time.monotonic() - started) * 1000
+            metrics.record(elapsed_ms, None if error else response.status_code, attempt)
+            if error:
+                raise error
+            return response
+
+        attempt += 1
+        # Only the host is logged: Bot API URLs carry the token in their path
+        logger.warning(f"{upstream} {method} {urlsplit(url).netloc} failed ({type(error).__name__ if error else response.status_code}), "
+                       f"retry {attempt}/{retries}")
+        time.sleep(_backoff(attempt))
+
+
+def get(upstream: str, url: str, **kwargs) -> requests.Response:
+    return request(upstream, 'GET', url, **kwargs)
+
+
+def post(upstream: str, url: str, **kwargs) -> requests.Response:
+    return request(upstream, 'POST', url, **kwargs)
+
+
+def get_metrics() -> Dict[str, Dict]:
+    return {upstream: metrics.to_dict() for upstream, metrics in _metrics.items()}
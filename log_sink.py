@@ -0,0 +1,119 @@
+"""
+Write-behind sink for enforcement bot logs
+BotLog/BotAction rows are buffered in memory and bulk-inserted from a worker thread,
+so logging an action never puts a database round trip on the Telegram event loop
+"""
+
+import asyncio
+import logging
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindLogSink:
+    """Buffers rows per model and flushes every `flush_rows` rows or `flush_interval_ms`"""
+
+    def __init__(self, flush_rows: int = 100, flush_interval_ms: int = 1000, max_buffered: int = 10000,
+                 preprocessors: Dict[str, Callable[[List[Dict]], None]] = None):
+        self.flush_rows = flush_rows
+        self.flush_interval_ms = flush_interval_ms
+        self.max_buffered = max_buffered  # Oldest rows are dropped beyond this if the database is down
+        # model_name -> function that completes that model's rows in the worker thread (may query)
+        self.preprocessors = preprocessors or {}
+
+        self._buffer: Deque[Tuple[str, Dict]] = deque()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self.dropped = 0
+
+    def add(self, model_name: str, values: Dict):
+        """Queue a row for `models.<model_name>`; never blocks"""
+        if len(self._buffer) >= self.max_buffered:
+            self._buffer.popleft()
+            self.dropped += 1
+        self._buffer.append((model_name, values))
+
+        if len(self._buffer) >= self.flush_rows and self._wakeup:
+            self._wakeup.set()
+
+    def __len__(self):
+        return len(self._buffer)
+
+    async def run(self):
+        """Flush whenever the buffer fills up or the interval elapses"""
+        self._wakeup = asyncio.Event()
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval_ms / 1000)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self):
+        """Hand everything buffered so far to a worker thread for a bulk insert"""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+
+        async with self._flush_lock:
+            if not self._buffer:
+                return
+            rows = list(self._buffer)
+            self._buffer.clear()
+
+            from db_executor import run_db
+            await run_db(self._write, rows)
+
+    def _write(self, rows):
+        grouped: Dict[str, list] = {}
+        for model_name, values in rows:
+            grouped.setdefault(model_name, []).append(values)
+
+        try:
+            from app import app
+
+            with app.app_context():
+                # Each model is committed on its own, so a bad BotAction cannot take BotLog rows with it
+                for model_name, mappings in grouped.items():
+                    self._write_model(model_name, mappings)
+
+            if self.dropped:
+                logger.warning(f"Log sink dropped {self.dropped} rows while the buffer was full")
+                self.dropped = 0
+
+        except Exception as e:
+            logger.error(f"Failed to flush {len(rows)} log rows: {e}")
+
+    def _write_model(self, model_name: str, mappings: List[Dict]):
+        """Bulk insert one model's rows, falling back to one row at a time if the batch fails"""
+        from app import db
+        import models
+
+        model = getattr(models, model_name)
+        try:
+            preprocess = self.preprocessors.get(model_name)
+            if preprocess:
+                preprocess(mappings)
+            db.session.bulk_insert_mappings(model, mappings)
+            db.session.commit()
+            return
+        except Exception as e:
+            db.session.rollback()
+            if len(mappings) == 1:
+                logger.error(f"Failed to write {model_name} log row: {e}")
+                return
+            logger.warning(f"Bulk insert of {len(mappings)} {model_name} rows failed, retrying row by row: {e}")
+
+        failed = 0
+        for values in mappings:
+            try:
+                db.session.bulk_insert_mappings(model, [values])
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                failed += 1
+                error = e
+        if failed:
+            logger.error(f"Dropped {failed}/{len(mappings)} {model_name} log rows: {error}")
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Migration script to make bot_action.user_id nullable
+Bot actions now store the User.id in user_id and the Telegram ID only in telegram_user_id
+"""
+
+import os
+import sys
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+def migrate_bot_action_user_id():
+    """Drop the NOT NULL constraint from BotAction.user_id"""
+    try:
+        # Get database URL
+        database_url = os.environ.get('DATABASE_URL')
+        if not database_url:
+            print("ERROR: DATABASE_URL not found")
+            return False
+        
+        engine = create_engine(database_url)
+        
+        with engine.connect() as conn:
+            # Check if column is already nullable
+            try:
+                result = conn.execute(text("""
+                    SELECT is_nullable 
+                    FROM information_schema.columns 
+                    WHERE table_name = 'bot_action' 
+                    AND column_name = 'user_id'
+                """))
+                
+                row = result.fetchone()
+                if row and row[0] == 'YES':
+                    print("bot_action.user_id is already nullable")
+                    return True
+                    
+            except Exception as e:
+                print(f"Could not check column nullability: {e}")
+            
+            try:
+                conn.execute(text("""
+                    ALTER TABLE bot_action 
+                    ALTER COLUMN user_id DROP NOT NULL
+                """))
+                conn.commit()
+                print("Successfully made bot_action.user_id nullable")
+                return True
+                
+            except OperationalError as e:
+                print(f"Error altering column: {e}")
+                return False
+                    
+    except Exception as e:
+        print(f"Migration failed: {e}")
+        return False
+
+if __name__ == "__main__":
+    success = migrate_bot_action_user_id()
+    sys.exit(0 if success else 1)
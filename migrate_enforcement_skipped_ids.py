@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Migration script to add skipped_ids column to channel_enforcement_state table
+"""
+
+import os
+import sys
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+def migrate_enforcement_skipped_ids():
+    """Add skipped_ids column to ChannelEnforcementState"""
+    try:
+        # Get database URL
+        database_url = os.environ.get('DATABASE_URL')
+        if not database_url:
+            print("ERROR: DATABASE_URL not found")
+            return False
+        
+        engine = create_engine(database_url)
+        
+        with engine.connect() as conn:
+            # Check if column already exists
+            try:
+                result = conn.execute(text("""
+                    SELECT column_name 
+                    FROM information_schema.columns 
+                    WHERE table_name = 'channel_enforcement_state' 
+                    AND column_name = 'skipped_ids'
+                """))
+                
+                if result.fetchone():
+                    print("skipped_ids column already exists")
+                    return True
+                    
+            except Exception as e:
+                print(f"Could not check column existence: {e}")
+            
+            # Add the column
+            try:
+                conn.execute(text("""
+                    ALTER TABLE channel_enforcement_state 
+                    ADD COLUMN skipped_ids TEXT
+                """))
+                conn.commit()
+                print("Successfully added skipped_ids column to channel_enforcement_state table")
+                return True
+                
+            except OperationalError as e:
+                if "already exists" in str(e).lower() or "duplicate column" in str(e).lower():
+                    print("skipped_ids column already exists")
+                    return True
+                else:
+                    print(f"Error adding column: {e}")
+                    return False
+                    
+    except Exception as e:
+        print(f"Migration failed: {e}")
+        return False
+
+if __name__ == "__main__":
+    success = migrate_enforcement_skipped_ids()
+    sys.exit(0 if success else 1)
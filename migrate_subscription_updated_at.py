@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Migration script to add updated_at column to subscription table
+"""
+
+import os
+import sys
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+def migrate_subscription_updated_at():
+    """Add updated_at column to Subscription table and backfill it from created_at"""
+    try:
+        # Get database URL
+        database_url = os.environ.get('DATABASE_URL')
+        if not database_url:
+            print("ERROR: DATABASE_URL not found")
+            return False
+        
+        engine = create_engine(database_url)
+        
+        with engine.connect() as conn:
+            # Check if column already exists
+            try:
+                result = conn.execute(text("""
+                    SELECT column_name 
+                    FROM information_schema.columns 
+                    WHERE table_name = 'subscription' 
+                    AND column_name = 'updated_at'
+                """))
+                
+                if result.fetchone():
+                    print("updated_at column already exists")
+                    return True
+                    
+            except Exception as e:
+                print(f"Could not check column existence: {e}")
+            
+            # Add the column, backfill it and index it for the whitelist drift check
+            try:
+                conn.execute(text("""
+                    ALTER TABLE subscription 
+                    ADD COLUMN updated_at TIMESTAMP
+                """))
+                conn.execute(text("""
+                    UPDATE subscription 
+                    SET updated_at = COALESCE(created_at, CURRENT_TIMESTAMP)
+                """))
+                conn.execute(text("""
+                    CREATE INDEX IF NOT EXISTS ix_subscription_updated_at 
+                    ON subscription (updated_at)
+                """))
+                conn.commit()
+                print("Successfully added updated_at column to subscription table")
+                return True
+                
+            except OperationalError as e:
+                if "already exists" in str(e).lower() or "duplicate column" in str(e).lower():
+                    print("updated_at column already exists")
+                    return True
+                else:
+                    print(f"Error adding column: {e}")
+                    return False
+                    
+    except Exception as e:
+        print(f"Migration failed: {e}")
+        return False
+
+if __name__ == "__main__":
+    success = migrate_subscription_updated_at()
+    sys.exit(0 if success else 1)
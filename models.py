@@ -2,6 +2,7 @@ from app import db
 from datetime import datetime, timedelta
 from werkzeug.security import generate_password_hash, check_password_hash
 import secrets
+import json
 
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -92,6 +93,7 @@ class Subscription(db.Model):
     end_date = db.Column(db.DateTime, nullable=False)
     is_paid = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     
     # Relationships
     transactions = db.relationship('Transaction', backref='subscription', lazy=True)
@@ -197,7 +199,7 @@ class BotAction(db.Model):
     """Track enforcement bot actions for performance monitoring"""
     id = db.Column(db.Integer, primary_key=True)
     action_type = db.Column(db.String(32), nullable=False)  # 'ban', 'unban', 'kick', 'restrict'
-    user_id = db.Column(db.Integer, nullable=False)
+    user_id = db.Column(db.Integer)  # User.id; None when the Telegram user has no account
     channel_id = db.Column(db.Integer, db.ForeignKey('channel.id'), nullable=False)
     telegram_user_id = db.Column(db.BigInteger)  # Telegram user ID
     telegram_channel_id = db.Column(db.String(64))  # Telegram channel ID
@@ -236,3 +238,155 @@ class BotAction(db.Model):
     
     def __repr__(self):
         return f'<BotAction {self.action_type} user:{self.user_id} channel:{self.channel_id}>'
+
+class ChannelEnforcementState(db.Model):
+    """Last participant/entitlement snapshot applied to a channel by an enforcement bot"""
+    id = db.Column(db.Integer, primary_key=True)
+    channel_id = db.Column(db.Integer, db.ForeignKey('channel.id'), nullable=False)
+    bot_name = db.Column(db.String(32), nullable=False)  # 'enforcement_bot' or 'enforcement_bot_v2'
+    participant_ids = db.Column(db.Text)  # JSON list of Telegram user IDs seen in the channel
+    allowed_ids = db.Column(db.Text)  # JSON list of Telegram user IDs allowed at last cycle
+    banned_ids = db.Column(db.Text)  # JSON list of Telegram user IDs banned by the bot
+    skipped_ids = db.Column(db.Text)  # JSON list of Telegram user IDs the bot could not ban (not members, admins)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (db.UniqueConstraint('channel_id', 'bot_name', name='uq_channel_enforcement_state'),)
+    
+    def __repr__(self):
+        return f'<ChannelEnforcementState {self.bot_name} channel:{self.channel_id}>'
+
+class PendingTelegramAction(db.Model):
+    """Ban/unban that hit a FloodWaitError and waits for its retry-after time"""
+    id = db.Column(db.Integer, primary_key=True)
+    bot_name = db.Column(db.String(32), nullable=False)  # 'enforcement_bot' or 'enforcement_bot_v2'
+    action_type = db.Column(db.String(32), nullable=False)  # 'ban' or 'unban'
+    user_id = db.Column(db.BigInteger, nullable=False)  # Telegram user ID
+    channel_id = db.Column(db.Integer, db.ForeignKey('channel.id'), nullable=False)
+    reason = db.Column(db.String(256))
+    priority = db.Column(db.Integer, default=1)  # Lower runs first
+    attempts = db.Column(db.Integer, default=0)
+    retry_after = db.Column(db.DateTime, nullable=False)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.UniqueConstraint('bot_name', 'user_id', 'channel_id', name='uq_pending_telegram_action'),
+        db.Index('ix_pending_telegram_action_due', 'bot_name', 'retry_after'),
+    )
+    
+    def __repr__(self):
+        return f'<PendingTelegramAction {self.action_type} user:{self.user_id} channel:{self.channel_id}>'
+
+class TelegramEntityCache(db.Model):
+    """Resolved channel peer (id + access_hash) per bot session, so lookups survive restarts"""
+    id = db.Column(db.Integer, primary_key=True)
+    bot_name = db.Column(db.String(32), nullable=False)  # Access hashes are only valid for the session that saw them
+    telegram_channel_id = db.Column(db.String(64), nullable=False)  # Channel.telegram_channel_id as configured
+    entity_id = db.Column(db.BigInteger, nullable=False)
+    access_hash = db.Column(db.BigInteger, nullable=False)
+    title = db.Column(db.String(256))
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (db.UniqueConstraint('bot_name', 'telegram_channel_id', name='uq_telegram_entity_cache'),)
+    
+    def __repr__(self):
+        return f'<TelegramEntityCache {self.bot_name} {self.telegram_channel_id}>'
+
+class BackgroundJob(db.Model):
+    """Long-running admin operation executed by the background job pool"""
+    id = db.Column(db.Integer, primary_key=True)
+    job_type = db.Column(db.String(64), nullable=False)  # 'backup', 'channel_access_check', 'manual_enforcement', 'broadcast'
+    status = db.Column(db.String(16), nullable=False, default='queued')  # queued, running, completed, failed
+    params = db.Column(db.Text)  # JSON keyword arguments for the handler
+    progress_current = db.Column(db.Integer, default=0)
+    progress_total = db.Column(db.Integer)
+    progress_message = db.Column(db.String(256))
+    result = db.Column(db.Text)  # JSON value returned by the handler
+    error_message = db.Column(db.Text)
+    created_by = db.Column(db.String(64))  # Admin who queued the job
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (db.Index('ix_background_job_status', 'status', 'created_at'),)
+    
+    def to_dict(self, include_result=True):
+        data = {
+            'id': self.id,
+            'job_type': self.job_type,
+            'status': self.status,
+            'progress': {
+                'current': self.progress_current or 0,
+                'total': self.progress_total,
+                'message': self.progress_message
+            },
+            'error': self.error_message,
+            'created_by': self.created_by,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+        if include_result:
+            data['result'] = json.loads(self.result) if self.result else None
+        return data
+    
+    def __repr__(self):
+        return f'<BackgroundJob {self.id} {self.job_type} {self.status}>'
+
+class BroadcastDelivery(db.Model):
+    """Outcome of one broadcast message for one recipient"""
+    id = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(db.Integer, db.ForeignKey('background_job.id'))  # Broadcast job; None for ad-hoc broadcasts
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    chat_id = db.Column(db.String(32), nullable=False)
+    status = db.Column(db.String(16), nullable=False)  # 'sent', 'blocked' (bot blocked / chat gone), 'failed'
+    attempts = db.Column(db.Integer, default=0)
+    error_message = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (db.UniqueConstraint('job_id', 'user_id', name='uq_broadcast_delivery'),)
+    
+    def __repr__(self):
+        return f'<BroadcastDelivery job:{self.job_id} user:{self.user_id} {self.status}>'
+
+class PaymentWebhookEvent(db.Model):
+    """Raw NOWPayments IPN callback, stored on receipt and applied by the webhook worker"""
+    id = db.Column(db.Integer, primary_key=True)
+    order_id = db.Column(db.String(128), nullable=False)
+    payment_status = db.Column(db.String(32))  # As reported by NOWPayments: waiting, confirming, finished, ...
+    payload = db.Column(db.Text, nullable=False)  # Request body exactly as received
+    status = db.Column(db.String(16), nullable=False, default='pending')  # pending, processing, done, superseded, failed
+    attempts = db.Column(db.Integer, default=0)
+    error_message = db.Column(db.Text)
+    received_at = db.Column(db.DateTime, default=datetime.utcnow)
+    processed_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_payment_webhook_event_order', 'order_id', 'status'),
+        db.Index('ix_payment_webhook_event_status', 'status', 'received_at'),
+    )
+    
+    def __repr__(self):
+        return f'<PaymentWebhookEvent {self.id} {self.order_id} {self.payment_status} {self.status}>'
+
+class NotificationOutbox(db.Model):
+    """Telegram notification committed together with the change it announces, sent by the outbox worker"""
+    id = db.Column(db.Integer, primary_key=True)
+    event_type = db.Column(db.String(64), nullable=False)  # 'subscription_activated'
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    payload = db.Column(db.Text)  # JSON arguments for the event's handler
+    status = db.Column(db.String(16), nullable=False, default='pending')  # pending, sending, sent, skipped, failed
+    attempts = db.Column(db.Integer, default=0)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow)
+    error_message = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (db.Index('ix_notification_outbox_due', 'status', 'next_attempt_at'),)
+    
+    def __repr__(self):
+        return f'<NotificationOutbox {self.id} {self.event_type} user:{self.user_id} {self.status}>'
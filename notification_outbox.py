@@ -0,0 +1,172 @@
+"""
+Outbound notification queue (transactional outbox)
+Payment code stages a NotificationOutbox row in the same commit as the subscription change;
+a dispatcher thread sends due rows to Telegram with its own retry policy, off the request path
+"""
+
+import json
+import logging
+import os
+import random
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_POLL_INTERVAL = float(os.environ.get('OUTBOX_POLL_INTERVAL', 30))  # Seconds between sweeps when idle
+BATCH_SIZE = 20
+MAX_ATTEMPTS = 6
+
+# event_type -> handler(user, **payload) returning (status, error)
+EVENT_HANDLERS: Dict[str, Callable] = {}
+
+_wakeup = threading.Event()
+_worker: Optional[threading.Thread] = None
+_worker_lock = threading.Lock()
+
+
+def event_handler(event_type: str):
+    """Register a function as the sender for `event_type`"""
+    def register(func):
+        EVENT_HANDLERS[event_type] = func
+        return func
+    return register
+
+
+def stage(event_type: str, user_id: int, **payload):
+    """Add a notification to the caller's session; it is only sent if the caller commits"""
+    from app import db
+    from models import NotificationOutbox
+
+    notification = NotificationOutbox(
+        event_type=event_type,
+        user_id=user_id,
+        payload=json.dumps(payload, default=str)
+    )
+    db.session.add(notification)
+    return notification
+
+
+def wake():
+    """Tell the dispatcher new rows were committed, instead of waiting for its next sweep"""
+    _wakeup.set()
+
+
+@event_handler('subscription_activated')
+def send_subscription_activated(user, plan_id: int) -> Tuple[str, Optional[str]]:
+    from models import BotSettings, Plan
+    from telegram_bot import build_subscription_message, send_telegram_message
+
+    bot_settings = BotSettings.query.first()
+    if not bot_settings or not bot_settings.notifications_enabled:
+        return 'skipped', 'Notifications disabled'
+    if not user.telegram_chat_id:
+        logger.info(f"User {user.telegram_username} needs to start the bot to receive notifications")
+        return 'skipped', 'No chat_id'
+
+    plan = Plan.query.get(plan_id)
+    if not plan:
+        return 'failed', f'Plan {plan_id} not found'
+
+    if send_telegram_message(user.telegram_chat_id, build_subscription_message(user, plan)):
+        return 'sent', None
+    return 'pending', 'Telegram send failed'
+
+
+def deliver(notification_id: int):
+    """Send one claimed notification and record the outcome or the next attempt"""
+    from app import db
+    from models import NotificationOutbox, User
+
+    notification = NotificationOutbox.query.get(notification_id)
+    try:
+        handler = EVENT_HANDLERS.get(notification.event_type)
+        user = User.query.get(notification.user_id)
+        if handler is None:
+            status, error = 'failed', f'No handler registered for {notification.event_type}'
+        elif user is None:
+            status, error = 'failed', 'User not found'
+        else:
+            status, error = handler(user, **json.loads(notification.payload or '{}'))
+    except Exception as e:
+        db.session.rollback()
+        notification = NotificationOutbox.query.get(notification_id)
+        status, error = 'pending', str(e)
+
+    if status == 'pending':
+        if notification.attempts >= MAX_ATTEMPTS:
+            status = 'failed'
+            logger.error(f"Giving up on notification {notification_id} ({notification.event_type}): {error}")
+        else:
+            delay = min(3600, 30 * 2 ** notification.attempts) * random.uniform(0.5, 1.0)
+            notification.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay)
+            logger.warning(f"Notification {notification_id} failed ({error}), "
+                           f"retry {notification.attempts}/{MAX_ATTEMPTS - 1} in {delay:.0f}s")
+
+    notification.status = status
+    notification.error_message = error
+    if status == 'sent':
+        notification.sent_at = datetime.utcnow()
+    db.session.commit()
+
+
+def dispatch_due(stale_after_minutes: int = 10) -> int:
+    """Claim and send up to BATCH_SIZE due notifications; returns how many were claimed"""
+    from app import db
+    from models import NotificationOutbox
+
+    now = datetime.utcnow()
+    # A row left 'sending' by a dead worker may or may not have gone out; resend it
+    NotificationOutbox.query.filter(
+        NotificationOutbox.status == 'sending',
+        NotificationOutbox.updated_at < now - timedelta(minutes=stale_after_minutes)
+    ).update({'status': 'pending'}, synchronize_session=False)
+    db.session.commit()
+
+    due_ids = [notification_id for (notification_id,) in db.session.query(NotificationOutbox.id).filter(
+        NotificationOutbox.status == 'pending',
+        NotificationOutbox.next_attempt_at <= now
+    ).order_by(NotificationOutbox.next_attempt_at).limit(BATCH_SIZE).all()]
+
+    claimed = 0
+    for notification_id in due_ids:
+        # Atomic claim, so several processes running a dispatcher never send a row twice
+        if not NotificationOutbox.query.filter_by(id=notification_id, status='pending').update({
+            'status': 'sending',
+            'attempts': NotificationOutbox.attempts + 1
+        }, synchronize_session=False):
+            db.session.rollback()
+            continue
+        db.session.commit()
+        claimed += 1
+        deliver(notification_id)
+
+    return claimed
+
+
+def run_dispatcher():
+    from app import app
+
+    while True:
+        _wakeup.clear()  # Before the sweep, so a wake() during it triggers another one
+        claimed = 0
+        try:
+            with app.app_context():
+                claimed = dispatch_due()
+        except Exception as e:
+            logger.error(f"Notification dispatcher error: {e}")
+
+        if claimed < BATCH_SIZE:
+            _wakeup.wait(OUTBOX_POLL_INTERVAL)
+
+
+def start_dispatcher():
+    """Start the dispatcher thread once per process; it also drains rows left from before a restart"""
+    global _worker
+    with _worker_lock:
+        if _worker is not None and _worker.is_alive():
+            return
+        _worker = threading.Thread(target=run_dispatcher, name='notification-outbox', daemon=True)
+        _worker.start()
+    logger.info("Notification outbox dispatcher started")
@@ -0,0 +1,97 @@
+"""
+Cached NOWPayments currency catalogue
+The /currencies list is fetched at most once per TTL, refreshed in the background when
+stale, and the last good list keeps serving checkouts while the upstream is down
+"""
+
+import logging
+import threading
+import time
+from typing import Dict, List, Optional, Set
+
+import http_client
+
+logger = logging.getLogger(__name__)
+
+NOWPAYMENTS_API = "https://api.nowpayments.io/v1"
+
+# Generic tickers customers pick -> NOWPayments codes to try, in order of preference
+CURRENCY_VARIANTS: Dict[str, List[str]] = {
+    'usdt': ['usdttrc20', 'usdterc20', 'usdt-trc20', 'usdt-erc20', 'tether'],
+}
+
+
+class CurrencyCatalogue:
+    """Available pay currencies plus a precomputed alias map"""
+
+    def __init__(self, ttl: float = 3600):
+        self.ttl = ttl
+        self.currencies: Optional[Set[str]] = None
+        self.aliases: Dict[str, str] = {}  # e.g. 'usdt' -> 'usdttrc20'
+        self.fetched_at = 0.0
+        self._fetch_lock = threading.Lock()
+        self._refreshing = False
+
+    def get(self, api_key: str) -> Optional[Set[str]]:
+        """Currencies from cache; None only if no list was ever fetched successfully"""
+        if self.currencies is None:
+            with self._fetch_lock:
+                if self.currencies is None:  # Another request may have just fetched it
+                    self.refresh(api_key)
+        elif time.monotonic() - self.fetched_at > self.ttl:
+            self.refresh_in_background(api_key)
+        return self.currencies
+
+    def resolve(self, currency: str, api_key: str) -> Optional[str]:
+        """The code to send as pay_currency, or None if neither it nor a variant is available
+
+        Raises RuntimeError when the catalogue has never been loaded.
+        """
+        currencies = self.get(api_key)
+        if currencies is None:
+            raise RuntimeError('Currency list unavailable')
+        if currency in currencies:
+            return currency
+        return self.aliases.get(currency)
+
+    def refresh(self, api_key: str) -> bool:
+        try:
+            response = http_client.get('nowpayments', f'{NOWPAYMENTS_API}/currencies', headers={'x-api-key': api_key})
+            if response.status_code != 200:
+                logger.warning(f"Could not fetch currencies: {response.status_code} {response.text[:200]}")
+                return False
+
+            currencies = {code.lower() for code in response.json().get('currencies', [])}
+            aliases = {}
+            for alias, variants in CURRENCY_VARIANTS.items():
+                code = next((variant for variant in variants if variant in currencies), None)
+                if code:
+                    aliases[alias] = code
+            self.aliases = aliases
+            self.currencies = currencies
+            self.fetched_at = time.monotonic()
+            logger.info(f"Loaded {len(currencies)} NOWPayments currencies, aliases: {self.aliases}")
+            return True
+
+        except Exception as e:
+            logger.warning(f"Error fetching currencies{' - serving last good list' if self.currencies else ''}: {e}")
+            return False
+
+    def refresh_in_background(self, api_key: str):
+        if self._refreshing:
+            return
+        self._refreshing = True
+
+        def run():
+            try:
+                if not self.refresh(api_key):
+                    # Back off for a while before hitting a failing upstream again
+                    self.fetched_at = time.monotonic() - self.ttl + 60
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=run, daemon=True).start()
+
+
+# Shared by every request thread in the process
+catalogue = CurrencyCatalogue()
@@ -4,41 +4,33 @@ from models import *
 from utils import generate_transaction_id
 from datetime import datetime, timedelta
 import requests
+import http_client
 import json
 import logging
 import os
 
 # PayPal API endpoints
-PAYPAL_SANDBOX_API = "https://api.sandbox.paypal.com"
-PAYPAL_LIVE_API = "https://api.paypal.com"
+from paypal_tokens import PAYPAL_SANDBOX_API, PAYPAL_LIVE_API, token_cache as paypal_token_cache
 
 # NOWPayments API endpoint
-NOWPAYMENTS_API = "https://api.nowpayments.io/v1"
+from nowpayments_currencies import NOWPAYMENTS_API, catalogue as currency_catalogue
 
-def get_paypal_access_token(is_sandbox=True):
-    """Get PayPal access token"""
-    payment_settings = PaymentSettings.query.first()
+def get_paypal_access_token(is_sandbox=True, payment_settings=None):
+    """Get PayPal access token, reusing the cached one until shortly before it expires"""
+    payment_settings = payment_settings or PaymentSettings.query.first()
     if not payment_settings or not payment_settings.paypal_client_id:
         return None
     
-    base_url = PAYPAL_SANDBOX_API if is_sandbox else PAYPAL_LIVE_API
-    auth_url = f"{base_url}/v1/oauth2/token"
-    
-    auth = (payment_settings.paypal_client_id, payment_settings.paypal_client_secret)
-    headers = {
-        'Accept': 'application/json',
-        'Accept-Language': 'en_US',
-    }
-    data = 'grant_type=client_credentials'
-    
-    try:
-        response = requests.post(auth_url, headers=headers, data=data, auth=auth)
-        if response.status_code == 200:
-            return response.json().get('access_token')
-    except Exception as e:
-        logging.error(f"PayPal auth error: {e}")
-    
-    return None
+    return paypal_token_cache.get(
+        payment_settings.paypal_client_id,
+        payment_settings.paypal_client_secret,
+        is_sandbox
+    )
+
+def refresh_paypal_access_token(payment_settings):
+    """Replace a token PayPal rejected with 401 and return the new one"""
+    paypal_token_cache.invalidate(payment_settings.paypal_client_id, payment_settings.paypal_sandbox)
+    return get_paypal_access_token(payment_settings.paypal_sandbox, payment_settings)
 
 def cleanup_expired_sessions():
     """Clean up expired payment sessions"""
@@ -83,7 +75,7 @@ def create_paypal_order():
         if not payment_settings:
             return jsonify({'error': 'Payment not configured'}), 500
         
-        access_token = get_paypal_access_token(payment_settings.paypal_sandbox)
+        access_token = get_paypal_access_token(payment_settings.paypal_sandbox, payment_settings)
         if not access_token:
             return jsonify({'error': 'PayPal authentication failed'}), 500
         
@@ -111,7 +103,14 @@ def create_paypal_order():
             }
         }
         
-        response = requests.post(order_url, headers=headers, json=order_data)
+        response = http_client.post('paypal', order_url, headers=headers, json=order_data)
+        if response.status_code == 401:
+            # Token revoked or credentials changed since it was cached
+            access_token = refresh_paypal_access_token(payment_settings)
+            if not access_token:
+                return jsonify({'error': 'PayPal authentication failed'}), 500
+            headers['Authorization'] = f'Bearer {access_token}'
+            response = http_client.post('paypal', order_url, headers=headers, json=order_data)
         
         if response.status_code == 201:
             order = response.json()
@@ -190,7 +189,7 @@ def paypal_success():
             flash('Payment configuration error. Please contact support.', 'error')
             return redirect(url_for('index'))
             
-        access_token = get_paypal_access_token(payment_settings.paypal_sandbox)
+        access_token = get_paypal_access_token(payment_settings.paypal_sandbox, payment_settings)
         
         if not access_token:
             logging.error("PayPal success: Failed to get access token")
@@ -205,7 +204,15 @@ def paypal_success():
             'Authorization': f'Bearer {access_token}',
         }
         
-        response = requests.post(capture_url, headers=headers)
+        response = http_client.post('paypal', capture_url, headers=headers)
+        if response.status_code == 401:
+            access_token = refresh_paypal_access_token(payment_settings)
+            if not access_token:
+                logging.error("PayPal success: Failed to refresh access token")
+                flash('Payment verification failed. Please contact support.', 'error')
+                return redirect(url_for('index'))
+            headers['Authorization'] = f'Bearer {access_token}'
+            response = http_client.post('paypal', capture_url, headers=headers)
         
         if response.status_code == 201:
             capture_data = response.json()
@@ -271,50 +278,31 @@ def create_crypto_payment():
         if not payment_settings or not payment_settings.nowpayments_api_key:
             return jsonify({'error': 'Crypto payments not configured'}), 500
         
-        # First, check if the currency is available
+        # NOWPayments request headers
         headers = {
             'x-api-key': payment_settings.nowpayments_api_key,
             'Content-Type': 'application/json'
         }
         
-        # Get available currencies
+        # Validate against the cached currency catalogue (no upstream call unless it was never loaded)
         try:
-            currencies_response = requests.get(f'{NOWPAYMENTS_API}/currencies', headers=headers)
-            if currencies_response.status_code == 200:
-                available_currencies = currencies_response.json().get('currencies', [])
-                logging.info(f"Available currencies: {available_currencies[:10]}...")  # Log first 10 for debugging
-                
-                # Check if requested currency is available
-                if currency not in available_currencies:
-                    # Try common variations for USDT
-                    if currency == 'usdt':
-                        # Check for USDT variations
-                        usdt_variants = ['usdttrc20', 'usdterc20', 'usdt-trc20', 'usdt-erc20', 'tether']
-                        found_variant = None
-                        for variant in usdt_variants:
-                            if variant in available_currencies:
-                                found_variant = variant
-                                break
-                        
-                        if found_variant:
-                            currency = found_variant
-                            logging.info(f"Using USDT variant: {found_variant}")
-                        else:
-                            # Return error instead of fallback for USDT
-                            return jsonify({'error': 'USDT is not available. Please select a different cryptocurrency.'}), 400
-                    else:
-                        # For other currencies, fall back to BTC
-                        logging.warning(f"Currency {currency} not available, falling back to BTC")
-                        currency = 'btc'
-                else:
-                    logging.info(f"Using requested currency: {currency}")
-            else:
-                logging.warning(f"Could not fetch currencies: {currencies_response.text}")
-                # Don't fallback, return error
-                return jsonify({'error': 'Unable to verify cryptocurrency availability. Please try again.'}), 500
+            resolved_currency = currency_catalogue.resolve(currency, payment_settings.nowpayments_api_key)
         except Exception as e:
             logging.warning(f"Error checking currencies: {e}")
-            return jsonify({'error': 'Cryptocurrency service temporarily unavailable. Please try again.'}), 500
+            return jsonify({'error': 'Unable to verify cryptocurrency availability. Please try again.'}), 500
+        
+        if resolved_currency == currency:
+            logging.info(f"Using requested currency: {currency}")
+        elif resolved_currency:
+            logging.info(f"Using {currency.upper()} variant: {resolved_currency}")
+            currency = resolved_currency
+        elif currency == 'usdt':
+            # Return error instead of fallback for USDT
+            return jsonify({'error': 'USDT is not available. Please select a different cryptocurrency.'}), 400
+        else:
+            # For other currencies, fall back to BTC
+            logging.warning(f"Currency {currency} not available, falling back to BTC")
+            currency = 'btc'
         
         # Create payment with improved error handling
         payment_data = {
@@ -327,8 +315,8 @@ def create_crypto_payment():
         
         logging.info(f"Creating NOWPayments order: {payment_data}")
         
-        response = requests.post(f'{NOWPAYMENTS_API}/payment', 
-                               headers=headers, json=payment_data, timeout=30)
+        response = http_client.post('nowpayments', f'{NOWPAYMENTS_API}/payment',
+                                   headers=headers, json=payment_data, timeout=(3.05, 30))
         
         logging.info(f"NOWPayments response: {response.status_code} - {response.text}")
         
@@ -423,43 +411,16 @@ def create_crypto_payment():
 
 @app.route('/webhook/nowpayments', methods=['POST'])
 def nowpayments_webhook():
-    """Handle NOWPayments webhook"""
+    """Handle NOWPayments webhook: store the callback and acknowledge it, the webhook worker applies it"""
     try:
-        data = request.get_json()
+        data = request.get_json(silent=True)
         if not data:
             return 'No data', 400
+        if not data.get('order_id'):
+            return 'Missing order_id', 400
         
-        # Find transaction
-        order_id = data.get('order_id')
-        transaction = Transaction.query.filter_by(transaction_id=order_id).first()
-        
-        if not transaction:
-            logging.error(f"Transaction not found for order_id: {order_id}")
-            return 'Transaction not found', 404
-        
-        # Update transaction status
-        payment_status = data.get('payment_status')
-        transaction.status = payment_status
-        transaction.webhook_data = json.dumps(data)
-        
-        if payment_status == 'finished':
-            # Payment completed, activate subscription
-            webhook_data = json.loads(transaction.webhook_data)
-            
-            success = process_successful_payment(
-                webhook_data['telegram_username'],
-                webhook_data['plan_id'],
-                webhook_data.get('promo_code'),
-                transaction.amount,
-                'crypto',
-                order_id,
-                data
-            )
-            
-            if success:
-                transaction.completed_at = datetime.utcnow()
-        
-        db.session.commit()
+        from webhook_queue import enqueue_event
+        enqueue_event(request.get_data(as_text=True), data)
         return 'OK', 200
         
     except Exception as e:
@@ -496,10 +457,10 @@ def test_nowpayments():
         }
         
         # Test API status
-        status_response = requests.get(f'{NOWPAYMENTS_API}/status', headers=headers, timeout=10)
+        status_response = http_client.get('nowpayments', f'{NOWPAYMENTS_API}/status', headers=headers, timeout=10)
         
         # Test available currencies
-        currencies_response = requests.get(f'{NOWPAYMENTS_API}/currencies', headers=headers, timeout=10)
+        currencies_response = http_client.get('nowpayments', f'{NOWPAYMENTS_API}/currencies', headers=headers, timeout=10)
         
         return jsonify({
             'api_status': {
@@ -561,19 +522,21 @@ def process_successful_payment(telegram_username, plan_id, promo_code, amount, p
             db.session.add(subscription)
             db.session.flush()
         
-        # Create transaction record
-        transaction = Transaction(
-            user_id=user.id,
-            subscription_id=subscription.id if not existing_sub else existing_sub.id,
-            transaction_id=transaction_id,
-            payment_method=payment_method,
-            amount=amount,
-            currency='USD',
-            status='completed',
-            webhook_data=json.dumps(webhook_data),
-            completed_at=datetime.utcnow()
-        )
-        db.session.add(transaction)
+        # Complete the pending crypto transaction, or create the record for PayPal
+        transaction = Transaction.query.filter_by(transaction_id=transaction_id).first()
+        if not transaction:
+            transaction = Transaction(
+                user_id=user.id,
+                transaction_id=transaction_id,
+                payment_method=payment_method,
+                amount=amount,
+                currency='USD'
+            )
+            db.session.add(transaction)
+        transaction.subscription_id = subscription.id if not existing_sub else existing_sub.id
+        transaction.status = 'completed'
+        transaction.webhook_data = json.dumps(webhook_data)
+        transaction.completed_at = datetime.utcnow()
         
         # Update promo code usage if used
         if promo_code:
@@ -581,11 +544,17 @@ def process_successful_payment(telegram_username, plan_id, promo_code, amount, p
             if promo and promo.is_valid():
                 promo.used_count += 1
         
+        # Committed with the subscription, sent by the outbox dispatcher after the commit
+        import notification_outbox
+        notification_outbox.stage('subscription_activated', user.id, plan_id=plan.id)
+        
         db.session.commit()
+        notification_outbox.wake()
         
-        # Send Telegram notification
-        from telegram_bot import send_subscription_notification
-        send_subscription_notification(user, plan)
+        # Push the new end date to the running enforcement bots
+        from entitlement_bus import publish, SubscriptionActivated
+        active_sub = existing_sub or subscription
+        publish(SubscriptionActivated(active_sub.id, user.id, user.telegram_chat_id, active_sub.end_date, active_sub.updated_at))
         
         return True
         
@@ -0,0 +1,123 @@
+"""
+Process-wide PayPal OAuth token cache
+Tokens are reused until shortly before `expires_in` runs out, refreshed in the background
+ahead of expiry, and concurrent requests for a missing token share a single fetch
+"""
+
+import logging
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+import http_client
+
+logger = logging.getLogger(__name__)
+
+PAYPAL_SANDBOX_API = "https://api.sandbox.paypal.com"
+PAYPAL_LIVE_API = "https://api.paypal.com"
+
+
+class _Flight:
+    """One in-progress token fetch that other callers can wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.token: Optional[str] = None
+
+
+class PayPalTokenCache:
+    """Access tokens keyed by (client_id, sandbox)"""
+
+    def __init__(self, refresh_margin: float = 300, expiry_margin: float = 60, fetch_timeout: float = 15):
+        self.refresh_margin = refresh_margin  # Refresh in the background this long before expiry
+        self.expiry_margin = expiry_margin  # Never hand out a token this close to expiry
+        self.fetch_timeout = fetch_timeout
+        self.tokens: Dict[Tuple[str, bool], Tuple[str, float]] = {}  # key -> (token, expires_at monotonic)
+        self._flights: Dict[Tuple[str, bool], _Flight] = {}
+        self._lock = threading.Lock()
+
+    def get(self, client_id: str, client_secret: str, sandbox: bool) -> Optional[str]:
+        key = (client_id, bool(sandbox))
+        cached = self.tokens.get(key)
+        now = time.monotonic()
+
+        if cached and now < cached[1] - self.expiry_margin:
+            if now >= cached[1] - self.refresh_margin:
+                self.refresh_in_background(client_id, client_secret, sandbox)
+            return cached[0]
+
+        return self.fetch(client_id, client_secret, sandbox)
+
+    def fetch(self, client_id: str, client_secret: str, sandbox: bool) -> Optional[str]:
+        """Fetch a new token, or wait for the fetch another thread already started"""
+        key = (client_id, bool(sandbox))
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            flight.done.wait(self.fetch_timeout)
+            return flight.token
+
+        return self._run_flight(key, flight, client_id, client_secret, sandbox)
+
+    def _run_flight(self, key, flight: _Flight, client_id: str, client_secret: str, sandbox: bool) -> Optional[str]:
+        try:
+            flight.token = self._request_token(client_id, client_secret, sandbox)
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+        return flight.token
+
+    def refresh_in_background(self, client_id: str, client_secret: str, sandbox: bool):
+        key = (client_id, bool(sandbox))
+        # Register the flight before starting the thread, so concurrent callers start only one
+        with self._lock:
+            if key in self._flights:
+                return
+            flight = self._flights[key] = _Flight()
+        threading.Thread(
+            target=self._run_flight, args=(key, flight, client_id, client_secret, sandbox), daemon=True
+        ).start()
+
+    def invalidate(self, client_id: str, sandbox: bool):
+        """Drop a token PayPal rejected (401) or whose credentials changed"""
+        self.tokens.pop((client_id, bool(sandbox)), None)
+
+    def clear(self):
+        """Forget every token, e.g. after the PayPal settings were edited"""
+        self.tokens.clear()
+
+    def _request_token(self, client_id: str, client_secret: str, sandbox: bool) -> Optional[str]:
+        base_url = PAYPAL_SANDBOX_API if sandbox else PAYPAL_LIVE_API
+        try:
+            response = http_client.post(
+                'paypal',
+                f"{base_url}/v1/oauth2/token",
+                headers={'Accept': 'application/json', 'Accept-Language': 'en_US'},
+                data='grant_type=client_credentials',
+                auth=(client_id, client_secret),
+                timeout=self.fetch_timeout
+            )
+            if response.status_code != 200:
+                logger.error(f"PayPal auth failed: {response.status_code} {response.text[:200]}")
+                return None
+
+            payload = response.json()
+            token = payload.get('access_token')
+            if token:
+                expires_in = float(payload.get('expires_in', 3600))
+                self.tokens[(client_id, bool(sandbox))] = (token, time.monotonic() + expires_in)
+                logger.info(f"Fetched PayPal access token ({'sandbox' if sandbox else 'live'}), expires in {expires_in:.0f}s")
+            return token
+
+        except Exception as e:
+            logger.error(f"PayPal auth error: {e}")
+            return None
+
+
+# Shared by every request thread in the process
+token_cache = PayPalTokenCache()
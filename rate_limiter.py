@@ -0,0 +1,204 @@
+"""
+Token-bucket rate limiting for Telegram API calls
+One limiter is shared by every concurrent channel worker of an enforcement bot;
+the AIMD controller adapts its rates to the FloodWait errors Telegram returns
+"""
+
+import asyncio
+import threading
+import time
+from typing import Dict, Hashable, Optional
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, bursts up to `capacity`"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self._lock: Optional[asyncio.Lock] = None
+        self._thread_lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def try_acquire(self, tokens: float = 1) -> float:
+        """Take tokens if available; otherwise return the seconds until they will be"""
+        self._refill()
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return 0.0
+        return (tokens - self.tokens) / self.rate
+
+    async def acquire(self, tokens: float = 1):
+        """Wait until tokens are available, then take them"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        # Serialize waiters so tokens are handed out in arrival order
+        async with self._lock:
+            while True:
+                wait = self.try_acquire(tokens)
+                if wait <= 0:
+                    return
+                await asyncio.sleep(wait)
+
+    def acquire_blocking(self, tokens: float = 1):
+        """Thread-safe acquire for worker threads outside an event loop"""
+        with self._thread_lock:
+            while True:
+                wait = self.try_acquire(tokens)
+                if wait <= 0:
+                    return
+                time.sleep(wait)
+
+
+class TelegramRateLimiter:
+    """Global bucket for the whole account plus one bucket per chat"""
+
+    def __init__(self, global_rate: float = 1.0, global_burst: float = 5,
+                 per_chat_rate: float = 20 / 60, per_chat_burst: float = 3):
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self.per_chat_rate = per_chat_rate
+        self.per_chat_burst = per_chat_burst
+        self.chat_buckets: Dict[Hashable, TokenBucket] = {}
+
+    def bucket_for(self, chat_id: Hashable) -> TokenBucket:
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = TokenBucket(self.per_chat_rate, self.per_chat_burst)
+            self.chat_buckets[chat_id] = bucket
+        return bucket
+
+    async def acquire(self, chat_id: Hashable = None):
+        """Wait for both the chat's budget and the global budget"""
+        if chat_id is not None:
+            await self.bucket_for(chat_id).acquire()
+        await self.global_bucket.acquire()
+
+
+class AIMDState:
+    """Adaptive rate and back-off history for one (method, chat) key"""
+
+    def __init__(self, rate: float, burst: float):
+        self.bucket = TokenBucket(rate, burst)
+        self.success_streak = 0
+        self.successes = 0
+        self.backoffs = 0
+        self.blocked_until = 0.0  # time.monotonic() until which the server asked us to wait
+        self.last_backoff_at: Optional[float] = None
+        self.last_recovery_seconds: Optional[float] = None  # back-off to first success afterwards
+        self.total_wait_seconds = 0.0
+
+    @property
+    def rate(self) -> float:
+        return self.bucket.rate
+
+
+class AIMDRateController:
+    """Additive-increase / multiplicative-decrease rate control keyed by (method, chat)
+
+    Every call waits on both its method-wide key (method, None) and its
+    per-chat key (method, chat_id). Each success nudges the rate of both
+    keys up by `increase_step` once `increase_every` calls have gone
+    through without a flood error; a FloodWaitError multiplies their
+    rates by `decrease_factor` and blocks the method for the server-given
+    wait.
+    """
+
+    def __init__(self, initial_rate: float = 20 / 60, min_rate: float = 5 / 60, max_rate: float = 2.0,
+                 increase_step: float = 2 / 60, decrease_factor: float = 0.5, increase_every: int = 10,
+                 burst: float = 3, per_chat_initial_rate: Optional[float] = None,
+                 per_chat_max_rate: Optional[float] = None):
+        self.initial_rate = initial_rate
+        self.per_chat_initial_rate = per_chat_initial_rate or initial_rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.per_chat_max_rate = per_chat_max_rate or max_rate
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.increase_every = increase_every
+        self.burst = burst
+        self.states: Dict[tuple, AIMDState] = {}
+
+    def state_for(self, method: str, chat_id: Hashable = None) -> AIMDState:
+        key = (method, chat_id)
+        state = self.states.get(key)
+        if state is None:
+            rate = self.initial_rate if chat_id is None else min(self.per_chat_initial_rate, self.per_chat_max_rate)
+            state = AIMDState(rate, self.burst)
+            self.states[key] = state
+        return state
+
+    def _keys(self, method: str, chat_id: Hashable):
+        if chat_id is None:
+            return [self.state_for(method)]
+        return [self.state_for(method, chat_id), self.state_for(method)]
+
+    async def acquire(self, method: str, chat_id: Hashable = None):
+        """Wait out any server-imposed block, then take a token from each key"""
+        start = time.monotonic()
+        states = self._keys(method, chat_id)
+        for state in states:
+            await self._wait_unblocked(states)
+            await state.bucket.acquire()
+        # A FloodWait recorded while this call queued on a bucket still applies to it
+        await self._wait_unblocked(states)
+        waited = time.monotonic() - start
+        for state in states:
+            state.total_wait_seconds += waited
+
+    @staticmethod
+    async def _wait_unblocked(states):
+        while True:
+            blocked_for = max(state.blocked_until for state in states) - time.monotonic()
+            if blocked_for <= 0:
+                return
+            await asyncio.sleep(blocked_for)
+
+    def record_success(self, method: str, chat_id: Hashable = None):
+        """Additive increase after a streak of calls without flood errors"""
+        for state in self._keys(method, chat_id):
+            state.successes += 1
+            state.success_streak += 1
+            if state.last_backoff_at is not None and state.last_recovery_seconds is None:
+                state.last_recovery_seconds = round(time.monotonic() - state.last_backoff_at, 1)
+            if state.success_streak >= self.increase_every:
+                state.success_streak = 0
+                ceiling = self.max_rate if state is self.state_for(method) else self.per_chat_max_rate
+                state.bucket.rate = min(ceiling, state.bucket.rate + self.increase_step)
+
+    def record_flood(self, method: str, chat_id: Hashable = None, wait_seconds: float = 0):
+        """Multiplicative decrease and block the keys for the server-given wait"""
+        now = time.monotonic()
+        for state in self._keys(method, chat_id):
+            state.backoffs += 1
+            state.success_streak = 0
+            state.last_backoff_at = now
+            state.last_recovery_seconds = None
+            state.bucket.rate = max(self.min_rate, state.bucket.rate * self.decrease_factor)
+            state.bucket.tokens = 0
+            state.blocked_until = max(state.blocked_until, now + wait_seconds)
+
+    def stats(self) -> Dict[str, Dict]:
+        """Current rates, back-offs and recovery times for every key"""
+        now = time.monotonic()
+        result = {}
+        for (method, chat_id), state in self.states.items():
+            ceiling = self.max_rate if chat_id is None else self.per_chat_max_rate
+            result[f"{method}:{chat_id if chat_id is not None else '*'}"] = {
+                'method': method,
+                'chat_id': chat_id,
+                'rate_per_minute': round(state.rate * 60, 1),
+                'max_rate_per_minute': round(ceiling * 60, 1),
+                'headroom_per_minute': round((ceiling - state.rate) * 60, 1),
+                'successes': state.successes,
+                'backoffs': state.backoffs,
+                'blocked_for_seconds': round(max(0.0, state.blocked_until - now), 1),
+                'last_recovery_seconds': state.last_recovery_seconds,
+                'total_wait_seconds': round(state.total_wait_seconds, 1)
+            }
+        return result
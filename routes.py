@@ -315,6 +315,11 @@ def cancel_subscription(subscription_id):
     subscription.end_date = datetime.utcnow()
     db.session.commit()
     
+    # Revoke channel access right away instead of at the bots' next poll
+    from entitlement_bus import publish, SubscriptionEnded
+    user = User.query.get(subscription.user_id)
+    publish(SubscriptionEnded(subscription.id, user.id, user.telegram_chat_id, subscription.updated_at))
+    
     flash('Subscription cancelled successfully', 'success')
     return redirect(url_for('dashboard'))
 
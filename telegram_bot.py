@@ -2,6 +2,7 @@ import os
 import logging
 from models import BotSettings, User, Plan
 import requests
+import http_client
 import json
 
 def get_bot_token():
@@ -35,7 +36,7 @@ def send_telegram_message(chat_id, message, parse_mode='HTML'):
             'disable_web_page_preview': True
         }
         
-        response = requests.post(url, data=data, timeout=10)
+        response = http_client.post('telegram', url, data=data, timeout=10)
         
         if response.status_code == 200:
             logging.info(f"Message sent successfully to {chat_id}")
@@ -96,26 +97,14 @@ Visit our website to purchase a subscription and get access to premium signals!
         logging.error(f"Status command error: {e}")
         send_telegram_message(chat_id, "❌ Error retrieving status. Please try again later.")
 
-def send_subscription_notification(user, plan):
-    """Send subscription activation notification"""
-    try:
-        bot_settings = BotSettings.query.first()
-        if not bot_settings or not bot_settings.notifications_enabled:
-            return False
-        
-        chat_id = get_user_chat_id(user.telegram_username)
-        if not chat_id:
-            logging.warning(f"Cannot send notification to {user.telegram_username}: no chat_id")
-            # For new users, provide instructions on how to link their account
-            logging.info(f"User {user.telegram_username} needs to start the bot to receive notifications")
-            return False
-        
-        # Get channels for the plan
-        channels = plan.get_channels()
-        channel_links = "\n".join([f"• <a href='{ch.telegram_link}'>{ch.name}</a>" 
-                                  for ch in channels])
-        
-        message = f"""
+def build_subscription_message(user, plan):
+    """Activation message listing the plan's channels"""
+    # Get channels for the plan
+    channels = plan.get_channels()
+    channel_links = "\n".join([f"• <a href='{ch.telegram_link}'>{ch.name}</a>" 
+                              for ch in channels])
+    
+    message = f"""
 🎉 <b>Subscription Activated!</b>
 
 Hello @{user.telegram_username}!
@@ -128,19 +117,34 @@ Your <b>{plan.name}</b> subscription is now active!
 <b>📺 Your Channels:</b>
 {channel_links}
 """
-        
-        if plan.folder_link:
-            message += f"\n<b>📁 Folder Link:</b> <a href='{plan.folder_link}'>Access Folder</a>"
-        
-        message += f"""
+    
+    if plan.folder_link:
+        message += f"\n<b>📁 Folder Link:</b> <a href='{plan.folder_link}'>Access Folder</a>"
+    
+    message += f"""
 
 <b>🔗 Dashboard:</b> Access your dashboard at our website
 <b>⏰ Expiry:</b> Check your dashboard for exact expiry date
 
 Thank you for subscribing! 🚀
 """
+    return message
+
+def send_subscription_notification(user, plan):
+    """Send subscription activation notification"""
+    try:
+        bot_settings = BotSettings.query.first()
+        if not bot_settings or not bot_settings.notifications_enabled:
+            return False
         
-        return send_telegram_message(chat_id, message)
+        chat_id = get_user_chat_id(user.telegram_username)
+        if not chat_id:
+            logging.warning(f"Cannot send notification to {user.telegram_username}: no chat_id")
+            # For new users, provide instructions on how to link their account
+            logging.info(f"User {user.telegram_username} needs to start the bot to receive notifications")
+            return False
+        
+        return send_telegram_message(chat_id, build_subscription_message(user, plan))
         
     except Exception as e:
         logging.error(f"Subscription notification error: {e}")
@@ -195,25 +199,16 @@ Don't miss out on your signals! 📈
         logging.error(f"Expiry warning error: {e}")
         return False
 
-def broadcast_message(message, user_filter=None):
-    """Broadcast message to users"""
+def broadcast_message(message, user_filter=None, progress=None):
+    """Broadcast message to users; returns how many received it"""
     try:
-        from app import db
+        from broadcast import deliver_broadcast
         
-        query = User.query.filter_by(is_active=True, is_banned=False)
         if user_filter:
             # Apply additional filters if needed
             pass
         
-        users = query.all()
-        success_count = 0
-        
-        for user in users:
-            if send_telegram_message(get_user_chat_id(user.telegram_username), message):
-                success_count += 1
-        
-        logging.info(f"Broadcast sent to {success_count}/{len(users)} users")
-        return success_count
+        return deliver_broadcast(message, progress=progress)['sent']
         
     except Exception as e:
         logging.error(f"Broadcast error: {e}")
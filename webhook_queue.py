@@ -0,0 +1,231 @@
+"""
+Asynchronous NOWPayments webhook ingestion
+The webhook route only stores the raw IPN payload and acknowledges it; a small worker pool
+applies the events per order_id, collapsing a burst of status updates into a single write
+"""
+
+import json
+import logging
+import os
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_WORKERS = int(os.environ.get('WEBHOOK_WORKERS', 4))
+MAX_ATTEMPTS = 5
+# Once a transaction reaches one of these, later IPN callbacks do not change it
+FINAL_STATUSES = {'finished', 'completed', 'failed', 'refunded', 'expired'}
+
+_executor = ThreadPoolExecutor(max_workers=WEBHOOK_WORKERS, thread_name_prefix='payment-webhook')
+
+# order_id -> "run again" flag for orders with a pass queued or running in this process
+_active: Dict[str, bool] = {}
+_active_lock = threading.Lock()
+
+
+def enqueue_event(payload: str, data: Dict) -> int:
+    """Store a callback and schedule its order; returns the event ID"""
+    from app import db
+    from models import PaymentWebhookEvent
+
+    event = PaymentWebhookEvent(
+        order_id=str(data['order_id']),
+        payment_status=data.get('payment_status'),
+        payload=payload
+    )
+    db.session.add(event)
+    db.session.commit()
+
+    schedule(event.order_id)
+    return event.id
+
+
+def schedule(order_id: str, delay: float = 0):
+    """Queue a pass over the order's pending events
+
+    At most one pass per order runs at a time; events arriving meanwhile are picked
+    up by a single follow-up pass instead of one pass each.
+    """
+    if delay:
+        timer = threading.Timer(delay, schedule, args=(order_id,))
+        timer.daemon = True
+        timer.start()
+        return
+
+    with _active_lock:
+        if order_id in _active:
+            _active[order_id] = True
+            return
+        _active[order_id] = False
+    _executor.submit(process_order, order_id)
+
+
+def process_order(order_id: str):
+    while True:
+        try:
+            from app import app
+
+            with app.app_context():
+                retry_in = apply_pending(order_id)
+            if retry_in is not None:
+                schedule(order_id, retry_in)
+        except Exception as e:
+            logger.error(f"Webhook worker failed for order {order_id}: {e}")
+
+        with _active_lock:
+            if not _active.get(order_id):
+                _active.pop(order_id, None)
+                return
+            _active[order_id] = False
+
+
+def apply_pending(order_id: str) -> Optional[float]:
+    """Apply the decisive pending event for an order and supersede the rest
+
+    Returns a delay in seconds when the event should be retried later.
+    """
+    from app import db
+    from models import PaymentWebhookEvent
+
+    events = PaymentWebhookEvent.query.filter_by(order_id=order_id, status='pending').order_by(
+        PaymentWebhookEvent.id
+    ).all()
+    if not events:
+        return None
+
+    # The latest final status wins over any number of intermediate ones
+    final = [event for event in events if event.payment_status in FINAL_STATUSES]
+    chosen = (final or events)[-1]
+
+    # Atomic claim, so an event resumed by several processes is only applied once
+    claimed = PaymentWebhookEvent.query.filter_by(id=chosen.id, status='pending').update({
+        'status': 'processing',
+        'attempts': PaymentWebhookEvent.attempts + 1
+    }, synchronize_session=False)
+    if not claimed:
+        db.session.rollback()
+        return None
+    superseded = [event.id for event in events if event.id != chosen.id]
+    if superseded:
+        PaymentWebhookEvent.query.filter(
+            PaymentWebhookEvent.id.in_(superseded),
+            PaymentWebhookEvent.status == 'pending'
+        ).update({'status': 'superseded', 'processed_at': datetime.utcnow()}, synchronize_session=False)
+    db.session.commit()
+
+    event_id = chosen.id
+    try:
+        status, message = apply_event(order_id, chosen.payment_status, json.loads(chosen.payload))
+    except Exception as e:
+        db.session.rollback()
+        status, message = 'pending', str(e)
+
+    event = PaymentWebhookEvent.query.get(event_id)
+    retry_in = None
+    if status == 'pending':
+        if event.attempts >= MAX_ATTEMPTS:
+            status = 'failed'
+            logger.error(f"Giving up on webhook event {event_id} for order {order_id}: {message}")
+        else:
+            retry_in = min(300, 5 * 2 ** event.attempts) * random.uniform(0.5, 1.0)
+            logger.warning(f"Webhook event {event_id} for order {order_id} failed ({message}), "
+                           f"retry {event.attempts}/{MAX_ATTEMPTS - 1} in {retry_in:.0f}s")
+
+    event.status = status
+    event.error_message = message
+    if status != 'pending':
+        event.processed_at = datetime.utcnow()
+    db.session.commit()
+
+    if superseded:
+        logger.info(f"Order {order_id}: applied {chosen.payment_status}, coalesced {len(superseded)} earlier updates")
+    return retry_in
+
+
+def apply_event(order_id: str, payment_status: str, data: Dict) -> Tuple[str, Optional[str]]:
+    """Update the transaction for one IPN callback; returns (event status, message)
+
+    'pending' and raised errors are retried; 'failed' is for errors a retry cannot fix.
+    """
+    from app import db
+    from models import Plan, Transaction
+    from payment_handler import process_successful_payment
+
+    transaction = Transaction.query.filter_by(transaction_id=order_id).first()
+    if not transaction:
+        # The callback may have overtaken the checkout's commit
+        logger.warning(f"Transaction not found for order_id: {order_id}")
+        return 'pending', 'Transaction not found'
+
+    if transaction.completed_at or transaction.status in FINAL_STATUSES:
+        return 'done', f'Transaction already {transaction.status}'
+
+    # Keep the checkout details stored by create_crypto_payment next to the latest callback
+    order = json.loads(transaction.webhook_data or '{}')
+    order.pop('ipn', None)
+    webhook_data = dict(order, ipn=data)
+
+    if payment_status != 'finished':
+        transaction.status = payment_status
+        transaction.webhook_data = json.dumps(webhook_data)
+        db.session.commit()
+        return 'done', None
+
+    if not order.get('telegram_username') or not order.get('plan_id'):
+        return 'failed', 'Checkout details missing from transaction'
+    if not Plan.query.get(order['plan_id']):
+        return 'failed', f"Plan {order['plan_id']} not found"
+
+    # Only one worker, in any process, gets to activate the subscription for this order
+    claimed = Transaction.query.filter(
+        Transaction.id == transaction.id,
+        Transaction.completed_at.is_(None)
+    ).update({'completed_at': datetime.utcnow()}, synchronize_session=False)
+    if not claimed:
+        db.session.rollback()
+        return 'done', 'Transaction already completed'
+
+    # Commits the claim together with the subscription, or rolls both back
+    if not process_successful_payment(
+        order['telegram_username'],
+        order['plan_id'],
+        order.get('promo_code'),
+        transaction.amount,
+        'crypto',
+        order_id,
+        webhook_data
+    ):
+        raise RuntimeError('Subscription activation failed')
+    return 'done', None
+
+
+def resume_events(stale_after_minutes: int = 10):
+    """On startup: release events whose worker died and schedule every order with pending events"""
+    try:
+        from app import app, db
+        from models import PaymentWebhookEvent
+
+        with app.app_context():
+            cutoff = datetime.utcnow() - timedelta(minutes=stale_after_minutes)
+            released = PaymentWebhookEvent.query.filter(
+                PaymentWebhookEvent.status == 'processing',
+                PaymentWebhookEvent.updated_at < cutoff
+            ).update({'status': 'pending'}, synchronize_session=False)
+            db.session.commit()
+
+            order_ids = [order_id for (order_id,) in db.session.query(PaymentWebhookEvent.order_id).filter(
+                PaymentWebhookEvent.status == 'pending'
+            ).distinct().all()]
+
+        for order_id in order_ids:
+            schedule(order_id)
+
+        if released or order_ids:
+            logger.info(f"Resumed webhook events for {len(order_ids)} orders, released {released} interrupted events")
+
+    except Exception as e:
+        logger.error(f"Failed to resume webhook events: {e}")
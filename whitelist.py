@@ -0,0 +1,197 @@
+"""
+Incrementally maintained enforcement whitelist
+Active subscribers and admins are tracked in memory and updated from entitlement bus
+events; the database is only re-read in full when a cheap checksum shows drift
+"""
+
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def _telegram_id(chat_id) -> Optional[int]:
+    if chat_id is None:
+        return None
+    chat_id = str(chat_id)
+    return int(chat_id) if chat_id.isdigit() else None
+
+
+class IncrementalWhitelist:
+    """Refcounted set of Telegram IDs: admins plus users with at least one active paid subscription"""
+
+    def __init__(self, full_rebuild_interval: float = 3600):
+        self.full_rebuild_interval = full_rebuild_interval  # Catches changes no event or checksum sees
+
+        # Bots hold a reference to this set, so it is only ever mutated in place
+        self.members: Set[int] = set()
+        self.admin_ids: Set[int] = set()
+        self.subscriptions: Dict[int, Tuple[Optional[int], datetime]] = {}  # subscription_id -> (telegram_id, end_date)
+        self.refcounts: Dict[int, int] = {}  # telegram_id -> active subscriptions
+
+        self.admin_count = 0
+        self.max_updated_at: Optional[datetime] = None
+        self.rebuilt_at = 0.0
+        self._lock = threading.Lock()
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self.members
+
+    def __len__(self):
+        return len(self.members)
+
+    def _add_member(self, telegram_id: Optional[int]):
+        if telegram_id is None:
+            return
+        self.refcounts[telegram_id] = self.refcounts.get(telegram_id, 0) + 1
+        self.members.add(telegram_id)
+
+    def _drop_member(self, telegram_id: Optional[int]):
+        if telegram_id is None:
+            return
+        count = self.refcounts.get(telegram_id, 0) - 1
+        if count > 0:
+            self.refcounts[telegram_id] = count
+            return
+        self.refcounts.pop(telegram_id, None)
+        if telegram_id not in self.admin_ids:
+            self.members.discard(telegram_id)
+
+    def _seen_update(self, updated_at: Optional[datetime]):
+        if updated_at and (self.max_updated_at is None or updated_at > self.max_updated_at):
+            self.max_updated_at = updated_at
+
+    def add_subscription(self, subscription_id: int, telegram_chat_id, end_date: datetime,
+                         updated_at: Optional[datetime] = None):
+        """A subscription became active or was extended"""
+        with self._lock:
+            previous = self.subscriptions.get(subscription_id)
+            if previous:
+                self._drop_member(previous[0])
+            if end_date > datetime.utcnow():
+                telegram_id = _telegram_id(telegram_chat_id)
+                self.subscriptions[subscription_id] = (telegram_id, end_date)
+                self._add_member(telegram_id)
+            else:
+                self.subscriptions.pop(subscription_id, None)
+            self._seen_update(updated_at)
+
+    def remove_subscription(self, subscription_id: int, updated_at: Optional[datetime] = None):
+        """A subscription was cancelled or expired"""
+        with self._lock:
+            previous = self.subscriptions.pop(subscription_id, None)
+            if previous:
+                self._drop_member(previous[0])
+            self._seen_update(updated_at)
+
+    def handle_event(self, event):
+        """Entitlement bus handler: apply a subscription change in O(1)"""
+        from entitlement_bus import SubscriptionActivated, SubscriptionEnded
+
+        if isinstance(event, SubscriptionActivated):
+            self.add_subscription(event.subscription_id, event.telegram_chat_id, event.end_date, event.updated_at)
+        elif isinstance(event, SubscriptionEnded):
+            self.remove_subscription(event.subscription_id, event.updated_at)
+
+    def prune_expired(self):
+        """Drop subscriptions whose end_date has passed without an event"""
+        now = datetime.utcnow()
+        with self._lock:
+            expired = [subscription_id for subscription_id, (_, end_date) in self.subscriptions.items() if end_date <= now]
+            for subscription_id in expired:
+                self._drop_member(self.subscriptions.pop(subscription_id)[0])
+
+    def checksum(self) -> Optional[Tuple[int, Optional[datetime], int]]:
+        """(active subscriptions, newest Subscription.updated_at, active admins) as seen by the database"""
+        try:
+            from app import app, db
+            from models import Admin, Subscription
+
+            with app.app_context():
+                active_count, max_updated_at = db.session.query(
+                    db.func.count(Subscription.id), db.func.max(Subscription.updated_at)
+                ).filter(
+                    Subscription.end_date > datetime.utcnow(),
+                    Subscription.is_paid == True
+                ).one()
+                admin_count = Admin.query.filter(Admin.is_active == True).count()
+            return active_count, max_updated_at, admin_count
+
+        except Exception as e:
+            logger.error(f"Whitelist checksum failed: {e}")
+            return None
+
+    def has_drifted(self) -> bool:
+        checksum = self.checksum()
+        if checksum is None:
+            return True
+        active_count, max_updated_at, admin_count = checksum
+        if active_count != len(self.subscriptions) or admin_count != self.admin_count:
+            return True
+        # A newer write than any event we applied means something changed behind our back
+        return max_updated_at is not None and (self.max_updated_at is None or max_updated_at > self.max_updated_at)
+
+    def rebuild(self) -> bool:
+        """Reload admins and active subscriptions with two queries"""
+        try:
+            from app import app, db
+            from models import Admin, User, Subscription
+
+            with app.app_context():
+                admin_chat_ids = [
+                    chat_id for (chat_id,) in db.session.query(Admin.telegram_chat_id).filter(Admin.is_active == True).all()
+                ] if hasattr(Admin, 'telegram_chat_id') else []
+                admin_count = Admin.query.filter(Admin.is_active == True).count()
+
+                rows = db.session.query(
+                    Subscription.id, User.telegram_chat_id, Subscription.end_date, Subscription.updated_at
+                ).join(
+                    User, User.id == Subscription.user_id
+                ).filter(
+                    Subscription.end_date > datetime.utcnow(),
+                    Subscription.is_paid == True
+                ).all()
+
+            with self._lock:
+                self.admin_ids = {telegram_id for telegram_id in map(_telegram_id, admin_chat_ids) if telegram_id is not None}
+                self.admin_count = admin_count
+                self.subscriptions = {}
+                self.refcounts = {}
+                self.max_updated_at = None
+
+                members = set(self.admin_ids)
+                for subscription_id, chat_id, end_date, updated_at in rows:
+                    telegram_id = _telegram_id(chat_id)
+                    self.subscriptions[subscription_id] = (telegram_id, end_date)
+                    if telegram_id is not None:
+                        self.refcounts[telegram_id] = self.refcounts.get(telegram_id, 0) + 1
+                        members.add(telegram_id)
+                    self._seen_update(updated_at)
+
+                # Bots read this set from the event loop without the lock: add before
+                # discarding so a user who stays whitelisted is never missing from it
+                self.members |= members
+                self.members -= self.members - members
+                self.rebuilt_at = time.monotonic()
+
+            logger.info(f"Rebuilt whitelist: {len(self.members)} users ({len(self.admin_ids)} admins, {len(rows)} active subscriptions)")
+            return True
+
+        except Exception as e:
+            logger.error(f"Failed to rebuild whitelist: {e}")
+            return False
+
+    def refresh(self) -> bool:
+        """Apply local expiries, then rebuild only if the checksum shows drift"""
+        if not self.rebuilt_at or time.monotonic() - self.rebuilt_at > self.full_rebuild_interval:
+            return self.rebuild()
+
+        self.prune_expired()
+        if self.has_drifted():
+            logger.info("Whitelist drift detected - rebuilding")
+            return self.rebuild()
+        return True
+